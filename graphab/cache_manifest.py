@@ -0,0 +1,129 @@
+#!/usr/bin/python
+
+# Cache manifests to skip rebuilding outputs whose inputs have not changed.
+# A manifest (JSON) is written next to each output: {output}.cache.json
+# It records the signature of the inputs (size and mtime of rasters, hash of tables, processing settings)
+# and the size and mtime of the output itself, so replaced or deleted outputs are rebuilt as well.
+# ResultsManifest records the artifacts already processed by a downstream stage (ingestion of global indices,
+# postprocessing), so that each run only processes new or changed files.
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+MANIFEST_SUFFIX = ".cache.json"
+
+def file_signature(path: str) -> dict:
+    """Returns a cheap signature of a (large) file: path, size and modification time."""
+    stat = os.stat(path)
+    return {'path': os.path.normpath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hash of a file (used for small inputs, like reclassification tables)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def manifest_path(output_path: str) -> str:
+    """Returns the path to the manifest of an output file."""
+    return output_path + MANIFEST_SUFFIX
+
+def read_manifest(output_path: str) -> dict | None:
+    """Reads the manifest of an output file (None if it does not exist or cannot be parsed)."""
+    try:
+        with open(manifest_path(output_path), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_up_to_date(output_paths: list, signature: dict) -> bool:
+    """Checks if all outputs exist and were built from inputs with the same signature.
+
+    Parameters:
+    output_paths (list): paths to the output files built together.
+    signature (dict): signature of the inputs and settings (must be JSON-serialisable).
+
+    Returns:
+    bool: True if the outputs can be reused, False if they have to be rebuilt.
+    """
+    for output_path in output_paths:
+        manifest = read_manifest(output_path)
+        if manifest is None or not os.path.exists(output_path):
+            return False
+        if manifest.get('inputs') != signature:
+            return False
+        output = file_signature(output_path)
+        if manifest.get('output', {}).get('size') != output['size'] or manifest.get('output', {}).get('mtime_ns') != output['mtime_ns']:
+            return False
+    return True
+
+def write_manifest(output_paths: list, signature: dict) -> None:
+    """Writes a manifest next to each output, recording the signature of the inputs they were built from."""
+    for output_path in output_paths:
+        manifest = {'inputs': signature, 'output': file_signature(output_path)}
+        tmp_path = manifest_path(output_path) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path(output_path))
+
+class ResultsManifest:
+    """Manifest (JSON) of the artifacts processed by one stage: path -> size, mtime and time of processing.
+    An artifact is pending if it is new or its size or mtime changed since it was processed, so each run
+    of the stage only processes new or changed files."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters:
+        path (str): path to the manifest (created on save if it does not exist).
+        """
+        self.path = path
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_processed(self, artifact_path: str) -> bool:
+        """Checks if the artifact was processed and has not changed since."""
+        entry = self.entries.get(os.path.normpath(artifact_path))
+        if entry is None or not os.path.exists(artifact_path):
+            return False
+        signature = file_signature(artifact_path)
+        return entry.get('size') == signature['size'] and entry.get('mtime_ns') == signature['mtime_ns']
+
+    def pending(self, artifact_paths: list) -> list:
+        """Returns artifacts that are new or changed since they were processed."""
+        return [artifact_path for artifact_path in artifact_paths if not self.is_processed(artifact_path)]
+
+    def mark_processed(self, artifact_path: str) -> None:
+        """Records the current size and mtime of the artifact (call after processing, as processing may rewrite it)."""
+        signature = file_signature(artifact_path)
+        self.entries[signature['path']] = {
+            'size': signature['size'],
+            'mtime_ns': signature['mtime_ns'],
+            'processed_at': datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def removed(self, prefix: str = None) -> list:
+        """Returns recorded artifacts (optionally, under a directory) that no longer exist."""
+        prefix = os.path.normpath(prefix) + os.sep if prefix else ''
+        return [path for path in self.entries if path.startswith(prefix) and not os.path.exists(path)]
+
+    def forget(self, artifact_path: str) -> None:
+        """Removes the artifact from the manifest (it will be processed again if it appears)."""
+        self.entries.pop(os.path.normpath(artifact_path), None)
+
+    def reset(self) -> None:
+        """Forgets all artifacts (all of them will be processed again)."""
+        self.entries = {}
+
+    def save(self) -> None:
+        """Writes the manifest (atomically)."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+# Shared Cloud Optimised GeoTIFF (COG) writer profile.
+# Graphab and preprocessing run in separate Docker images, so this module is mirrored in
+# graphab/cog_profile.py and preprocessing/src/cog_profile.py: keep both copies identical.
+#
+# Profiles by data type:
+# - categorical (LULC, patches, protected areas): overviews resampled by MODE, no predictor
+# - continuous (impedance, affinity, connectivity indices): overviews resampled by AVERAGE, predictor
+#   (horizontal differencing for integers, floating point predictor for floats, chosen by the COG driver)
+
+from osgeo import gdal
+
+COG_BLOCKSIZE = 512 # tile size of COGs (pixels)
+COG_PROFILES = {
+    'categorical': {'COMPRESS': 'ZSTD', 'LEVEL': '9', 'PREDICTOR': 'NO', 'OVERVIEW_RESAMPLING': 'MODE'},
+    'continuous': {'COMPRESS': 'ZSTD', 'LEVEL': '9', 'PREDICTOR': 'YES', 'OVERVIEW_RESAMPLING': 'AVERAGE'},
+}
+
+def cog_creation_options(kind: str = 'continuous', blocksize: int = COG_BLOCKSIZE, overview_count: int = None, num_threads: str = 'ALL_CPUS', **overrides) -> list[str]:
+    """
+    Returns creation options of the COG driver for the data type.
+
+    Parameters:
+    kind (str): 'categorical' or 'continuous'.
+    blocksize (int): tile size (pixels).
+    overview_count (int): number of overview levels (if None, overviews are generated until the smallest fits in one tile).
+    num_threads (str): number of threads to compress tiles and compute overviews ('ALL_CPUS' by default).
+    overrides (dict): other creation options (for example, COMPRESS='LZW'), overriding the profile.
+
+    Returns:
+    options (list): creation options for COG driver.
+    """
+    if kind not in COG_PROFILES:
+        raise ValueError(f"Unknown COG profile: {kind}. Available profiles: {', '.join(COG_PROFILES)}")
+
+    options = dict(COG_PROFILES[kind])
+    options.update({
+        'BLOCKSIZE': str(blocksize),
+        'OVERVIEWS': 'IGNORE_EXISTING',
+        'NUM_THREADS': str(num_threads),
+        'BIGTIFF': 'IF_SAFER',
+    })
+    if overview_count is not None:
+        options['OVERVIEW_COUNT'] = str(overview_count)
+    options.update({key.upper(): str(value) for key, value in overrides.items()})
+    return [f"{key}={value}" for key, value in options.items()]
+
+def write_cog(src_ds, output_path: str, kind: str = 'continuous', **kwargs) -> str:
+    """
+    Writes a dataset (opened with GDAL, or a path) as a COG with the shared profile, in-process.
+
+    Parameters:
+    src_ds (gdal.Dataset|str): source dataset or path to it (metadata, nodata and georeferencing are copied).
+    output_path (str): path to the output COG.
+    kind (str): 'categorical' or 'continuous'.
+    kwargs (dict): arguments of cog_creation_options.
+
+    Returns:
+    output_path (str): path to the output COG.
+    """
+    if isinstance(src_ds, str):
+        src_path = src_ds
+        src_ds = gdal.Open(src_path, gdal.GA_ReadOnly)
+        if src_ds is None:
+            raise FileNotFoundError(f"Could not open {src_path}")
+
+    cog_ds = gdal.GetDriverByName('COG').CreateCopy(output_path, src_ds, options=cog_creation_options(kind, **kwargs))
+    if cog_ds is None:
+        raise RuntimeError(f"Could not create COG {output_path}")
+    cog_ds = None
+    return output_path
@@ -1,182 +1,107 @@
 import os
 import sys
 import pandas as pd
-from collections import defaultdict
 import yaml
 import argparse
 import matplotlib.pyplot as plt
 
-print("Logs are redirected to /logs")
-sys.stdout = open('logs/glob_indices.log', 'w') #to log
-sys.stderr = sys.stdout
+from glob_store import GlobStore, parse_metric_name, read_metric_file
+from cache_manifest import ResultsManifest
+
+GLOB_STORE = os.path.join("data", "stats_glob.sqlite") # store of global indices of all case studies
+CSV_COLUMNS = ['Graph', 'd', 'p', 'beta', 'metric_val', 'year', 'metric', 'case_study', 'habitat'] # columns of stats_glob.csv
+
+def setup_logging():
+    print("Logs are redirected to /logs")
+    sys.stdout = open('logs/glob_indices.log', 'w') #to log
+    sys.stderr = sys.stdout
+
+def find_glob_files(output_dir: str) -> list[str]:
+    """Returns paths to all global-metric files (glob_{metric}_{year}.txt) in the output directory of a habitat."""
+    return sorted(
+        os.path.join(root, file)
+        for root, _, files in os.walk(output_dir)
+        for file in files
+        if file.startswith("glob_") and file.endswith(".txt") and parse_metric_name(file) is not None
+    )
+
+def read_glob_files(file_paths: list, case_study: str, habitat: str) -> pd.DataFrame:
+    """Reads global-metric files into one table, without rewriting them (metric and year are taken from the filename).
 
-def append_year2txt(output_dir: str) -> None:
-    """Appends the year column to each .txt file in the directory.
-    
     Parameters:
-    output_dir (str): path to the output directory.
+    file_paths (list): paths to glob_{metric}_{year}.txt files.
+    case_study (str): name of the case study.
+    habitat (str): name of the habitat.
 
     Returns:
-    None
+    df (pd.DataFrame): one row per graph, metric and year (columns of the store).
     """
+    frames = [read_metric_file(file_path, case_study=case_study, habitat=habitat) for file_path in file_paths]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
 
-    for root, _, files in os.walk(output_dir):
-        for file in files:
-            if file.startswith("glob") and file.endswith(".txt"):
-                file_path = os.path.join(root, file)
-                parts = file.replace(".txt", "").split("_")
-                if len(parts) < 3:
-                    continue  # skip if the filename doesn't match the pattern
-                year = parts[2]
-                
-                df = pd.read_csv(file_path, sep='\t')
-                df['year'] = year  # append the year column
-                df.to_csv(file_path, sep='\t', index=False)
-                print(f"Processed {file_path} with year {year}")
-
-def concat_files(output_dir: str, case_study: str) -> str:
-    """Concatenates all .txt files, merging based on common keys.
+def ingest_habitat(store: GlobStore, manifest: ResultsManifest, output_dir: str, case_study: str, habitat: str) -> int:
+    """Ingests new or changed global-metric .txt files of a habitat into the store (read-only, source files are not modified)
+    and deletes rows of files that no longer exist.
 
     Parameters:
-    output_dir (str): path to the output directory.
+    store (GlobStore): store of global indices.
+    manifest (ResultsManifest): manifest of files already ingested (updated).
+    output_dir (str): path to the output directory of the habitat.
     case_study (str): The name of the case study.
+    habitat (str): name of the habitat.
 
     Returns:
-    out_csv (str): a path to the generated glob_csv file.
+    count (int): number of files ingested or deleted.
     """
-    unique_fifth_columns = set()
-    data_frames = []
-    
-    for root, _, files in os.walk(output_dir):
-        for file in files:
-            if file.startswith("glob") and file.endswith(".txt"):
-                print(f"Processing: {file}...")
-                file_path = os.path.join(root, file)
-                df = pd.read_csv(file_path, sep='\t')
-                
-                # extract the name of metric from filename       
-                metric = file.split('_')[1] if '_' in file else "Unknown"
-                df['metric'] = metric
-                df.metric = [metric] * len(df)  # set the entire metric column to the extracted value
-
-                unique_fifth_columns.update(df.metric)
-                print(unique_fifth_columns)
-                '''
-                if "EC" in index or "PC" in index:
-                    unique_fifth_columns.add(df.columns[4])
-                if "IIC" in index or "NC" in index:
-                    unique_fifth_columns.add(df.columns[1])
-                '''
-                data_frames.append(df)
-    
-    print(type(data_frames))
-
-    # DEBUG
-    '''
-    for i, df in enumerate(data_frames):
-        print(f"DataFrame {i}:\n", df.head())  # print the first few rows of each df
-    '''
-    variations = sorted(unique_fifth_columns)
-    print("Variations are:", variations)
-    
-    merged_data = defaultdict(lambda: {'metric': None})
-    
-    for df in data_frames:
-        '''
-        metric = df.metric
-        print(col5_name)
-        '''
-        print(f"Metric: {df.metric}") # DEBUG
-        
-        # NOTE: DEPRECATED
-        ''' 
-        # check that the DataFrame has enough columns before accessing them
-        if len(df.columns) < 6:
-            print(f"Warning: {file_path} does not have enough columns to create key.")
-            # continue
-        '''
-        
-        for _, row in df.iterrows():
-            try:
-                metric_val = row['metric']
-                if metric_val in ["EC", "PC"]:
-                    key = tuple(row.iloc[[0, 1, 2, 3, 4, 5]])  # using columns 0, 1, 2, 3, 4, 5
-                elif metric_val in ["IIC", "NC"]:
-                    key = (row.iloc[0], "", "", "", row.iloc[1], row.iloc[2])  # using columns 0, 2, 5
-                else:
-                    key = None
-
-                print(f"Generated key: {key}, metric: {metric_val}")  # NOTE: debug
-                merged_data[key] = {'metric': metric_val} # store value in corresponding column
-                '''merged_data[key][metric] = metric_val  ''' # NOTE - old structure
-                '''pprint.pprint(merged_data)''' # NOTE: debug
-            except IndexError as e:
-                print(f"Error processing row: {e}, Row data: {row.to_dict()}")  # NOTE: debug
-                continue
-
-    final_data = []
-    for key, values in merged_data.items():
-        final_data.append(list(key) + [values['metric'], case_study])
-
-    
-    columns = list(df.columns[[0, 1, 2, 3, 4, 5]]) + ['metric', 'case_study'] # create df
-    columns[4] = 'metric_val' # rename column with the values of metrics
-    final_df = pd.DataFrame(final_data, columns=columns)
-    final_df['case_study'] = case_study
-
-
-    os.makedirs(output_dir, exist_ok=True) # create output dir
-    
-    glob_txt = os.path.join(output_dir, "concat_glob.txt")
-    glob_csv = os.path.join(output_dir, "concat_glob.csv")
-    final_df.to_csv(glob_txt, sep='\t', index=False)
-    final_df.to_csv(glob_csv, sep=',', index=False)
-    print("Global indices concatenated and saved.")
-
-    print(f"Output CSV path: {glob_csv}") 
-    return glob_csv #return the path to glob_csv path
-
-def combine_glob_csv(glob_csv_paths: list, output_dir: str) -> str:
-    """Combine all glob_csv files into one .txt file, adding habitat from the folder name.
+    file_paths = find_glob_files(output_dir)
+    pending = manifest.pending(file_paths)
+    removed = manifest.removed(output_dir)
+    for file_path in removed:
+        store.delete_source(file_path)
+        manifest.forget(file_path)
+
+    df = read_glob_files(pending, case_study, habitat)
+    if not df.empty:
+        store.replace(df)
+        for file_path in pending:
+            manifest.mark_processed(file_path)
+    print(f"{habitat}: {len(pending)} new or changed files ingested ({len(df)} rows), {len(removed)} removed, "
+          f"{len(file_paths) - len(pending)} up to date")
+    return len(pending) + len(removed)
+
+def export_glob_csv(store: GlobStore, case_study: str, output_dir: str) -> str:
+    """Exports global indices of the case study from the store to stats_glob.csv.
 
     Parameters:
-    glob_csv_paths (list): list of paths to glob CSV files.
-    output_dir (str): directory to save the combined output.
+    store (GlobStore): store of global indices.
+    case_study (str): name of the case study.
+    output_dir (str): directory to save the CSV.
 
     Returns:
-    output_csv (str): list of paths of glob CSV files (combined by case study)
+    output_csv (str): path to the CSV.
     """
-    combined_data = []
-    
-    for file_path in glob_csv_paths:
-        '''print(f"File path: {file_path}")''' # DEBUG
-        habitat = os.path.basename(os.path.dirname(file_path)) # extract name of habitat
-        '''print(f"Habitat: {habitat}")''' # DEBUG
-        
-        df = pd.read_csv(file_path, sep=',')
-        df['habitat'] = habitat # add 'habitat' column to df
-        combined_data.append(df)
-        
-    combined_df = pd.concat(combined_data, ignore_index=True) # combine dfs
-    
+    df = store.query(columns=CSV_COLUMNS, case_study=case_study)
     output_csv = os.path.join(output_dir, "stats_glob.csv")
-    combined_df.to_csv(output_csv, sep=',', index=False)
-    print(f"Combined data saved to {output_csv}")
-
+    df.to_csv(output_csv, sep=',', index=False)
+    print(f"Global indices of {case_study} exported to {output_csv} ({len(df)} rows)")
     return output_csv
 
-def create_vis(csv: str, case_studies: bool, habitats: bool) -> str:
-    ''''Creates plots for the output CSV
+def create_vis(store: GlobStore, case_study: str, output_path: str, case_studies: bool, habitats: bool) -> str:
+    ''''Creates plots of global indices of the case study (read from the store)
 
     Parameters:
-    csv (str): path to the final CSV
+    store (GlobStore): store of global indices
+    case_study (str): name of the case study
+    output_path (str): path to the final visualisation
     case_studies (bool): specifies if there are multiple case studies defined
     habitats (bool): specifies if there are multiple habitats defined
 
     Returns:
     plot (str): path to the final visualisation
    '''
-    df = pd.read_csv(csv, sep=',')
+    df = store.query(columns=['habitat', 'metric', 'year', 'metric_val'], case_study=case_study)
 
     # indices = df[]
     # years = df[]
@@ -220,7 +145,6 @@ def create_vis(csv: str, case_studies: bool, habitats: bool) -> str:
     plt.tight_layout(rect=[0, 0, 0.85, 0.97])
     plt.show()
 
-    output_path = os.path.splitext(csv)[0] + '_plot.png'
     plt.savefig(output_path)
     plt.close(fig)
 
@@ -228,17 +152,22 @@ def create_vis(csv: str, case_studies: bool, habitats: bool) -> str:
 
     # TODO - to create plt.subplot for multiple case studies (if True)
 
-def glob_wrapper(case_study: str, del_temp: bool = False) -> None:
-    """Calling appending txt files and concatenation based on the case study
+def glob_wrapper(case_study: str, del_temp: bool = False, force: bool = False) -> None:
+    """Calling ingestion of txt files and export based on the case study
     Parameters:
     case_study (str): name of the case study
     del_temp (bool): delete temporary files created by Graphab (each value in separate txt)
+    force (bool): ingest all files, ignoring the manifest of files already ingested
 
     Returns:
     None
     """
     print(f"Running case study: {case_study}")
-    glob_csv_paths = [] # init list with paths to global csv outputs
+    store = GlobStore(GLOB_STORE) # store of global indices (shared by case studies)
+    manifest = ResultsManifest(os.path.join("data", case_study, "output", "stats_glob.manifest.json"))
+    if force or store.query(columns=['metric'], case_study=case_study).empty: # new or rebuilt store
+        manifest.reset()
+    changed = 0
 
     config_dir = os.path.join("config", case_study)
     config_files = [
@@ -267,16 +196,19 @@ def glob_wrapper(case_study: str, del_temp: bool = False) -> None:
         output_dir_parent = os.path.join(os.path.dirname(output_dir_case_study), "stats")
 
         '''print(f"Output directory: {output_dir}")''' # NOTE: DEBUG
-        append_year2txt(output_dir)
-        glob_csv_path = concat_files(output_dir, case_study)
-
-        glob_csv_paths.append(glob_csv_path) # upd list with glob csv outputs
+        changed += ingest_habitat(store, manifest, output_dir, case_study, habitat)
+    manifest.save()
    
     print(f"Output directory for combined stats: {output_dir_case_study}")
-    glob_csv_case_study = combine_glob_csv(glob_csv_paths, output_dir_case_study)
-    print(glob_csv_case_study)
-
-    plot=create_vis(glob_csv_case_study, case_studies=False, habitats=mult_habitats)
+    glob_csv_case_study = os.path.join(output_dir_case_study, "stats_glob.csv")
+    plot_path = os.path.splitext(glob_csv_case_study)[0] + '_plot.png'
+    if changed or not os.path.exists(glob_csv_case_study) or not os.path.exists(plot_path):
+        glob_csv_case_study = export_glob_csv(store, case_study, output_dir_case_study)
+        plot=create_vis(store, case_study, plot_path, case_studies=False, habitats=mult_habitats)
+    else:
+        print(f"Global indices in {glob_csv_case_study} are up to date")
+        plot=plot_path
+    store.close()
     # TODO - to add grouping by case studies and habitats
     if plot:
         print(f"Plot successfully created and saved to: {plot}")
@@ -300,6 +232,8 @@ def glob_wrapper(case_study: str, del_temp: bool = False) -> None:
     return glob_csv_case_study
 
 if __name__ == "__main__":
+    setup_logging()
+
     # set up argparse to handle arguments
     parser = argparse.ArgumentParser(description="Concatenate global indices by case study")
     parser.add_argument(
@@ -314,11 +248,17 @@ if __name__ == "__main__":
         help="Combine all case studies into one CSV (if specified, True)"
     )
 
+    parser.add_argument(
+        "--force",
+        action='store_true',
+        help="Ingest all files again, ignoring the manifest of files already ingested"
+    )
+
     # parsing the argument
     args = parser.parse_args()
 
     # calling the wrapper function with the case study argument 
     all_case_study_csvs = []
     for case_study in args.case_studies:
-        case_study_csvs = glob_wrapper(case_study=case_study, del_temp=False)
+        case_study_csvs = glob_wrapper(case_study=case_study, del_temp=False, force=args.force)
         '''all_case_study_csvs.extend(case_study_csvs)'''
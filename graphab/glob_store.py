@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+# Store of global connectivity indices (SQLite with indexes): PC, EC, IIC, NC and the values of d-sequences.
+# Graphab and preprocessing run in separate Docker images, so this module is mirrored in
+# graphab/glob_store.py and preprocessing/stats/glob_store.py: keep both copies identical.
+#
+# One row per graph, distance (d), probability (p), beta, metric and year of a case study, habitat and scenario
+# (for example, 'enriched' LULC). Rows of each source file are replaced as a whole (by source path) when the file
+# is ingested again. Readers filter rows in SQL (only matching rows are loaded).
+
+import os
+import sqlite3
+import pandas as pd
+
+STORE_COLUMNS = ['case_study', 'habitat', 'scenario', 'metric', 'year', 'Graph', 'd', 'p', 'beta', 'metric_val', 'source']
+KEY_COLUMNS = ['case_study', 'habitat', 'scenario', 'metric', 'year'] # NOT NULL columns (missing values stored as '')
+
+def parse_metric_name(file_path: str) -> tuple[str, str, str] | None:
+    """
+    Returns the metric, year and scenario of a file with global indices, or None if the name does not match.
+    Supported names: glob_{metric}_{year}.txt (Graphab) and {metric}_{year}[_{scenario}].txt (d-sequences).
+    """
+    parts = os.path.basename(file_path).replace(".txt", "").split("_")
+    if parts[0] == "glob":
+        parts = parts[1:]
+    if len(parts) < 2 or not parts[1].isdigit():
+        return None
+    return parts[0], parts[1], "_".join(parts[2:])
+
+def read_metric_file(file_path: str, **columns) -> pd.DataFrame:
+    """
+    Reads one file with global indices (tab-separated, as written by Graphab) into the columns of the store.
+    The column with values of the metric is renamed to 'metric_val'; missing graph parameters (d, p, beta of IIC and NC) are left empty.
+
+    Parameters:
+    file_path (str): path to the file.
+    columns (dict): values of other columns (case_study, habitat), constant for the file.
+
+    Returns:
+    df (pd.DataFrame): rows of the file.
+    """
+    metric, year, scenario = parse_metric_name(file_path)
+    df = pd.read_csv(file_path, sep='\t', float_precision='round_trip')
+    df = df.rename(columns={metric: 'metric_val'})
+    df['metric'] = metric
+    df['year'] = int(year) # from the filename (files written by older versions have the same column)
+    df['scenario'] = scenario
+    df['source'] = os.path.normpath(file_path)
+    for column, value in columns.items():
+        df[column] = value
+    return df.reindex(columns=STORE_COLUMNS)
+
+class GlobStore:
+    """Global indices stored in SQLite, indexed by case study, habitat, metric and year (and by metric and distance)."""
+
+    def __init__(self, db_path: str, table: str = 'glob_indices') -> None:
+        """
+        Parameters:
+        db_path (str): path to the SQLite database (created if it does not exist).
+        table (str): name of the table.
+        """
+        self.db_path = db_path
+        self.table = table
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "case_study TEXT NOT NULL, habitat TEXT NOT NULL, scenario TEXT NOT NULL, metric TEXT NOT NULL, year INTEGER NOT NULL, "
+            "Graph TEXT, d REAL, p REAL, beta REAL, metric_val REAL, source TEXT)"
+        )
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_group ON {self.table} (case_study, habitat, metric, year)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_d ON {self.table} (metric, d)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_source ON {self.table} (source)")
+        self.conn.commit()
+
+    def replace(self, df: pd.DataFrame) -> int:
+        """Replaces all rows of the source files present in df (rows with the same source path), in one transaction.
+        Rows are matched by source, not by (case_study, habitat, scenario, metric, year): projects of the same year
+        (for example, con_2020 and con_2020_enriched) do not overwrite each other.
+
+        Parameters:
+        df (pd.DataFrame): rows with the columns of the store (missing columns are left empty, key columns as ''); source is required.
+
+        Returns:
+        count (int): number of rows written.
+        """
+        df = df.reindex(columns=STORE_COLUMNS)
+        if df['source'].isna().any():
+            raise ValueError("Rows without source cannot be replaced")
+        df['source'] = df['source'].map(os.path.normpath)
+        df[KEY_COLUMNS] = df[KEY_COLUMNS].fillna('')
+        df = df.astype(object).where(df.notna(), None) # NaN to NULL
+        with self.conn:
+            for source in df['source'].drop_duplicates():
+                self.conn.execute(f"DELETE FROM {self.table} WHERE source=?", (source,))
+            self.conn.executemany(
+                f"INSERT INTO {self.table} ({', '.join(STORE_COLUMNS)}) VALUES ({', '.join('?' * len(STORE_COLUMNS))})",
+                df.itertuples(index=False, name=None)
+            )
+        return len(df)
+
+    def delete_source(self, source: str) -> None:
+        """Deletes rows ingested from a source file (for example, a file that no longer exists)."""
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE source=?", (os.path.normpath(source),))
+
+    def query(self, columns: list = None, **filters) -> pd.DataFrame:
+        """Returns rows matching the filters, sorted by case study, habitat, scenario, metric, year and distance.
+
+        Parameters:
+        columns (list): columns to return (all by default).
+        filters (dict): column -> value or list of values (for example, case_study='cat_aggr', metric=['PC', 'EC']).
+
+        Returns:
+        df (pd.DataFrame): matching rows.
+        """
+        conditions, params = [], []
+        for column, value in filters.items():
+            if column not in STORE_COLUMNS:
+                raise ValueError(f"Unknown column: {column}")
+            if value is None:
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        query = f"SELECT {', '.join(columns or STORE_COLUMNS)} FROM {self.table}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY case_study, habitat, scenario, metric, year, d"
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def close(self) -> None:
+        self.conn.close()
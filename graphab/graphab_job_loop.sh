@@ -160,6 +160,19 @@ for lulc_file in "${lulc_files[@]}"; do
     test_loop_xml="$output_dir/$test_loop/$test_loop.xml"
     test_capacity="patches_capa_${lulc_numbers}.csv"
    
+    # if impedance is available as VRT (impedance_csv2tif.py --vrt), materialise it for Graphab
+    # (again whenever the VRT is newer than the materialised file, so a stale impedance is not used)
+    impedance_vrt="${impedance%.tif}.vrt"
+    if [ -f "$impedance_vrt" ] && { [ ! -f "$impedance" ] || [ "$impedance_vrt" -nt "$impedance" ]; }; then
+        echo "Materialising impedance VRT: $impedance_vrt"
+        if gdal_translate -q "$impedance_vrt" "${impedance%.tif}_tmp.tif" -co TILED=YES -co COMPRESS=ZSTD -co BIGTIFF=IF_SAFER; then
+            mv -f "${impedance%.tif}_tmp.tif" "$impedance"
+        else
+            echo "Failed to materialise $impedance_vrt, skipping stale $impedance"
+            rm -f "${impedance%.tif}_tmp.tif" "$impedance"
+        fi
+    fi
+
     # to check if the impedance file exists before proceeding
 	# to include customised capacity of patch use "--capa file=$test_capacity id=Id capacity=capacity"
 
@@ -7,54 +7,43 @@ import argparse
 import os
 import sys
 import subprocess
-import csv
 import logging
+import xml.etree.ElementTree as ET
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from osgeo import gdal
 import numpy as np
-
-print("Logs are redirected to /logs")
-sys.stdout = open('logs/impedance_csv2tif.log', 'w') #to log
-sys.stderr = sys.stdout
+from lut_reclass import load_reclass_csv, ReclassLUT, align_luts, to_gdal_lut
+from raster_blocks import create_tiled_tif, iter_windows, tiled_creation_options
+from cache_manifest import file_signature, file_sha256, is_up_to_date, write_manifest
 
 gdal.UseExceptions()
 
-# Set up logging
-log_file = 'logs/test.log'
-logging.basicConfig(
-    level=logging.INFO,  # Set the logging level
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Format of log messages
-    handlers=[
-        logging.FileHandler(log_file),  # Log to file
-        logging.StreamHandler()  # Also log to the console
-    ]
-)
+def setup_logging():
+    """Redirects output of the main process to /logs (worker processes log each job to a separate file)."""
+    print("Logs are redirected to /logs")
+    sys.stdout = open('logs/impedance_csv2tif.log', 'w') #to log
+    sys.stderr = sys.stdout
+
+    # Set up logging
+    log_file = 'logs/test.log'
+    logging.basicConfig(
+        level=logging.INFO,  # Set the logging level
+        format='%(asctime)s - %(levelname)s - %(message)s',  # Format of log messages
+        handlers=[
+            logging.FileHandler(log_file),  # Log to file
+            logging.StreamHandler()  # Also log to the console
+        ]
+    )
 
 def reclassify_lulc2impedance(input_raster, impedance_raster, reclass_table, out_nodata):
-    reclass_dict = {}
-
-    with open(reclass_table, 'r', encoding='utf-8-sig') as csvfile:
-        reader = csv.DictReader(csvfile)
-        reclass_list = list(reader)
-        has_decimal_values = any('.' in row['impedance'] for row in reclass_list)
-        data_type = 'Float32' if has_decimal_values else 'Int32'
-
-    for row in reclass_list:
-        try:
-            if not row['type'] or row['type'].strip().lower() in {'null', 'none'}:
-                continue
-            impedance_str = row['impedance'].strip()
-            impedance = (
-                float(impedance_str) if has_decimal_values else int(impedance_str)
-                if impedance_str else 666
-            )
-            reclass_dict[int(row['lulc'])] = impedance
-        except ValueError:
-            logging.error(f"Invalid data format in reclassification table: {row}")
-
-    nodata_value = float(out_nodata) if has_decimal_values else out_nodata
-    reclass_dict.update({-2147483647: nodata_value, -32768: nodata_value, 0: nodata_value})
+    reclass_dict, has_decimal_values = load_reclass_csv(reclass_table, out_nodata)
+    data_type = 'Float32' if has_decimal_values else 'Int32'
     logging.info(f"Mapping dictionary used to classify impedance is: {reclass_dict}")
 
+    # compile the table once into a dense lookup array (no Python call per pixel)
+    lut = ReclassLUT(reclass_dict, out_nodata, dtype=np.float32 if has_decimal_values else np.int32)
+
     dataset = gdal.Open(input_raster)
     if dataset is None:
         logging.error("Could not open input raster.")
@@ -69,11 +58,7 @@ def reclassify_lulc2impedance(input_raster, impedance_raster, reclass_table, out
     input_band = dataset.GetRasterBand(1)
     output_band = output_dataset.GetRasterBand(1)
     input_data = input_band.ReadAsArray()
-    output_data = np.where(
-        np.isin(input_data, list(reclass_dict.keys())), 
-        np.vectorize(reclass_dict.get, otypes=[float if has_decimal_values else int])(input_data), 
-        float(out_nodata) if has_decimal_values else out_nodata
-    )
+    output_data = lut.apply(input_data)
     output_band.WriteArray(output_data)
 
     dataset = None
@@ -103,6 +88,280 @@ def reclassify_impedance2affinity(impedance_raster, out_nodata):
     logging.info(f"Affinity computed for: {impedance_raster}")
     return affinity_raster
 
+def reclassify_lulc2impedance_affinity_stream(input_raster, impedance_raster, reclass_table, out_nodata):
+    """Reclassifies LULC to impedance and affinity (1/impedance) in a single pass, window by window.
+    Both outputs are written directly as tiled ZSTD GeoTIFFs (no intermediate re-read of impedance, no gdalwarp)."""
+    reclass_dict, has_decimal_values = load_reclass_csv(reclass_table, out_nodata)
+    data_type = 'Float32' if has_decimal_values else 'Int32'
+    logging.info(f"Mapping dictionary used to classify impedance is: {reclass_dict}")
+
+    impedance_lut = ReclassLUT(reclass_dict, out_nodata, dtype=np.float32 if has_decimal_values else np.int32)
+    affinity_lut = impedance_lut.reciprocal()
+
+    dataset = gdal.Open(input_raster)
+    if dataset is None:
+        logging.error("Could not open input raster.")
+        return
+
+    affinity_raster = impedance_raster.replace('impedance', 'affinity')
+    os.makedirs(os.path.dirname(affinity_raster), exist_ok=True)
+
+    impedance_ds = create_tiled_tif(impedance_raster, dataset, gdal.GDT_Float32 if has_decimal_values else gdal.GDT_Int32, out_nodata)
+    affinity_ds = create_tiled_tif(affinity_raster, dataset, gdal.GDT_Float32, out_nodata)
+    input_band = dataset.GetRasterBand(1)
+    impedance_band = impedance_ds.GetRasterBand(1)
+    affinity_band = affinity_ds.GetRasterBand(1)
+
+    for xoff, yoff, xsize, ysize in iter_windows(input_band):
+        block = input_band.ReadAsArray(xoff, yoff, xsize, ysize)
+        impedance_block, affinity_block = impedance_lut.apply_with_reciprocal(block, affinity_lut)
+        impedance_band.WriteArray(impedance_block, xoff, yoff)
+        affinity_band.WriteArray(affinity_block, xoff, yoff)
+
+    impedance_band.FlushCache()
+    affinity_band.FlushCache()
+    dataset = None
+    impedance_ds = None
+    affinity_ds = None
+
+    logging.info(f"Affinity computed for: {impedance_raster}")
+    return data_type, affinity_raster
+
+def reclassify_lulc2multi_habitat_stream(input_raster, outputs, out_nodata):
+    """Decodes each LULC block once and writes impedance and affinity for every habitat from it.
+
+    Parameters:
+    input_raster (str): path to the LULC raster.
+    outputs (list): (habitat, impedance_raster, reclass_table) for each habitat.
+    out_nodata (int): nodata value of output rasters.
+
+    Returns:
+    affinity_rasters (list): paths to the affinity rasters (in the same order as outputs).
+    """
+    dataset = gdal.Open(input_raster)
+    if dataset is None:
+        logging.error("Could not open input raster.")
+        return
+
+    impedance_luts = []
+    datasets = [] # keep output datasets open until the last block is written
+    bands = []
+    affinity_rasters = []
+    for habitat, impedance_raster, reclass_table in outputs:
+        reclass_dict, has_decimal_values = load_reclass_csv(reclass_table, out_nodata)
+        logging.info(f"Mapping dictionary used to classify impedance for {habitat} is: {reclass_dict}")
+        impedance_luts.append(ReclassLUT(reclass_dict, out_nodata, dtype=np.float32 if has_decimal_values else np.int32))
+
+        affinity_raster = impedance_raster.replace('impedance', 'affinity')
+        os.makedirs(os.path.dirname(affinity_raster), exist_ok=True)
+        affinity_rasters.append(affinity_raster)
+
+        impedance_ds = create_tiled_tif(impedance_raster, dataset, gdal.GDT_Float32 if has_decimal_values else gdal.GDT_Int32, out_nodata)
+        affinity_ds = create_tiled_tif(affinity_raster, dataset, gdal.GDT_Float32, out_nodata)
+        datasets.extend([impedance_ds, affinity_ds])
+        bands.append((impedance_ds.GetRasterBand(1), affinity_ds.GetRasterBand(1)))
+
+    # common offset and size: the LULC block is converted to table positions once for all habitats
+    impedance_luts = align_luts(impedance_luts)
+    affinity_luts = [lut.reciprocal() for lut in impedance_luts]
+
+    input_band = dataset.GetRasterBand(1)
+    for xoff, yoff, xsize, ysize in iter_windows(input_band):
+        index = impedance_luts[0].index(input_band.ReadAsArray(xoff, yoff, xsize, ysize))
+        for impedance_lut, affinity_lut, (impedance_band, affinity_band) in zip(impedance_luts, affinity_luts, bands):
+            impedance_band.WriteArray(impedance_lut.lut[index], xoff, yoff)
+            affinity_band.WriteArray(affinity_lut.lut[index], xoff, yoff)
+
+    for impedance_band, affinity_band in bands:
+        impedance_band.FlushCache()
+        affinity_band.FlushCache()
+    dataset = None
+    bands = None
+    datasets = None
+
+    logging.info(f"Impedance and affinity computed for {len(outputs)} habitats from: {input_raster}")
+    return affinity_rasters
+
+def write_lut_vrt(input_raster, output_vrt, lut, gdal_dtype):
+    """Writes a VRT which reclassifies the LULC raster on the fly through a <LUT> (no pixel data are copied).
+
+    Parameters:
+    input_raster (str): path to the LULC raster (referenced relatively to the VRT).
+    output_vrt (str): path to the output VRT.
+    lut (ReclassLUT): compiled lookup table (impedance or affinity).
+    gdal_dtype (int): GDAL data type of the VRT band.
+    """
+    ds = gdal.Open(input_raster)
+    if ds is None:
+        raise FileNotFoundError(f"Could not open input raster: {input_raster}")
+    x_size, y_size = ds.RasterXSize, ds.RasterYSize
+    block_x, block_y = ds.GetRasterBand(1).GetBlockSize()
+
+    vrt = ET.Element("VRTDataset", rasterXSize=str(x_size), rasterYSize=str(y_size))
+    ET.SubElement(vrt, "SRS").text = ds.GetProjection()
+    ET.SubElement(vrt, "GeoTransform").text = ", ".join(repr(v) for v in ds.GetGeoTransform())
+    band = ET.SubElement(vrt, "VRTRasterBand", dataType=gdal.GetDataTypeName(gdal_dtype), band="1")
+    ET.SubElement(band, "NoDataValue").text = str(lut.nodata)
+
+    source = ET.SubElement(band, "ComplexSource")
+    ET.SubElement(source, "SourceFilename", relativeToVRT="1").text = os.path.relpath(input_raster, os.path.dirname(output_vrt))
+    ET.SubElement(source, "SourceBand").text = "1"
+    ET.SubElement(source, "SourceProperties", RasterXSize=str(x_size), RasterYSize=str(y_size),
+                  DataType=gdal.GetDataTypeName(ds.GetRasterBand(1).DataType), BlockXSize=str(block_x), BlockYSize=str(block_y))
+    ET.SubElement(source, "SrcRect", xOff="0", yOff="0", xSize=str(x_size), ySize=str(y_size))
+    ET.SubElement(source, "DstRect", xOff="0", yOff="0", xSize=str(x_size), ySize=str(y_size))
+    ET.SubElement(source, "LUT").text = to_gdal_lut(lut)
+    ds = None
+
+    ET.indent(vrt)
+    ET.ElementTree(vrt).write(output_vrt, encoding="utf-8")
+
+def write_impedance_affinity_vrt(input_raster, impedance_raster, reclass_table, out_nodata):
+    """Writes impedance and affinity as VRTs over the LULC raster instead of materialised GeoTIFFs.
+    Affinity (1/impedance) is also a pure function of LULC codes, so it is expressed as a reciprocal <LUT> on the same source."""
+    reclass_dict, has_decimal_values = load_reclass_csv(reclass_table, out_nodata)
+    impedance_lut = ReclassLUT(reclass_dict, out_nodata, dtype=np.float32 if has_decimal_values else np.int32)
+
+    impedance_vrt = os.path.splitext(impedance_raster)[0] + '.vrt'
+    affinity_vrt = impedance_vrt.replace('impedance', 'affinity')
+    os.makedirs(os.path.dirname(affinity_vrt), exist_ok=True)
+
+    write_lut_vrt(input_raster, impedance_vrt, impedance_lut, gdal.GDT_Float32 if has_decimal_values else gdal.GDT_Int32)
+    write_lut_vrt(input_raster, affinity_vrt, impedance_lut.reciprocal(), gdal.GDT_Float32)
+    logging.info(f"Impedance and affinity VRTs written: {impedance_vrt}, {affinity_vrt}")
+    return impedance_vrt, affinity_vrt
+
+def materialise_vrt(vrt_path):
+    """Translates a VRT into a tiled ZSTD GeoTIFF next to it (same name, .tif extension)."""
+    ds = gdal.Open(vrt_path)
+    gdal_dtype = ds.GetRasterBand(1).DataType
+    ds = None
+    tif_path = os.path.splitext(vrt_path)[0] + '.tif'
+    gdal.Translate(tif_path, vrt_path, creationOptions=tiled_creation_options(gdal_dtype))
+    logging.info(f"VRT materialised as GeoTIFF: {tif_path}")
+    return tif_path
+
+def build_signature(input_raster, reclass_table, out_nodata, mode):
+    """Signature of the inputs of one (habitat, LULC year) output, recorded in its cache manifest."""
+    return {
+        'lulc': file_signature(input_raster),
+        'reclass_table_sha256': file_sha256(reclass_table),
+        'out_nodata': out_nodata,
+        'mode': mode,
+    }
+
+def get_output_paths(impedance_raster, vrt=False):
+    """Returns paths to impedance and affinity outputs (GeoTIFFs or VRTs)."""
+    impedance_path = os.path.splitext(impedance_raster)[0] + '.vrt' if vrt else impedance_raster
+    return [impedance_path, impedance_path.replace('impedance', 'affinity')]
+
+def process_lulc_year(input_raster_path, impedance_raster_path, reclass_table, out_nodata, stream):
+    """Reclassifies one LULC raster to impedance and affinity for one habitat."""
+    if stream:
+        data_type, affinity_raster = reclassify_lulc2impedance_affinity_stream(input_raster_path, impedance_raster_path, reclass_table, out_nodata)
+        logging.info(f"Data type used to reclassify LULC as impedance is {data_type}")
+        logging.info(f"Impedance and affinity written as tiled ZSTD GeoTIFFs: {impedance_raster_path}, {affinity_raster}")
+        logging.info("------------------------------------------")
+        return
+
+    data_type, has_decimal_values = reclassify_lulc2impedance(input_raster_path, impedance_raster_path, reclass_table, out_nodata)
+    logging.info(f"Data type used to reclassify LULC as impedance is {data_type}")
+
+    compressed_raster_path = os.path.splitext(impedance_raster_path)[0] + '_compr.tif'
+    subprocess.run([ 
+        'gdalwarp', 
+        impedance_raster_path, 
+        compressed_raster_path, 
+        '-dstnodata', str(out_nodata), 
+        '-ot', data_type, 
+        '-co', 'COMPRESS=ZSTD'
+    ])
+
+    os.remove(impedance_raster_path)
+    os.rename(compressed_raster_path, impedance_raster_path)
+
+    logging.info(f"Reclassification for impedance complete for: {input_raster_path}")
+    logging.info("------------------------------------")
+
+    affinity_raster = reclassify_impedance2affinity(impedance_raster_path, out_nodata)
+
+    compressed_affinity = os.path.splitext(affinity_raster)[0] + '_compr.tif'
+    subprocess.run([
+        'gdalwarp', 
+        affinity_raster,  
+        compressed_affinity,
+        '-dstnodata', str(out_nodata),
+        '-ot', data_type,
+        '-co', 'COMPRESS=ZSTD',
+    ])
+
+    os.remove(affinity_raster)
+    os.rename(compressed_affinity, affinity_raster)
+
+    logging.info("Affinity file is successfully compressed.")
+    logging.info("------------------------------------------")
+
+def init_worker():
+    """Drops logging handlers inherited from the main process (each job logs to its own file)."""
+    logging.root.handlers = []
+    logging.root.setLevel(logging.INFO)
+
+def run_job(job: dict) -> dict:
+    """Runs one (habitat, LULC year) job in a worker process, logging to logs/impedance_csv2tif/{habitat}_{lulc}.log.
+
+    Parameters:
+    job (dict): habitat, paths to LULC, impedance and reclassification table, nodata value, streaming flag and log directory.
+
+    Returns:
+    result (dict): habitat, LULC file, number of pixels, elapsed time and error (if any).
+    """
+    lulc_name = os.path.splitext(os.path.basename(job['input_raster']))[0]
+    log_name = 'all' if 'outputs' in job else job['habitat']
+    log_path = os.path.join(job['log_dir'], f"{log_name}_{lulc_name}.log")
+    handler = logging.FileHandler(log_path, mode='w')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.root.addHandler(handler)
+
+    result = {'habitat': job['habitat'], 'lulc': os.path.basename(job['input_raster']), 'pixels': 0, 'seconds': 0.0, 'error': None, 'log': log_path}
+    start = time.perf_counter()
+    try:
+        logging.info(f"Processing {result['lulc']} for habitat: {job['habitat']}")
+        ds = gdal.Open(job['input_raster'])
+        result['pixels'] = ds.RasterXSize * ds.RasterYSize
+        ds = None
+        if 'outputs' in job: # multi-habitat job: one LULC decode for all habitats
+            result['pixels'] *= len(job['outputs'])
+            reclassify_lulc2multi_habitat_stream(job['input_raster'], job['outputs'], job['out_nodata'])
+        else:
+            process_lulc_year(job['input_raster'], job['impedance_raster'], job['reclass_table'], job['out_nodata'], job['stream'])
+        for output_paths, signature in job['cache']: # record inputs of the outputs which are now up to date
+            write_manifest(output_paths, signature)
+    except Exception as e:
+        logging.exception(f"Job failed: {job['habitat']}, {result['lulc']}")
+        result['error'] = str(e)
+    finally:
+        result['seconds'] = time.perf_counter() - start
+        logging.root.removeHandler(handler)
+        handler.close()
+    return result
+
+def log_result(result: dict) -> None:
+    """Logs the status of one job in the main log."""
+    status = f"failed ({result['error']})" if result['error'] else "done"
+    logging.info(f"{result['habitat']}, {result['lulc']}: {status} in {result['seconds']:.2f} s")
+
+def log_summary(results: list, wall_time: float) -> None:
+    """Logs the wall time and throughput (megapixels of impedance produced per second) of all jobs."""
+    megapixels = sum(r['pixels'] for r in results) / 1e6
+    failed = [r for r in results if r['error']]
+    logging.info("*" * 40)
+    logging.info(f"Jobs completed: {len(results) - len(failed)}/{len(results)}")
+    for r in failed:
+        logging.error(f"Failed: {r['habitat']}, {r['lulc']}: {r['error']} (see {r['log']})")
+    logging.info(f"Wall time: {wall_time:.2f} s, sum of job times: {sum(r['seconds'] for r in results):.2f} s")
+    logging.info(f"Throughput: {megapixels:.1f} Mpx in {wall_time:.2f} s ({megapixels / wall_time if wall_time else 0:.2f} Mpx/s)")
+    logging.info("*" * 40)
+
 def main():
     parser = argparse.ArgumentParser(description='Reclassify LULC to impedance and affinity datasets by CSV table.')
     parser.add_argument('case_study', type=str, help='Case study name')
@@ -111,68 +370,157 @@ def main():
         type=lambda s: s.split(","),  # split input by commas
         help="Comma-separated list of habitat names (e.g., 'shrubland,grassland,wetland')"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read LULC by block windows and write impedance and affinity in the same pass as tiled ZSTD GeoTIFFs (bounded memory, no gdalwarp)"
+    )
+    parser.add_argument(
+        "--multi-habitat",
+        action="store_true",
+        help="Decode each LULC block once and write outputs of all habitats together (implies --stream)"
+    )
+    parser.add_argument(
+        "--vrt",
+        action="store_true",
+        help="Write impedance and affinity as VRTs over LULC (reclassification on the fly, no pixel data copied)"
+    )
+    parser.add_argument(
+        "--materialise",
+        action="store_true",
+        help="With --vrt, also translate the VRTs into tiled ZSTD GeoTIFFs"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild all outputs, even if their cache manifests show that inputs have not changed"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to run (habitat, year) jobs in parallel (default 1, sequential)"
+    )
     args = parser.parse_args()
 
     case_study = args.case_study
     habitats = args.habitats
     input_folder = f'data/{case_study}/input/lulc'
     out_nodata = 9999
+    log_dir = 'logs/impedance_csv2tif'
+    os.makedirs(log_dir, exist_ok=True)
 
+    tiff_files = [f for f in os.listdir(input_folder) if f.endswith('.tif')]
+    habitat_tables = {}
     for habitat in habitats:
         habitat = habitat.strip()
         impedance_folder = f'data/{case_study}/input/{habitat}_impedance'
         reclass_table = f'data/{case_study}/input/{habitat}_impedance/reclassification_{habitat}.csv'
-
         os.makedirs(impedance_folder, exist_ok=True)
-        tiff_files = [f for f in os.listdir(input_folder) if f.endswith('.tif')]
+        habitat_tables[habitat] = (impedance_folder, reclass_table)
+
+    def is_cached(output_paths, signature):
+        if args.force or not is_up_to_date(output_paths, signature):
+            return False
+        logging.info(f"Skipping up-to-date outputs: {', '.join(output_paths)}")
+        return True
+
+    if args.vrt: # only XML is written, no need for worker processes
+        for habitat, (impedance_folder, reclass_table) in habitat_tables.items():
+            for tiff_file in tiff_files:
+                input_raster_path = os.path.join(input_folder, tiff_file)
+                impedance_raster_path = os.path.join(impedance_folder, f"impedance_{tiff_file}")
+                output_paths = get_output_paths(impedance_raster_path, vrt=True)
+                if args.materialise:
+                    output_paths += [os.path.splitext(path)[0] + '.tif' for path in output_paths]
+                signature = build_signature(input_raster_path, reclass_table, out_nodata, 'vrt')
+                if is_cached(output_paths, signature):
+                    continue
+
+                logging.info(f"Writing VRTs for {tiff_file} for habitat: {habitat}")
+                vrts = write_impedance_affinity_vrt(input_raster_path, impedance_raster_path, reclass_table, out_nodata)
+                if args.materialise:
+                    for vrt_path in vrts:
+                        materialise_vrt(vrt_path)
+                write_manifest(output_paths, signature)
+        return
 
+    mode = 'stream' if args.stream or args.multi_habitat else 'gdalwarp'
+    jobs = []
+    skipped = 0
+    if args.multi_habitat: # one job per LULC year, for all habitats (only those which are not up to date)
         for tiff_file in tiff_files:
             input_raster_path = os.path.join(input_folder, tiff_file)
-            logging.info(f"Processing {tiff_file} for habitat: {habitat}")
-
-            output_filename = f"impedance_{tiff_file}"
-            impedance_raster_path = os.path.join(impedance_folder, output_filename)
-
-            data_type, has_decimal_values = reclassify_lulc2impedance(input_raster_path, impedance_raster_path, reclass_table, out_nodata)
-            logging.info(f"Data type used to reclassify LULC as impedance is {data_type}")
-
-            compressed_raster_path = os.path.splitext(impedance_raster_path)[0] + '_compr.tif'
-            subprocess.run([ 
-                'gdalwarp', 
-                impedance_raster_path, 
-                compressed_raster_path, 
-                '-dstnodata', str(out_nodata), 
-                '-ot', data_type, 
-                '-co', 'COMPRESS=ZSTD'
-            ])
-
-            os.remove(impedance_raster_path)
-            os.rename(compressed_raster_path, impedance_raster_path)
-
-            logging.info(f"Reclassification for impedance complete for: {input_raster_path}")
-            logging.info("------------------------------------")
-
-            affinity_raster = reclassify_impedance2affinity(impedance_raster_path, out_nodata)
-
-            compressed_affinity = os.path.splitext(affinity_raster)[0] + '_compr.tif'
-            subprocess.run([
-                'gdalwarp', 
-                affinity_raster,  
-                compressed_affinity,
-                '-dstnodata', str(out_nodata),
-                '-ot', data_type,
-                '-co', 'COMPRESS=ZSTD',
-            ])
-
-            os.remove(affinity_raster)
-            os.rename(compressed_affinity, affinity_raster)
-
-            logging.info("Affinity file is successfully compressed.")
-            logging.info("------------------------------------------")
+            outputs, cache = [], []
+            for habitat, (impedance_folder, reclass_table) in habitat_tables.items():
+                impedance_raster_path = os.path.join(impedance_folder, f"impedance_{tiff_file}")
+                output_paths = get_output_paths(impedance_raster_path)
+                signature = build_signature(input_raster_path, reclass_table, out_nodata, mode)
+                if is_cached(output_paths, signature):
+                    skipped += 1
+                    continue
+                outputs.append((habitat, impedance_raster_path, reclass_table))
+                cache.append((output_paths, signature))
+            if not outputs:
+                continue
+            jobs.append({
+                'habitat': ','.join(habitat for habitat, _, _ in outputs),
+                'input_raster': input_raster_path,
+                'outputs': outputs,
+                'out_nodata': out_nodata,
+                'stream': True,
+                'log_dir': log_dir,
+                'cache': cache,
+            })
+    else: # one job per (habitat, LULC year)
+        for habitat, (impedance_folder, reclass_table) in habitat_tables.items():
+            for tiff_file in tiff_files:
+                input_raster_path = os.path.join(input_folder, tiff_file)
+                impedance_raster_path = os.path.join(impedance_folder, f"impedance_{tiff_file}")
+                output_paths = get_output_paths(impedance_raster_path)
+                signature = build_signature(input_raster_path, reclass_table, out_nodata, mode)
+                if is_cached(output_paths, signature):
+                    skipped += 1
+                    continue
+                jobs.append({
+                    'habitat': habitat,
+                    'input_raster': input_raster_path,
+                    'impedance_raster': impedance_raster_path,
+                    'reclass_table': reclass_table,
+                    'out_nodata': out_nodata,
+                    'stream': args.stream,
+                    'log_dir': log_dir,
+                    'cache': [(output_paths, signature)],
+                })
+
+    logging.info(f"{skipped} (habitat, year) outputs are up to date and skipped (use --force to rebuild)")
+    logging.info(f"Scheduled {len(jobs)} jobs ({len(habitats)} habitats) on {max(args.workers, 1)} worker(s)")
+    start = time.perf_counter()
+    results = []
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+            futures = [executor.submit(run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                log_result(result)
+    else:
+        for job in jobs:
+            result = run_job(job)
+            results.append(result)
+            log_result(result)
+
+    log_summary(results, time.perf_counter() - start)
 
 if __name__ == "__main__":
+    setup_logging()
     main()
     '''
     Usage example:
     python3 ./impedance_csv2tif.py cat_aggr_30m forest,herbaceous,woody,aquatic,shrubland
+    python3 ./impedance_csv2tif.py cat_aggr_30m forest,herbaceous,woody,aquatic,shrubland --stream
+    python3 ./impedance_csv2tif.py cat_aggr_30m forest,herbaceous,woody,aquatic,shrubland --stream --workers 4
+    python3 ./impedance_csv2tif.py cat_aggr_30m forest,herbaceous,woody,aquatic,shrubland --multi-habitat --workers 4
+    python3 ./impedance_csv2tif.py cat_aggr_30m forest,herbaceous,woody,aquatic,shrubland --vrt
+    python3 ./impedance_csv2tif.py cat_aggr_30m forest,herbaceous,woody,aquatic,shrubland --stream --force
     '''
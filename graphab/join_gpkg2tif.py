@@ -6,9 +6,17 @@
 import datetime
 import os
 import sys
-from osgeo import gdal, ogr
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from osgeo import gdal, ogr, gdal_array
+import numpy as np
 import re
 import argparse
+from raster_blocks import iter_windows, tiled_creation_options
+from lut_reclass import ReclassLUT, align_luts
+
+DEFAULT_NODATA = -9999.0 # nodata of outputs if patches.tif has no nodata value
 
 print("Logs are redirected to /logs")
 sys.stdout = open('logs/join_gpkg2tif.log', 'w') #to log
@@ -71,8 +79,8 @@ def extract_timestamp_xml(input_file):
         print("No .xml file found in the current or parent directory.")
         return None
 
-def rasterize_geopackage(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude_fields):
-    """Rasterises each relevant field from the GeoPackage into a separate TIFF."""
+def rasterize_geopackage(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude_fields, bands=False):
+    """Rasterises each relevant field from the GeoPackage into a separate TIFF (or into bands of one TIFF, if bands is True)."""
     x_size, y_size = tif_ds.RasterXSize, tif_ds.RasterYSize
     geotransform, projection, nodata_value = tif_ds.GetGeoTransform(), tif_ds.GetProjection(), tif_ds.GetRasterBand(1).GetNoDataValue()
 
@@ -87,6 +95,16 @@ def rasterize_geopackage(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude
         layer = gpkg_ds.GetLayerByIndex(layer_index)
         field_names = get_relevant_fields(layer, exclude_fields)
 
+        if bands: # one band per field
+            output_tif_ds = create_band_stack(output_tif_path, x_size, y_size, field_names, gdal_dtype, geotransform, projection, nodata_value, timestamp)
+            for band_index, field in enumerate(field_names, start=1):
+                print(f"Processing field: {field}")
+                gdal.RasterizeLayer(output_tif_ds, [band_index], layer, options=["ATTRIBUTE=" + field], burn_values=[nodata_value])
+            print(f"Fields {field_names} rasterized to bands of {output_tif_path}.")
+            output_tif_ds.FlushCache()
+            output_tif_ds = None
+            continue
+
         for field in field_names:
             print(f"Processing field: {field}")
             
@@ -100,11 +118,7 @@ def rasterize_geopackage(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude
             gdal.RasterizeLayer(output_tif_ds, [1], layer, options=["ATTRIBUTE=" + field], burn_values=[nodata_value])
             
             # write index name to metadata
-            index_name = field.split('_')[0] # first part of index name
-            description = f"INDEX:{index_name}; TIMESTAMP:{timestamp}"
-            software_name = "Graphab (c) Foltete JC, Vuidel G, Clauzel C et al. Licensed under GNU GPL."
-            output_tif_ds.SetMetadataItem("TIFFTAG_IMAGEDESCRIPTION", description)
-            output_tif_ds.SetMetadataItem("TIFFTAG_SOFTWARE", software_name)
+            description = set_index_metadata(output_tif_ds, field, timestamp)
 
             print(f"Field '{field}' rasterized to {field_output_tif}.")
             print(f"Metadata set: {description}")
@@ -114,6 +128,150 @@ def rasterize_geopackage(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude
     
     gpkg_ds = None
 
+def set_index_metadata(output_ds, field, timestamp):
+    """Writes index name (first part of the field name) and timestamp to TIFFTAG_IMAGEDESCRIPTION, and software to TIFFTAG_SOFTWARE."""
+    index_name = field.split('_')[0] # first part of index name
+    description = f"INDEX:{index_name}; TIMESTAMP:{timestamp}"
+    software_name = "Graphab (c) Foltete JC, Vuidel G, Clauzel C et al. Licensed under GNU GPL."
+    output_ds.SetMetadataItem("TIFFTAG_IMAGEDESCRIPTION", description)
+    output_ds.SetMetadataItem("TIFFTAG_SOFTWARE", software_name)
+    return description
+
+def create_band_stack(output_path, x_size, y_size, field_names, gdal_dtype, geotransform, projection, nodata_value, timestamp):
+    """
+    Creates one tiled GeoTIFF with one band per field (local indices of one Graphab project).
+    Band descriptions hold field names and band metadata hold index names (INDEX), used by postproc for statistics;
+    TIFFTAG_IMAGEDESCRIPTION lists all indices (INDEX:F,CF,BC; TIMESTAMP:...).
+    """
+    driver = gdal.GetDriverByName('GTiff')
+    output_ds = driver.Create(output_path, x_size, y_size, len(field_names), gdal_dtype, options=tiled_creation_options(gdal_dtype))
+    if output_ds is None:
+        raise RuntimeError(f"Could not create output TIFF {output_path}")
+
+    output_ds.SetGeoTransform(geotransform)
+    output_ds.SetProjection(projection)
+    for band_index, field in enumerate(field_names, start=1):
+        band = output_ds.GetRasterBand(band_index)
+        band.SetNoDataValue(nodata_value)
+        band.SetDescription(field)
+        band.SetMetadataItem("INDEX", field.split('_')[0])
+
+    set_index_metadata(output_ds, ",".join(field.split('_')[0] for field in field_names), timestamp)
+    return output_ds
+
+def load_attribute_table(layer, id_field, field_names):
+    """
+    Loads patch IDs and attribute fields of the layer as columnar arrays (geometries are not read).
+
+    Parameters:
+    layer (ogr.Layer): layer of patches.
+    id_field (str): field with patch IDs (values of patches.tif).
+    field_names (list): attribute fields to load.
+
+    Returns:
+    columns (dict): field name -> numpy array (float64, NaN for null values), including id_field.
+    """
+    layer.SetIgnoredFields(['OGR_GEOMETRY', 'OGR_STYLE'])
+    columns = {name: [] for name in [id_field] + field_names}
+    try:
+        if hasattr(layer, 'GetArrowStreamAsNumPy'): # GDAL >= 3.6: read record batches
+            for batch in layer.GetArrowStreamAsNumPy(options=['INCLUDE_FID=NO']):
+                for name in columns:
+                    columns[name].append(np.ma.filled(np.ma.asarray(batch[name], dtype=np.float64), np.nan))
+            columns = {name: np.concatenate(chunks) if chunks else np.zeros(0) for name, chunks in columns.items()}
+        else:
+            layer.ResetReading()
+            for feature in layer:
+                for name in columns:
+                    value = feature.GetField(name)
+                    columns[name].append(np.nan if value is None else value)
+            columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    finally:
+        layer.SetIgnoredFields([])
+        layer.ResetReading()
+    return columns
+
+def join_geopackage_lookup(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude_fields, id_field='Id', bands=False):
+    """
+    Joins each relevant field from the GeoPackage to the patch-ID raster (patches.tif) through lookup tables:
+    the attribute table is loaded once, one dense lookup vector (patch ID -> value) is built per field,
+    and every output is produced by gathering from the same patch IDs, block by block (instead of rasterising
+    the polygon layer for each field). If bands is True, fields are written to bands of one TIFF.
+    """
+    x_size, y_size = tif_ds.RasterXSize, tif_ds.RasterYSize
+    geotransform, projection = tif_ds.GetGeoTransform(), tif_ds.GetProjection()
+    patch_band = tif_ds.GetRasterBand(1)
+    nodata_value = patch_band.GetNoDataValue()
+    if nodata_value is None:
+        nodata_value = DEFAULT_NODATA
+
+    gpkg_ds = ogr.Open(gpkg_path)
+    if gpkg_ds is None:
+        print(f"Error: Could not open GeoPackage {gpkg_path}")
+        return
+    
+    timestamp = extract_timestamp_xml(gpkg_path) # extract timestamp
+    dtype = gdal_array.GDALTypeCodeToNumericTypeCode(gdal_dtype)
+    numeric_types = (ogr.OFTInteger, ogr.OFTInteger64, ogr.OFTReal)
+
+    for layer_index in range(gpkg_ds.GetLayerCount()):
+        layer = gpkg_ds.GetLayerByIndex(layer_index)
+        layer_defn = layer.GetLayerDefn()
+        if layer_defn.GetFieldIndex(id_field) < 0:
+            print(f"Error: Field '{id_field}' with patch IDs not found in {gpkg_path}")
+            continue
+        field_names = []
+        for field in get_relevant_fields(layer, exclude_fields):
+            if layer_defn.GetFieldDefn(layer_defn.GetFieldIndex(field)).GetType() in numeric_types:
+                field_names.append(field)
+            else:
+                print(f"Skipping non-numeric field: {field}")
+        if not field_names:
+            continue
+
+        # one dense lookup vector per field, with the same offset and size (one index array per block)
+        columns = load_attribute_table(layer, id_field, field_names)
+        ids = columns[id_field]
+        valid_ids = ~np.isnan(ids)
+        luts = []
+        for field in field_names:
+            valid = valid_ids & ~np.isnan(columns[field])
+            reclass_dict = dict(zip(ids[valid].astype(np.int64).tolist(), columns[field][valid].tolist()))
+            luts.append(ReclassLUT(reclass_dict, nodata_value, dtype))
+        luts = align_luts(luts)
+        print(f"Lookup tables built for {len(field_names)} fields and {int(valid_ids.sum())} patches")
+
+        outputs = []
+        stack_ds = None
+        if bands: # one band per field
+            stack_ds = create_band_stack(output_tif_path, x_size, y_size, field_names, gdal_dtype, geotransform, projection, nodata_value, timestamp)
+            for band_index, (field, lut) in enumerate(zip(field_names, luts), start=1):
+                outputs.append((field, output_tif_path, stack_ds, stack_ds.GetRasterBand(band_index), lut))
+        else:
+            for field, lut in zip(field_names, luts):
+                field_output_tif = output_tif_path.replace(".tif", f"_{field}.tif")
+                output_tif_ds, output_band = create_output_tiff(field_output_tif, x_size, y_size, gdal_dtype, geotransform, projection, nodata_value)
+                if output_tif_ds is None:
+                    continue
+                outputs.append((field, field_output_tif, output_tif_ds, output_band, lut))
+
+        # patch IDs are decoded once per block and gathered into every output
+        for xoff, yoff, xsize, ysize in iter_windows(patch_band):
+            index = luts[0].index(patch_band.ReadAsArray(xoff, yoff, xsize, ysize))
+            for _, _, _, output_band, lut in outputs:
+                output_band.WriteArray(lut.lut[index], xoff, yoff)
+
+        for field, field_output_tif, output_tif_ds, _, _ in outputs:
+            if not bands:
+                description = set_index_metadata(output_tif_ds, field, timestamp)
+                print(f"Metadata set: {description}")
+            print(f"Field '{field}' joined to {field_output_tif} through patch IDs.")
+            output_tif_ds.FlushCache()
+        outputs = None
+        stack_ds = None
+    
+    gpkg_ds = None
+
 def find_patch_files(base_path):
     """Searches for 'patches.tif' and 'patches.gpkg' in the directory tree."""
     patch_files = {}
@@ -141,6 +299,34 @@ def find_corridor_files(base_path):
     print(f"COrridor files are: {corridor_files}")
     return corridor_files
 
+def set_description_in_place(tif_path, description):
+    """
+    Sets TIFFTAG_IMAGEDESCRIPTION in the header of the GeoTIFF opened in update mode, without copying pixels.
+    PAM is disabled while the file is open, so the tag is written to the TIFF itself and no .aux.xml is created.
+
+    Parameters:
+    tif_path (str): path to the GeoTIFF.
+    description (str): metadata to set (INDEX:...; TIMESTAMP:...).
+
+    Returns:
+    bool: True if the tag was updated, False if it was already set.
+    """
+    pam_enabled = gdal.GetConfigOption('GDAL_PAM_ENABLED')
+    gdal.SetConfigOption('GDAL_PAM_ENABLED', 'NO')
+    try:
+        ds = gdal.Open(tif_path, gdal.GA_Update)
+        if ds is None:
+            raise FileNotFoundError(f"Could not open {tif_path}")
+        if ds.GetMetadataItem("TIFFTAG_IMAGEDESCRIPTION") == description:
+            ds = None
+            return False
+        ds.SetMetadataItem("TIFFTAG_IMAGEDESCRIPTION", description)
+        ds.FlushCache()
+        ds = None # the tag is written when the file is closed
+    finally:
+        gdal.SetConfigOption('GDAL_PAM_ENABLED', pam_enabled)
+    return True
+
 def assign_metadata_corridors(base_path, case_study):
     print("-" * 40)
     print(f"Assigning metadata for corridors in case study: {case_study}...")
@@ -149,13 +335,16 @@ def assign_metadata_corridors(base_path, case_study):
         print("No valid corridor TIFFs found.")
         return
 
+    timestamps = {}
     for folder_path, tif_paths in corridor_files.items():
         print(f"Folder path: {folder_path}")
         for tif_path in tif_paths:
             print(f"Corridor file: {tif_path}")
         
-            # Extract timestamp
-            timestamp = extract_timestamp_xml(tif_path)
+            # Extract timestamp (once per folder)
+            if folder_path not in timestamps:
+                timestamps[folder_path] = extract_timestamp_xml(tif_path)
+            timestamp = timestamps[folder_path]
 
             # Extract index_name
             filename = os.path.basename(tif_path)
@@ -170,47 +359,117 @@ def assign_metadata_corridors(base_path, case_study):
             # Prepare metadata
             description = f"INDEX:{index_name}; TIMESTAMP:{timestamp}"
 
-            # Open source dataset read-only
-            src_ds = gdal.Open(tif_path, gdal.GA_ReadOnly)
-            if src_ds is None:
-                print(f"Could not open {tif_path}")
+            # Update the header in place (pixels are not rewritten)
+            try:
+                changed = set_description_in_place(tif_path, description)
+            except (FileNotFoundError, RuntimeError) as e:
+                print(e)
                 continue
 
-            # Set metadata in-memory
-            src_ds.SetMetadataItem("TIFFTAG_IMAGEDESCRIPTION", description)
+            print(f"Metadata set: {description}" if changed else f"Metadata already set: {description}")
+    print("-" * 40)
 
-            # Write out to temporary path
-            tmp_path = tif_path.replace(".tif", "_tmp.tif")
-            gdal.Translate(
-                tmp_path,
-                src_ds
-            )
-            src_ds = None
+def join_project(folder, tif_path, gpkg_path, gdal_dtype, exclude_fields, lookup=False, bands=False):
+    """Joins attributes of patches.gpkg to patches.tif for one Graphab project folder."""
+    output_tif_path = os.path.join(folder, "output.tif")
 
-            # Replace original with updated version
-            os.replace(tmp_path, tif_path)
+    # open TIFF and get spatial properties
+    tif_ds, geotransform, projection, nodata_value = open_tiff(tif_path)
+    if tif_ds is None:
+        raise FileNotFoundError(f"Could not open TIFF file {tif_path}")
 
-            print(f"Metadata set: {description}")
-    print("-" * 40)
-# TODO - to remove intermediate tif.aux.xml
+    if lookup: # join attributes through patch IDs of patches.tif
+        join_geopackage_lookup(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude_fields, bands=bands)
+    else: # rasterise each attribute of GPKG with the separate
+        rasterize_geopackage(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude_fields, bands=bands)
+    tif_ds = None
 
-def join_wrapper(case_study, base_path, gdal_dtype, exclude_fields):
+def init_worker():
+    """Initialises GDAL/OGR once per worker process (drivers are registered once and reused for all project folders)."""
+    gdal.AllRegister()
+    ogr.RegisterAll()
+
+def run_join_job(job):
+    """
+    Joins one project folder in a worker process, printing to logs/join_gpkg2tif/{folder}.log.
+    Errors are caught and returned, so that one failing folder does not stop the batch.
+
+    Parameters:
+    job (dict): project folder, paths to patches.tif and patches.gpkg, data type, excluded fields, lookup and bands flags, log directory.
+
+    Returns:
+    result (dict): project folder, elapsed time and error (if any).
+    """
+    log_name = os.path.relpath(job['folder']).replace(os.sep, '_')
+    log_path = os.path.join(job['log_dir'], f"{log_name}.log")
+    result = {'folder': job['folder'], 'seconds': 0.0, 'error': None, 'log': log_path}
+
+    main_stdout = sys.stdout
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        sys.stdout = sys.stderr = log
+        try:
+            join_project(job['folder'], job['tif_path'], job['gpkg_path'], job['gdal_dtype'], job['exclude_fields'], job['lookup'], job['bands'])
+        except Exception as e:
+            traceback.print_exc()
+            result['error'] = str(e)
+        finally:
+            result['seconds'] = time.perf_counter() - start
+            sys.stdout = sys.stderr = main_stdout
+    return result
+
+def join_wrapper(case_study, base_path, gdal_dtype, exclude_fields, lookup=False, bands=False, workers=1):
     print(f"Running case study: {case_study}...")
     patch_files = find_patch_files(base_path)
     if not patch_files:
         print("No valid patches.tif and patches.gpkg pairs found.")
         return
 
-    for folder, (tif_path, gpkg_path) in patch_files.items():
-        output_tif_path = os.path.join(folder, "output.tif")
-
-        # open TIFF and get spatial properties
-        tif_ds, geotransform, projection, nodata_value = open_tiff(tif_path)
-        if tif_ds is None:
-            continue
-
-        # rasterise each attribute of GPKG with the separate
-        rasterize_geopackage(gpkg_path, tif_ds, output_tif_path, gdal_dtype, exclude_fields)
+    if workers <= 1: # sequential: failures are reported per project folder, as in the pool
+        failed = []
+        for folder, (tif_path, gpkg_path) in patch_files.items():
+            try:
+                join_project(folder, tif_path, gpkg_path, gdal_dtype, exclude_fields, lookup, bands)
+            except Exception as e:
+                traceback.print_exc()
+                print(f"{folder}: failed ({e})")
+                failed.append((folder, str(e)))
+        print(f"Project folders completed: {len(patch_files) - len(failed)}/{len(patch_files)}")
+        for folder, error in failed:
+            print(f"Failed: {folder}: {error}")
+    else: # one project folder per job
+        log_dir = os.path.join('logs', 'join_gpkg2tif')
+        os.makedirs(log_dir, exist_ok=True)
+        jobs = [
+            {
+                'folder': folder,
+                'tif_path': tif_path,
+                'gpkg_path': gpkg_path,
+                'gdal_dtype': gdal_dtype,
+                'exclude_fields': exclude_fields,
+                'lookup': lookup,
+                'bands': bands,
+                'log_dir': log_dir,
+            }
+            for folder, (tif_path, gpkg_path) in patch_files.items()
+        ]
+        print(f"Scheduled {len(jobs)} project folders on {workers} worker(s)")
+        sys.stdout.flush() # do not duplicate buffered logs in forked workers
+
+        start = time.perf_counter()
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = [executor.submit(run_join_job, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                status = f"failed ({result['error']}, see {result['log']})" if result['error'] else "done"
+                print(f"{result['folder']}: {status} in {result['seconds']:.2f} s")
+
+        failed = [r for r in results if r['error']]
+        print(f"Project folders completed: {len(results) - len(failed)}/{len(results)} in {time.perf_counter() - start:.2f} s")
+        for r in failed:
+            print(f"Failed: {r['folder']}: {r['error']}")
 
     print("Processing complete.")
     print("*" * 40)
@@ -231,6 +490,28 @@ def main():
     )
     """
 
+    parser.add_argument(
+        "--lookup",
+        action="store_true",
+        help="Join attributes through patch IDs of patches.tif (lookup tables) instead of rasterising patches.gpkg for each field"
+    )
+    parser.add_argument(
+        "--bands",
+        action="store_true",
+        help="Write all local indices of a Graphab project as bands of one output.tif instead of one output_<field>.tif per index"
+    )
+    parser.add_argument(
+        "--metadata-only",
+        action="store_true",
+        help="Only assign metadata to corridor TIFFs of the output tree (in place), without joining GeoPackages"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to join project folders in parallel (default 1, sequential)"
+    )
+
     # parsing the argument
     args = parser.parse_args()
 
@@ -239,7 +520,8 @@ def main():
 
     for case_study in args.case_studies:
         base_path = f"data/{case_study}/output"
-        join_wrapper(case_study, base_path, gdal_dtype, exclude_fields)
+        if not args.metadata_only:
+            join_wrapper(case_study, base_path, gdal_dtype, exclude_fields, lookup=args.lookup, bands=args.bands, workers=args.workers)
         assign_metadata_corridors(base_path, case_study)
         print("Processing complete.")
         print("*" * 40)
@@ -0,0 +1,261 @@
+#!/usr/bin/python
+
+# Lookup-table reclassification of LULC rasters (LULC code -> impedance).
+# The reclassification table is compiled once into a dense NumPy array and applied by fancy indexing,
+# so there is no Python call per pixel (as with np.vectorize(dict.get)).
+# Graphab and preprocessing run in separate Docker images, so this module is mirrored in
+# graphab/lut_reclass.py and preprocessing/src/lut_reclass.py: keep both copies identical.
+#
+# To benchmark against the previous np.isin + np.vectorize path:
+# python3 ./lut_reclass.py data/{case_study}/input/{habitat}_impedance/reclassification_{habitat}.csv
+
+import argparse
+import csv
+import logging
+import time
+import numpy as np
+
+NODATA_CODES = (-2147483647, -32768, 0) # minimum value for int32, int16 and 0 are always treated as nodata
+MAX_LUT_SIZE = 1 << 24 # safeguard against sparse tables with huge code ranges
+
+def is_missing(value) -> bool:
+    """Checks if a scalar value from a pandas/NumPy table is missing (None or NaN)."""
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+def load_reclass_csv(reclass_table: str, out_nodata) -> tuple[dict, bool]:
+    """Reads the reclassification table (lulc -> impedance) into a dictionary.
+
+    Parameters:
+    reclass_table (str): path to the CSV table with 'lulc', 'impedance' and 'type' columns.
+    out_nodata (int|float): nodata value of the output impedance raster.
+
+    Returns:
+    reclass_dict (dict): mapping between LULC codes and impedance values (nodata codes included).
+    has_decimal_values (bool): True if impedance values are decimal (Float32 output), False otherwise (Int32 output).
+    """
+    reclass_dict = {}
+
+    with open(reclass_table, 'r', encoding='utf-8-sig') as csvfile:
+        reader = csv.DictReader(csvfile)
+        reclass_list = list(reader)
+        has_decimal_values = any('.' in row['impedance'] for row in reclass_list)
+
+    for row in reclass_list:
+        try:
+            if not row['type'] or row['type'].strip().lower() in {'null', 'none'}:
+                continue
+            impedance_str = row['impedance'].strip()
+            impedance = (
+                float(impedance_str) if has_decimal_values else int(impedance_str)
+                if impedance_str else 666
+            )
+            reclass_dict[int(row['lulc'])] = impedance
+        except ValueError:
+            logging.error(f"Invalid data format in reclassification table: {row}")
+
+    nodata_value = float(out_nodata) if has_decimal_values else out_nodata
+    reclass_dict.update({code: nodata_value for code in NODATA_CODES})
+
+    return reclass_dict, has_decimal_values
+
+class ReclassLUT:
+    """Dense lookup table compiled from a reclassification dictionary.
+
+    Codes are shifted by `offset` (the smallest code with a valid value), so that LULC codes can be used directly as indices.
+    Codes mapped to nodata (e.g. -2147483647, -32768) do not widen the table: every code outside the table range
+    is classified as nodata, the same as codes missing from the reclassification table.
+    """
+
+    def __init__(self, reclass_dict: dict, nodata, dtype=None) -> None:
+        """
+        Parameters:
+        reclass_dict (dict): mapping between LULC codes and output values.
+        nodata (int|float): value assigned to codes missing from the table.
+        dtype (numpy dtype): output data type. If None, float32 is used for decimal values and int32 otherwise.
+        """
+        if dtype is None:
+            has_decimal = any(isinstance(value, float) for value in reclass_dict.values())
+            dtype = np.float32 if has_decimal else np.int32
+        self.dtype = np.dtype(dtype)
+        self.nodata = self.dtype.type(nodata)
+
+        codes = {int(code): value for code, value in reclass_dict.items() if value is not None and value != nodata}
+        if not codes:
+            self.offset = 0
+            self.lut = np.full(1, self.nodata, dtype=self.dtype)
+            return
+
+        self.offset = min(codes)
+        size = max(codes) - self.offset + 1
+        if size > MAX_LUT_SIZE:
+            raise ValueError(f"Range of LULC codes is too large for a lookup table: {self.offset}..{max(codes)}")
+
+        # the last slot is a sentinel for codes outside the table range
+        self.lut = np.full(size + 1, self.nodata, dtype=self.dtype)
+        for code, value in codes.items():
+            self.lut[code - self.offset] = value
+
+    @classmethod
+    def from_dict(cls, reclass_dict: dict, nodata, dtype=None) -> "ReclassLUT":
+        """Creates a lookup table from a dictionary read from a table (for example, with pandas),
+        skipping missing codes and values (None or NaN)."""
+        return cls({code: value for code, value in reclass_dict.items() if not is_missing(code) and not is_missing(value)}, nodata, dtype)
+
+    @classmethod
+    def from_array(cls, lut: np.ndarray, offset: int, nodata) -> "ReclassLUT":
+        """Creates a lookup table from a compiled array (the last slot must hold nodata)."""
+        table = cls.__new__(cls)
+        table.lut = lut
+        table.offset = offset
+        table.dtype = lut.dtype
+        table.nodata = lut.dtype.type(nodata)
+        return table
+
+    def reciprocal(self, nodata=None) -> "ReclassLUT":
+        """Returns the lookup table of 1/value (affinity from impedance), sharing the same offset.
+        Nodata and zero values are assigned with nodata."""
+        nodata = self.nodata if nodata is None else nodata
+        values = self.lut.astype(np.float32)
+        valid = (self.lut != self.nodata) & (self.lut != 0)
+        lut = np.full(values.shape, nodata, dtype=np.float32)
+        np.divide(1, values, out=lut, where=valid)
+        return ReclassLUT.from_array(lut, self.offset, nodata)
+
+    def index(self, data: np.ndarray) -> np.ndarray:
+        """Converts an array (or block) of LULC codes to positions in the lookup table.
+        The result can be shared by several tables compiled with the same offset and size."""
+        size = self.lut.size - 1
+        if np.issubdtype(data.dtype, np.floating):
+            invalid = ~np.isfinite(data)
+            index = np.where(invalid, self.offset, data).astype(np.int64)
+        else:
+            invalid = None
+            index = data.astype(np.int64)
+        index -= self.offset
+
+        outside = (index < 0) | (index >= size)
+        if invalid is not None:
+            outside |= invalid
+        index[outside] = size
+        return index
+
+    def apply(self, data: np.ndarray) -> np.ndarray:
+        """Reclassifies an array (or block) of LULC codes."""
+        return self.lut[self.index(data)]
+
+    def apply_with_reciprocal(self, data: np.ndarray, reciprocal: "ReclassLUT") -> tuple[np.ndarray, np.ndarray]:
+        """Reclassifies a block of LULC codes to impedance and affinity in the same pass (one index, two gathers)."""
+        index = self.index(data)
+        return self.lut[index], reciprocal.lut[index]
+
+def to_gdal_lut(lut: "ReclassLUT") -> str:
+    """Translates a lookup table into the <LUT> element of a GDAL VRT ComplexSource ("in:out,in:out,...").
+
+    GDAL interpolates linearly between LUT entries (and clamps outside them), so every run of consecutive codes
+    with the same value is written as a flat segment from code-0.49 to code+0.49. Integer codes never fall
+    between segments, and codes outside the table range are assigned with nodata.
+
+    Parameters:
+    lut (ReclassLUT): compiled lookup table.
+
+    Returns:
+    text (str): content of the <LUT> element.
+    """
+    values = lut.lut[:-1]
+    nodata = lut.nodata
+    first, last = lut.offset, lut.offset + values.size - 1
+    entries = [(np.iinfo(np.int32).min, nodata), (first - 0.51, nodata)]
+
+    start = 0
+    for i in range(1, values.size + 1):
+        if i == values.size or values[i] != values[start]:
+            entries.append((lut.offset + start - 0.49, values[start]))
+            entries.append((lut.offset + i - 1 + 0.49, values[start]))
+            start = i
+
+    entries += [(last + 0.51, nodata), (np.iinfo(np.int32).max, nodata)]
+    return ",".join(f"{round(float(code), 2)!r}:{str(value)}" for code, value in entries)
+
+def align_luts(luts: list) -> list:
+    """Re-compiles lookup tables with a common offset and size, so that one index array
+    (computed once per LULC block) can be gathered into every table.
+
+    Parameters:
+    luts (list): lookup tables (ReclassLUT), for example one per habitat.
+
+    Returns:
+    aligned (list): lookup tables with the same offset and size, in the same order.
+    """
+    offset = min(lut.offset for lut in luts)
+    end = max(lut.offset + lut.lut.size - 1 for lut in luts) # excluding sentinel slots
+    aligned = []
+    for lut in luts:
+        values = np.full(end - offset + 1, lut.nodata, dtype=lut.dtype)
+        start = lut.offset - offset
+        values[start:start + lut.lut.size - 1] = lut.lut[:-1]
+        aligned.append(ReclassLUT.from_array(values, offset, lut.nodata))
+    return aligned
+
+def reclassify_vectorize(data: np.ndarray, reclass_dict: dict, nodata, has_decimal_values: bool) -> np.ndarray:
+    """Previous reclassification path (np.isin + np.vectorize), kept as a reference for benchmarking."""
+    return np.where(
+        np.isin(data, list(reclass_dict.keys())),
+        np.vectorize(reclass_dict.get, otypes=[float if has_decimal_values else int])(data),
+        float(nodata) if has_decimal_values else nodata
+    )
+
+def benchmark(reclass_table: str, out_nodata=9999, size: int = 2000, repeat: int = 3) -> dict:
+    """Compares the lookup table against the np.vectorize path on a synthetic LULC array.
+
+    Parameters:
+    reclass_table (str): path to the reclassification table.
+    out_nodata (int|float): nodata value of the output impedance raster.
+    size (int): number of rows and columns of the synthetic LULC array.
+    repeat (int): number of runs (the best run is reported).
+
+    Returns:
+    results (dict): best timings (in seconds) and speed-up.
+    """
+    reclass_dict, has_decimal_values = load_reclass_csv(reclass_table, out_nodata)
+    codes = np.array([code for code in reclass_dict.keys()] + [-1], dtype=np.int32) # -1 is not in the table
+    rng = np.random.default_rng(0)
+    data = rng.choice(codes, size=(size, size))
+
+    lut = ReclassLUT(reclass_dict, out_nodata)
+    expected = reclassify_vectorize(data, reclass_dict, out_nodata, has_decimal_values)
+    if not np.allclose(lut.apply(data), expected):
+        raise AssertionError("Lookup table and np.vectorize results differ.")
+
+    timings = {}
+    for name, func in (
+        ('vectorize', lambda: reclassify_vectorize(data, reclass_dict, out_nodata, has_decimal_values)),
+        ('lut', lambda: lut.apply(data)),
+    ):
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+        timings[name] = min(runs)
+
+    megapixels = data.size / 1e6
+    results = {
+        'megapixels': megapixels,
+        'vectorize_s': timings['vectorize'],
+        'lut_s': timings['lut'],
+        'speedup': timings['vectorize'] / timings['lut'],
+    }
+    print(f"Synthetic LULC: {size}x{size} ({megapixels:.1f} Mpx)")
+    print(f"np.vectorize: {timings['vectorize']:.3f} s ({megapixels / timings['vectorize']:.1f} Mpx/s)")
+    print(f"Lookup table: {timings['lut']:.3f} s ({megapixels / timings['lut']:.1f} Mpx/s)")
+    print(f"Speed-up: {results['speedup']:.1f}x")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark lookup-table reclassification against np.vectorize.")
+    parser.add_argument("reclass_table", type=str, help="Path to the reclassification table (CSV)")
+    parser.add_argument("--size", type=int, default=2000, help="Number of rows and columns of the synthetic LULC array")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs")
+    args = parser.parse_args()
+
+    benchmark(args.reclass_table, size=args.size, repeat=args.repeat)
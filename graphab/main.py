@@ -33,7 +33,7 @@ if __name__ == "__main__":
     # 0. minio-reader
     print("READING MinIO...")
     timer.start()
-    os.system(f"python3 minio_reader.py --bucket_name {bucket_name} --ext_bucket_name {ext_bucket_name} --skip-existing-files --verbose")
+    os.system(f"python3 minio_reader.py --bucket_name {bucket_name} --ext_bucket_name {ext_bucket_name} --skip-existing-files --sync --verbose")
     timer.print_elapsed()
     
     # 1. impedance_csv2tif.py
@@ -89,7 +89,7 @@ if __name__ == "__main__":
     print("UPDATING MinIO...")
     bucket_name = "pilot.2.graphab"  # Replace with your bucket name
     timer.start()
-    os.system(f"python3 ./minio_uploader.py --bucket_name {bucket_name} --input_dir {input_dir}")
+    os.system(f"python3 ./minio_uploader.py --bucket_name {bucket_name} --input_dir {input_dir} --sync")
     timer.print_elapsed()
 
     print ("*" * 60)
@@ -6,6 +6,8 @@ import os
 
 load_dotenv()  # take environment variables
 
+MAX_POOL_CONNECTIONS = 8 # connections kept open to the server (one per download thread)
+
 class MinioClient:
     def __init__(self):
         self.access_key = os.getenv("MINIO_ACCESS_KEY")
@@ -23,6 +25,7 @@ class MinioClient:
                         secret_key=self.secret_key,
                         http_client=PoolManager(
                                 timeout=10,
+                                maxsize=MAX_POOL_CONNECTIONS,
                                 retries=Retry(
                                         total=2,
                                         backoff_factor=0.2,
@@ -1,13 +1,17 @@
 import argparse
 from minio.error import S3Error, InvalidResponseError, ServerError
 from dotenv import load_dotenv
-from minio_client import MinioClient
+from minio_client import MinioClient, MAX_POOL_CONNECTIONS
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import sys
+import threading
+import time
 
-print("Logs are redirected to /logs")
-sys.stdout = open('logs/minio_reader.log', 'w') #to log
-sys.stderr = sys.stdout
+DOWNLOAD_WORKERS = MAX_POOL_CONNECTIONS # threads downloading objects (or parts of large objects) concurrently
+MULTIPART_THRESHOLD = 64 * 1024 * 1024 # objects larger than this are downloaded by ranges (bytes)
+PART_SIZE = 16 * 1024 * 1024 # size of ranges of large objects (bytes)
+CHUNK_SIZE = 1024 * 1024 # size of chunks streamed to disk (bytes)
 
 class MinioReader(MinioClient):
     def __init__(self):
@@ -45,10 +49,174 @@ class MinioReader(MinioClient):
         except Exception as err:
             print(f"An unexpected error occurred: {err}")
      
+    @staticmethod
+    def get_local_path(data_dir: str, object_name: str) -> str:
+        """
+        Returns the local path of an object: the object name (with its folders) under the local directory.
+
+        Args:
+            data_dir (str): The local directory.
+            object_name (str): The name of the object (for example, 'case_study/input/lulc/lulc_2022.tif').
+
+        Returns:
+            str: The local path of the object.
+        """
+        return os.path.join(data_dir, *object_name.split("/"))
+
+    @staticmethod
+    def is_identical(local_path: str, obj) -> bool:
+        """
+        This method checks if the local copy of an object can be kept: it has the same size
+        and it is not older than the object in the bucket.
+
+        Args:
+            local_path (str): The local path of the object.
+            obj (Object): The object listed from the bucket.
+
+        Returns:
+            bool: True if the local copy is identical, False if the object has to be downloaded.
+        """
+        if not os.path.isfile(local_path):
+            return False
+        stat = os.stat(local_path)
+        if stat.st_size != obj.size:
+            return False
+        return obj.last_modified is None or stat.st_mtime >= obj.last_modified.timestamp()
+
+    @staticmethod
+    def remove_partial(tmp_path: str) -> None:
+        """Removes a temporary '.part' file, if it exists."""
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def download_range(self, bucket_name: str, object_name: str, tmp_path: str, offset: int, length: int) -> int:
+        """
+        This method downloads a range of an object and writes it at the same offset of the (preallocated) local file.
+
+        Args:
+            bucket_name (str): The name of the bucket to read from.
+            object_name (str): The name of the object.
+            tmp_path (str): The local file to write to (preallocated to the size of the object, see preallocate).
+            offset (int): The first byte of the range.
+            length (int): The number of bytes of the range (0 for the whole object).
+
+        Returns:
+            int: The number of bytes written.
+        """
+        response = self.client.get_object(bucket_name, object_name, offset=offset, length=length)
+        written = 0
+        try:
+            with open(tmp_path, "r+b") as f:
+                f.seek(offset)
+                for chunk in response.stream(CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+        if length and written != length:
+            raise IOError(f"Range {offset}-{offset + length} of {object_name}: {written} bytes received instead of {length}")
+        return written
+
+    def download_objects(self, bucket_name: str, objects, data_dir: str, skip_existing: bool = False, verbose: bool = True,
+                         workers: int = DOWNLOAD_WORKERS, part_size: int = PART_SIZE) -> list:
+        """
+        This method downloads objects with a bounded pool of threads. Objects larger than MULTIPART_THRESHOLD are split
+        into ranges downloaded concurrently; each object is written to a temporary '.part' file (created and preallocated
+        when its first range starts) and moved to its local path when all its ranges are complete. '.part' files left by
+        previous runs are removed, and so are those of objects that fail (or are interrupted). The number of objects,
+        bytes and throughput are reported.
+
+        Args:
+            bucket_name (str): The name of the bucket to read from.
+            objects (iterable): The objects listed from the bucket.
+            data_dir (str): The local directory to save the objects to.
+            skip_existing (bool): Whether to skip objects whose local copy is identical (same size, not older).
+            verbose (bool): Whether to print verbose output.
+            workers (int): The number of threads.
+            part_size (int): The size of ranges of large objects (bytes).
+
+        Returns:
+            list: The names of the objects that failed to download.
+        """
+        start = time.perf_counter()
+        parts = [] # (object, local path, temporary path, offset, length)
+        remaining = {} # number of ranges not completed yet, by object
+        received = {} # bytes received, by object
+        skipped = 0
+        for obj in objects:
+            if obj.is_dir:
+                continue
+            local_path = self.get_local_path(data_dir, obj.object_name)
+            self.remove_partial(local_path + ".part") # left by an interrupted run
+            if skip_existing and self.is_identical(local_path, obj):
+                skipped += 1
+                continue
+            if obj.size > MULTIPART_THRESHOLD:
+                ranges = [(offset, min(part_size, obj.size - offset)) for offset in range(0, obj.size, part_size)]
+            else:
+                ranges = [(0, 0)] # whole object in one request
+            remaining[obj.object_name] = len(ranges)
+            received[obj.object_name] = 0
+            parts.extend((obj, local_path, local_path + ".part", offset, length) for offset, length in ranges)
+
+        lock = threading.Lock()
+        created = set() # temporary files preallocated so far
+
+        def download_part(obj, tmp_path: str, offset: int, length: int) -> int:
+            with lock: # the first range of an object creates its temporary file
+                if tmp_path not in created:
+                    os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+                    with open(tmp_path, "wb") as f:
+                        f.truncate(obj.size) # preallocate, so ranges can be written in any order
+                    created.add(tmp_path)
+            return self.download_range(bucket_name, obj.object_name, tmp_path, offset, length)
+
+        failed = set()
+        downloaded = 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(download_part, obj, tmp_path, offset, length): (obj, local_path, tmp_path)
+                    for obj, local_path, tmp_path, offset, length in parts
+                }
+                for future in as_completed(futures):
+                    obj, local_path, tmp_path = futures[future]
+                    name = obj.object_name
+                    try:
+                        received[name] += future.result()
+                    except Exception as err:
+                        print(f"An unexpected error occurred while downloading {name}: {err}")
+                        failed.add(name)
+                    remaining[name] -= 1
+                    if remaining[name] > 0:
+                        continue
+                    if name in failed or received[name] != obj.size:
+                        failed.add(name)
+                        self.remove_partial(tmp_path)
+                        continue
+                    os.replace(tmp_path, local_path)
+                    downloaded += 1
+                    if verbose:
+                        print(f"Object {name} downloaded to {local_path}")
+        finally: # interrupted: temporary files of objects not completed are removed
+            for obj, _, tmp_path, _, _ in parts:
+                if remaining[obj.object_name] > 0:
+                    self.remove_partial(tmp_path)
+
+        seconds = time.perf_counter() - start
+        total_mb = sum(received.values()) / (1024 * 1024)
+        print(f"Downloaded {downloaded} objects ({total_mb:.1f} MB) from {bucket_name} in {seconds:.2f} s "
+              f"({total_mb / seconds if seconds > 0 else 0:.1f} MB/s, {workers} threads), "
+              f"{skipped} identical skipped, {len(failed)} failed")
+        return sorted(failed)
+
     def save_object_locally(self, bucket_name:str, object_name:str, data_dir:str, skip_existing:bool=False, verbose:bool=True):
         """
-        This method downloads an object from a specified bucket and saves it to a local directory.
-        It creates the directory if it doesn't exist and skips downloading if the file already exists.
+        This method downloads an object from a specified bucket and saves it to a local directory
+        (under the same folders as in the bucket). It skips downloading if the local copy is identical.
 
         Args:
             bucket_name (str): The name of the bucket to read from.
@@ -58,24 +226,12 @@ class MinioReader(MinioClient):
             verbose (bool): Whether to print verbose output.
 
         Returns:
-            str: The name of the object that was saved.
+            str: The name of the object if it failed to download, None otherwise.
         """
         try:
-            # extract internal path from the object name
-            # previous version:
-            # internal_path = os.path.join(data_dir,*object_name.split("/")[1:-1])
-            internal_path = os.path.join(data_dir, object_name)
-            file_name = object_name.split("/")[-1]
-            # if the file already exists, skip downloading
-            if skip_existing:
-                    if os.path.exists(os.path.join(internal_path, file_name)):
-                            return None
-            # create the directory if it doesn't exist
-            os.makedirs(internal_path, exist_ok=True)
-            # download the object to the specified directory
-            self.client.fget_object(bucket_name, object_name, internal_path + "/" + file_name)
-            if verbose:
-                print(f"Object {object_name} downloaded to {data_dir}")
+            obj = self.client.stat_object(bucket_name, object_name)
+            failed = self.download_objects(bucket_name, [obj], data_dir, skip_existing, verbose, workers=1)
+            return failed[0] if failed else None
         except Exception as err:
             print(f"An unexpected error occurred: {err}")
             return object_name
@@ -102,7 +258,7 @@ class MinioReader(MinioClient):
         print(f"Folders with external data in bucket are: {folders}")
         return list(folders)  # convert set back to list
         
-    def save_all_objects_from_bucket(self, bucket_name:str, skip_existing_files:bool=False, verbose:bool=False):
+    def save_all_objects_from_bucket(self, bucket_name:str, skip_existing_files:bool=False, verbose:bool=False, workers:int=DOWNLOAD_WORKERS):
         """
         Save all objects from a bucket to a local directory.
 
@@ -110,21 +266,16 @@ class MinioReader(MinioClient):
             bucket_name (str): The name of the bucket to read from.
             skip_existing_files (bool): Whether to skip downloading existing files.
             verbose (bool): Whether to print verbose output.
+            workers (int): The number of download threads.
         
         Returns:
             list: A list of failed files (if any).
         """
-        # Iterate through the objects in the bucket and print their names
-        bucket_objects = self.read_bucket(bucket_name)
-        objects = []
-        failed_files = []
-        for obj in bucket_objects:
-            objects.append(obj.object_name)
-            failed_files.append(self.save_object_locally(bucket_name,obj.object_name, "data", skip_existing_files, verbose))
-        print(f"Objects to save from bucket are: {objects}")
-        return failed_files
+        bucket_objects = list(self.read_bucket(bucket_name) or [])
+        print(f"Objects to save from bucket are: {[obj.object_name for obj in bucket_objects]}")
+        return self.download_objects(bucket_name, bucket_objects, "data", skip_existing_files, verbose, workers)
 
-    def save_selected_folders_from_bucket(self, bucket_name: str, folders: list[str], skip_existing_files: bool = False, verbose: bool =True):
+    def save_selected_folders_from_bucket(self, bucket_name: str, folders: list[str], skip_existing_files: bool = False, verbose: bool =True, workers: int = DOWNLOAD_WORKERS):
         """
         Save only selected folders from an EXTERNAL bucket to a local directory ('bucket_ext', hardcoded).
 
@@ -133,38 +284,36 @@ class MinioReader(MinioClient):
             folders (list of str): List of folder name prefixes to download.
             skip_existing_files (bool): Whether to skip downloading existing files.
             verbose (bool): Whether to print verbose output.
+            workers (int): The number of download threads.
 
         Returns:
             list: A list of failed files (if any).
         """
-        bucket_objects = self.read_bucket(bucket_name)
-        objects = []
-        failed_files = []
+        bucket_objects = self.read_bucket(bucket_name) or []
         local_dir = 'bucket_ext'
-
-        for obj in bucket_objects:
-            object_name = obj.object_name
-            if any(object_name.startswith(folder.rstrip('/') + '/') for folder in folders): # filter by needed folders
-                if verbose:
-                    print(f"Downloading object: {object_name}")
-                
-                objects.append(object_name)
-                failed_files.append(
-                    self.save_object_locally(bucket_name, object_name, local_dir, skip_existing_files, verbose)
-                )
+        selected = [
+            obj for obj in bucket_objects
+            if any(obj.object_name.startswith(folder.rstrip('/') + '/') for folder in folders) # filter by needed folders
+        ]
 
         if verbose:
-            print(f"Objects to save from external bucket are: {objects}")
-        return failed_files
+            print(f"Objects to save from external bucket are: {[obj.object_name for obj in selected]}")
+        return self.download_objects(bucket_name, selected, local_dir, skip_existing_files, verbose, workers)
 
 # testing
 if __name__ == "__main__":
+    print("Logs are redirected to /logs")
+    sys.stdout = open('logs/minio_reader.log', 'w') #to log
+    sys.stderr = sys.stdout
+
     # Example usage python minio-reader.py <bucket_name> -skip-existing-files -verbose
     parser = argparse.ArgumentParser(description="Minio Reader Script")
     parser.add_argument("--bucket_name", type=str, help="Name of the bucket to read from Graphab data")
     parser.add_argument("--ext_bucket_name", type=str, help="Name of the bucket to read from external data")
     parser.add_argument("--skip-existing-files", action="store_true", help="Skip downloading existing files")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument("--sync", action="store_true", help="Download only objects changed since the last sync of Graphab data (manifest-based, see minio_sync.py)")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS, help=f"Number of download threads (default {DOWNLOAD_WORKERS})")
     args = parser.parse_args()
 
     bucket_name = args.bucket_name
@@ -175,7 +324,11 @@ if __name__ == "__main__":
     minio_reader = MinioReader()
     print(minio_reader.client)  # This will print the Minio client object if created successfully.
     # read all objects from the bucket
-    failed_files = minio_reader.save_all_objects_from_bucket(bucket_name, skip_existing_files, verbose)
+    if args.sync:
+        from minio_sync import MinioSync # imported here: minio_sync extends MinioReader
+        failed_files = MinioSync().sync(bucket_name, "data", direction="pull", workers=args.workers).get("failed", [])
+    else:
+        failed_files = minio_reader.save_all_objects_from_bucket(bucket_name, skip_existing_files, verbose, args.workers)
     # print failed files
     for file in failed_files:
         if file is not None:
@@ -183,8 +336,8 @@ if __name__ == "__main__":
 
     # read all objects from external data (MiraMon)
     folders = minio_reader.get_ICT_folders_from_bucket(ext_bucket_name)
-    failed_files_ext = minio_reader.save_selected_folders_from_bucket(ext_bucket_name, folders=folders, skip_existing_files=skip_existing_files, verbose=verbose)
+    failed_files_ext = minio_reader.save_selected_folders_from_bucket(ext_bucket_name, folders=folders, skip_existing_files=skip_existing_files, verbose=verbose, workers=args.workers)
     # print failed files
-    for file in failed_files:
+    for file in failed_files_ext:
         if file is not None:
             print("Failed to download", file)
\ No newline at end of file
@@ -0,0 +1,331 @@
+# minio_sync.py - synchronisation of a local directory with a MinIO bucket (like rsync for the bucket)
+# A local manifest (JSON) records, for every object key synchronised before: ETag and size of the object,
+# size and mtime of the local file and its content hash (MD5: the ETag of objects uploaded in one part,
+# computed from the local file after the transfer for multipart ETags).
+# Each run lists the bucket once and compares the listing and the local files (os.stat only) with the manifest:
+# - changed in the bucket only -> download
+# - changed locally only -> upload (local files are hashed only if their size or mtime changed)
+# - deleted on one side after the last sync -> deleted on the other side (only with delete=True)
+# - changed on both sides -> the newer copy wins ('both') or the side given by the direction ('pull'/'push')
+# A repeat run with nothing changed only makes one listing call.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from minio.error import S3Error
+from minio_reader import MinioReader, DOWNLOAD_WORKERS
+
+MANIFEST_DIR = "sync_manifests" # local manifests, outside of the synchronised directories
+DIRECTIONS = ("pull", "push", "both")
+
+def md5_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """Returns the MD5 hash of a file (the ETag of objects uploaded in one part)."""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_etag(etag) -> str | None:
+    """Returns the ETag without quotes."""
+    return etag.strip('"') if etag else None
+
+class MinioSync(MinioReader):
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def get_manifest_path(bucket_name: str, local_root: str, scope: str) -> str:
+        """
+        Returns the path to the manifest of a synchronised pair (bucket and local directory).
+
+        Args:
+            bucket_name (str): The name of the bucket.
+            local_root (str): The local directory matching the root of the bucket.
+            scope (str): The prefix of object keys (and subdirectory of local_root) to synchronise.
+
+        Returns:
+            str: The path to the manifest.
+        """
+        name = "_".join(part for part in (bucket_name, os.path.normpath(local_root), scope.strip("/")) if part and part != ".")
+        return os.path.join(MANIFEST_DIR, name.replace(os.sep, "_").replace("/", "_") + ".json")
+
+    @staticmethod
+    def list_local(local_root: str, scope: str, ignore_folders: list) -> dict:
+        """
+        Lists local files under the scope, by object key (path relative to local_root, with '/' separators).
+
+        Args:
+            local_root (str): The local directory matching the root of the bucket.
+            scope (str): The prefix of object keys (and subdirectory of local_root).
+            ignore_folders (list): Names of directories to ignore.
+
+        Returns:
+            dict: Object key -> os.stat_result of the local file.
+        """
+        files = {}
+        for root, dirs, names in os.walk(os.path.join(local_root, scope)):
+            dirs[:] = [d for d in dirs if d not in ignore_folders]
+            for name in names:
+                if name.endswith(".part"): # incomplete downloads
+                    continue
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, local_root).replace(os.sep, "/")
+                files[key] = os.stat(path)
+        return files
+
+    def list_remote(self, bucket_name: str, scope: str, create: bool) -> dict:
+        """
+        Lists objects under the scope with one listing call (the bucket is created if needed and allowed).
+
+        Args:
+            bucket_name (str): The name of the bucket.
+            scope (str): The prefix of object keys.
+            create (bool): Whether to create the bucket if it does not exist.
+
+        Returns:
+            dict: Object key -> object.
+        """
+        try:
+            return {
+                obj.object_name: obj
+                for obj in self.client.list_objects(bucket_name, prefix=scope + "/" if scope else None, recursive=True)
+                if not obj.is_dir
+            }
+        except S3Error as err:
+            if err.code != "NoSuchBucket" or not create:
+                raise
+            self.client.make_bucket(bucket_name)
+            print("Created bucket", bucket_name)
+            return {}
+
+    def upload_object(self, bucket_name: str, key: str, local_path: str) -> str:
+        """
+        Uploads a local file as an object.
+
+        Args:
+            bucket_name (str): The name of the bucket.
+            key (str): The object key.
+            local_path (str): The local file.
+
+        Returns:
+            str: The ETag of the uploaded object.
+        """
+        result = self.client.fput_object(bucket_name, key, local_path)
+        return normalize_etag(result.etag)
+
+    def plan(self, remote: dict, local: dict, manifest: dict, local_root: str, direction: str, delete: bool) -> dict:
+        """
+        Computes the minimal set of transfers from the listing, local files and manifest.
+
+        Args:
+            remote (dict): Object key -> object (listing of the bucket).
+            local (dict): Object key -> os.stat_result of the local file.
+            manifest (dict): Object key -> entry of the last synchronisation (updated for files found in sync).
+            local_root (str): The local directory matching the root of the bucket.
+            direction (str): 'pull' (bucket to local), 'push' (local to bucket) or 'both'.
+            delete (bool): Whether to propagate deletions.
+
+        Returns:
+            dict: Lists of object keys to 'download', 'upload', 'delete_remote', 'delete_local', and 'conflicts'.
+        """
+        pull, push = direction in ("pull", "both"), direction in ("push", "both")
+        actions = {"download": [], "upload": [], "delete_remote": [], "delete_local": [], "conflicts": []}
+
+        for key in sorted(set(remote) | set(local)):
+            entry = manifest.get(key)
+            obj, stat = remote.get(key), local.get(key)
+
+            if obj is not None and stat is not None:
+                remote_changed = entry is None or normalize_etag(obj.etag) != entry.get("etag")
+                local_changed = entry is None or (stat.st_size, stat.st_mtime_ns) != (entry.get("local_size"), entry.get("local_mtime_ns"))
+                if local_changed: # size or mtime changed: compare content
+                    local_path = self.get_local_path(local_root, key)
+                    local_hash = md5_hash(local_path)
+                    etag = normalize_etag(obj.etag) or ""
+                    if entry is not None and local_hash == entry.get("md5"): # only touched: record the new size and mtime
+                        local_changed = False
+                        manifest[key] = {**entry, "local_size": stat.st_size, "local_mtime_ns": stat.st_mtime_ns}
+                    elif entry is None and (local_hash == etag or ("-" in etag and self.is_identical(local_path, obj))):
+                        # same content, not synchronised before (multipart ETags are not the MD5: same size and not older)
+                        remote_changed = local_changed = False
+                        manifest[key] = self.manifest_entry(obj.etag, obj.size, local_path, local_hash)
+                if not remote_changed and not local_changed:
+                    continue
+                if remote_changed and local_changed:
+                    if entry is not None: # both changed since the last sync (otherwise, not synchronised before)
+                        actions["conflicts"].append(key)
+                    if direction == "both": # newer copy wins
+                        newer_remote = obj.last_modified is not None and obj.last_modified.timestamp() > stat.st_mtime
+                        actions["download" if newer_remote else "upload"].append(key)
+                    else:
+                        actions["download" if pull else "upload"].append(key)
+                elif remote_changed and pull:
+                    actions["download"].append(key)
+                elif local_changed and push:
+                    actions["upload"].append(key)
+
+            elif obj is not None: # only in the bucket
+                if entry is not None and delete and push and normalize_etag(obj.etag) == entry.get("etag"):
+                    actions["delete_remote"].append(key) # deleted locally after the last sync
+                elif pull:
+                    actions["download"].append(key)
+
+            else: # only local
+                if entry is not None and delete and pull and (stat.st_size, stat.st_mtime_ns) == (entry.get("local_size"), entry.get("local_mtime_ns")):
+                    actions["delete_local"].append(key) # deleted in the bucket after the last sync
+                elif push:
+                    actions["upload"].append(key)
+
+        # keys deleted on both sides are forgotten
+        for key in set(manifest) - set(remote) - set(local):
+            manifest.pop(key)
+        return actions
+
+    @staticmethod
+    def manifest_entry(etag, size: int, local_path: str, md5: str = None) -> dict:
+        """Returns the manifest entry of an object in sync with its local file. The MD5 of the content is the ETag
+        of objects uploaded in one part; for multipart ETags ('-') it is computed from the local file, so that a later
+        change of mtime alone does not trigger a transfer."""
+        etag = normalize_etag(etag)
+        if md5 is None:
+            md5 = etag if etag and "-" not in etag else md5_hash(local_path)
+        stat = os.stat(local_path)
+        return {
+            "etag": etag,
+            "size": size,
+            "local_size": stat.st_size,
+            "local_mtime_ns": stat.st_mtime_ns,
+            "md5": md5,
+            "synced_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def sync(self, bucket_name: str, local_root: str, scope: str = "", direction: str = "both", delete: bool = False,
+             ignore_folders: list = None, workers: int = DOWNLOAD_WORKERS, dry_run: bool = False) -> dict:
+        """
+        Synchronises a local directory with a bucket, transferring only new or changed files.
+
+        Args:
+            bucket_name (str): The name of the bucket.
+            local_root (str): The local directory matching the root of the bucket (object key = path relative to it).
+            scope (str): The prefix of object keys (and subdirectory of local_root) to synchronise ('' for all).
+            direction (str): 'pull' (bucket to local), 'push' (local to bucket) or 'both'.
+            delete (bool): Whether to propagate deletions since the last sync.
+            ignore_folders (list): Names of local directories to ignore.
+            workers (int): The number of transfer threads.
+            dry_run (bool): Whether to only print the planned transfers.
+
+        Returns:
+            dict: The planned actions (object keys) and the keys that failed.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction: {direction}. Available directions: {', '.join(DIRECTIONS)}")
+        start = time.perf_counter()
+        scope = os.path.normpath(scope).replace(os.sep, "/").strip("/") if scope else ""
+        if scope == ".":
+            scope = ""
+        manifest_path = self.get_manifest_path(bucket_name, local_root, scope)
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+        remote = self.list_remote(bucket_name, scope, create=direction != "pull")
+        local = self.list_local(local_root, scope, ignore_folders or [])
+        actions = self.plan(remote, local, manifest, local_root, direction, delete)
+        print(f"Sync {local_root}/{scope} <-> {bucket_name}/{scope} ({direction}): {len(remote)} objects, {len(local)} local files, "
+              + ", ".join(f"{len(keys)} {name.replace('_', ' ')}" for name, keys in actions.items()))
+        for key in actions["conflicts"]:
+            print(f"Changed on both sides: {key}")
+        if dry_run:
+            return actions
+
+        failed = []
+        # downloads: concurrent (ranged for large objects), then recorded with the listed ETag
+        if actions["download"]:
+            failed_downloads = set(self.download_objects(
+                bucket_name, [remote[key] for key in actions["download"]], local_root, verbose=False, workers=workers
+            ))
+            for key in actions["download"]:
+                if key in failed_downloads:
+                    continue
+                manifest[key] = self.manifest_entry(remote[key].etag, remote[key].size, self.get_local_path(local_root, key))
+            failed.extend(failed_downloads)
+
+        # uploads: concurrent, recorded with the ETag returned by the server (and the MD5 of the uploaded file)
+        uploaded, uploaded_bytes = 0, 0
+        if actions["upload"]:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(self.upload_object, bucket_name, key, self.get_local_path(local_root, key)): key
+                    for key in actions["upload"]
+                }
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        etag = future.result()
+                    except Exception as err:
+                        print(f"Error uploading {key}: {err}")
+                        failed.append(key)
+                        continue
+                    local_path = self.get_local_path(local_root, key)
+                    manifest[key] = self.manifest_entry(etag, os.path.getsize(local_path), local_path)
+                    uploaded += 1
+                    uploaded_bytes += manifest[key]["size"]
+            print(f"Uploaded {uploaded} files ({uploaded_bytes / (1024 * 1024):.1f} MB)")
+
+        for key in actions["delete_remote"]:
+            try:
+                self.client.remove_object(bucket_name, key)
+                manifest.pop(key, None)
+                print(f"Deleted object {key}")
+            except S3Error as err:
+                print(f"Error deleting object {key}: {err}")
+                failed.append(key)
+        for key in actions["delete_local"]:
+            try:
+                os.remove(self.get_local_path(local_root, key))
+            except FileNotFoundError: # already deleted
+                pass
+            except OSError as err:
+                print(f"Error deleting local file {key}: {err}")
+                failed.append(key)
+                continue
+            manifest.pop(key, None)
+            print(f"Deleted local file {key}")
+
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+        print(f"Sync completed in {time.perf_counter() - start:.2f} s, {len(failed)} failed")
+        actions["failed"] = sorted(failed)
+        return actions
+
+if __name__ == "__main__":
+    print("Logs are redirected to /logs")
+    sys.stdout = open('logs/minio_sync.log', 'w') #to log
+    sys.stderr = sys.stdout
+
+    parser = argparse.ArgumentParser(description="Synchronise a local directory with a MinIO bucket")
+    parser.add_argument("--bucket_name", required=True, help="Name of the MinIO bucket")
+    parser.add_argument("--local_root", default="data", help="Local directory matching the root of the bucket (default 'data')")
+    parser.add_argument("--scope", default="", help="Prefix of object keys (and subdirectory of local_root) to synchronise")
+    parser.add_argument("--direction", choices=DIRECTIONS, default="both", help="pull (bucket to local), push (local to bucket) or both (default)")
+    parser.add_argument("--delete", action="store_true", help="Propagate deletions since the last sync")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS, help=f"Number of transfer threads (default {DOWNLOAD_WORKERS})")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the planned transfers")
+    args = parser.parse_args()
+
+    minio_sync = MinioSync()
+    result = minio_sync.sync(args.bucket_name, args.local_root, args.scope, args.direction, args.delete, workers=args.workers, dry_run=args.dry_run)
+    for key in result.get("failed", []):
+        print("Failed to synchronise", key)
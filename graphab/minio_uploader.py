@@ -126,6 +126,8 @@ if __name__ == "__main__":
         parser = argparse.ArgumentParser(description="Upload files or directories to MinIO.")
         parser.add_argument("--bucket_name", required=True, help="Name of the MinIO bucket.")
         parser.add_argument("--input_dir", required=True, help="Path to the directory to upload.")
+        parser.add_argument("--sync", action="store_true", help="Upload only files changed since the last sync (manifest-based, see minio_sync.py)")
+        parser.add_argument("--delete", action="store_true", help="With --sync, delete objects whose local files were deleted since the last sync")
 
         args = parser.parse_args()
         input_dir = args.input_dir
@@ -140,13 +142,21 @@ if __name__ == "__main__":
         bucket_name="pilot.2.graphab"
         '''
 
-        result = MinioWriter.retry(minio_writer.put_dir, bucket_name, input_dir, ignore_folders='bucket_ext')
-        if result is not None:
-            print(f"Completed case study: {input_dir.split('/')[-1]}")
+        if args.sync: # only new or changed files (object keys are local paths, as in put_dir)
+            from minio_sync import MinioSync
+            minio_sync = MinioSync()
+            for sync_dir in (input_dir, log_dir):
+                result = MinioWriter.retry(minio_sync.sync, bucket_name, ".", scope=sync_dir, direction="push", delete=args.delete, ignore_folders=['bucket_ext'])
+                if result is not None:
+                    print(f"Synchronised: {sync_dir.split('/')[-1]}")
+        else:
+            result = MinioWriter.retry(minio_writer.put_dir, bucket_name, input_dir, ignore_folders='bucket_ext')
+            if result is not None:
+                print(f"Completed case study: {input_dir.split('/')[-1]}")
 
-        result = MinioWriter.retry(minio_writer.put_dir, bucket_name, log_dir, ignore_folders='bucket_ext')
-        if result is not None:
-            print(f"Exported logs: {log_dir.split('/')[-1]}")
+            result = MinioWriter.retry(minio_writer.put_dir, bucket_name, log_dir, ignore_folders='bucket_ext')
+            if result is not None:
+                print(f"Exported logs: {log_dir.split('/')[-1]}")
 
         # TODO - to implement uploads of multiple folders
 
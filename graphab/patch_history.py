@@ -0,0 +1,291 @@
+#!/usr/bin/python
+
+# Per-patch history of Graphab outputs across years, stored in one SQLite database per habitat:
+# data/{case_study}/output/{habitat}/patch_history.sqlite
+# - patches: habitat, scenario, year, patch ID, track ID (the same patch across years), parent track, centroid and area
+# - metrics: local metrics of each patch (long format: habitat, scenario, year, patch ID, metric, value)
+# - matches: overlap (in pixels) between patches of consecutive years, computed from patches.tif
+# Projects are named con_{year}[_{scenario}]: each scenario ('' for the main projects) is a separate series of years.
+# Patches are matched across years by spatial overlap of the patch-ID rasters (window by window), so the
+# trajectory of a patch is one indexed query instead of opening every patches.gpkg.
+#
+# To run on Ubuntu VM:
+# python3 ./patch_history.py {case_study}
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from osgeo import gdal, ogr
+from raster_blocks import iter_windows
+
+ID_FIELD = 'Id' # patch IDs in patches.gpkg (values of patches.tif)
+EXCLUDE_FIELDS = ['Id', 'area', 'perim', 'capacity', 'idhab'] # not local metrics (as in join_gpkg2tif)
+PROJECT_PATTERN = re.compile(r'^con_(\d{4})(?:_(.*))?$') # con_{year}[_{scenario}]
+
+def setup_logging():
+    print("Logs are redirected to /logs")
+    sys.stdout = open('logs/patch_history.log', 'w') #to log
+    sys.stderr = sys.stdout
+
+def find_projects(habitat_dir: str) -> dict:
+    """Returns the year, scenario and paths to patches.tif and patches.gpkg of each project of one habitat,
+    keyed by project name ('con_{year}[_{scenario}]' folders), so projects of the same year do not replace each other."""
+    projects = {}
+    for root, _, files in os.walk(habitat_dir):
+        if "patches.tif" in files and "patches.gpkg" in files:
+            folders = os.path.relpath(root, habitat_dir).split(os.sep)
+            project = next((folder for folder in reversed(folders) if PROJECT_PATTERN.match(folder)), None)
+            if project is None:
+                continue
+            if project in projects:
+                raise ValueError(f"Project {project} found twice in {habitat_dir}")
+            year, scenario = PROJECT_PATTERN.match(project).groups()
+            projects[project] = (int(year), scenario or '', os.path.join(root, "patches.tif"), os.path.join(root, "patches.gpkg"))
+    return dict(sorted(projects.items()))
+
+def load_patches(gpkg_path: str, id_field: str = ID_FIELD) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Reads patch IDs, centroids, areas and local metrics from patches.gpkg.
+
+    Parameters:
+    gpkg_path (str): path to patches.gpkg.
+    id_field (str): field with patch IDs.
+
+    Returns:
+    patches (pd.DataFrame): patch_id, centroid_x, centroid_y, area.
+    metrics (pd.DataFrame): patch_id, metric, value (long format).
+    """
+    gpkg_ds = ogr.Open(gpkg_path)
+    if gpkg_ds is None:
+        raise FileNotFoundError(f"Could not open GeoPackage {gpkg_path}")
+
+    numeric_types = (ogr.OFTInteger, ogr.OFTInteger64, ogr.OFTReal)
+    patches, metrics = [], []
+    for layer_index in range(gpkg_ds.GetLayerCount()):
+        layer = gpkg_ds.GetLayerByIndex(layer_index)
+        layer_defn = layer.GetLayerDefn()
+        fields = [
+            layer_defn.GetFieldDefn(i).GetName() for i in range(layer_defn.GetFieldCount())
+            if layer_defn.GetFieldDefn(i).GetType() in numeric_types and layer_defn.GetFieldDefn(i).GetName() not in EXCLUDE_FIELDS
+        ]
+        for feature in layer:
+            patch_id = feature.GetField(id_field)
+            if patch_id is None:
+                continue
+            geometry = feature.GetGeometryRef()
+            centroid = geometry.Centroid() if geometry is not None else None
+            patches.append({
+                'patch_id': int(patch_id),
+                'centroid_x': centroid.GetX() if centroid is not None else None,
+                'centroid_y': centroid.GetY() if centroid is not None else None,
+                'area': geometry.GetArea() if geometry is not None else None,
+            })
+            metrics.extend({'patch_id': int(patch_id), 'metric': field, 'value': feature.GetField(field)} for field in fields)
+    gpkg_ds = None
+    return pd.DataFrame(patches, columns=['patch_id', 'centroid_x', 'centroid_y', 'area']), pd.DataFrame(metrics, columns=['patch_id', 'metric', 'value'])
+
+def match_patches(tif_from: str, tif_to: str) -> pd.DataFrame:
+    """
+    Computes the overlap (in pixels) between patches of two years from their patch-ID rasters, window by window.
+
+    Parameters:
+    tif_from (str): path to patches.tif of the earlier year.
+    tif_to (str): path to patches.tif of the later year (same grid).
+
+    Returns:
+    matches (pd.DataFrame): patch_from, patch_to, overlap.
+    """
+    ds_from, ds_to = gdal.Open(tif_from, gdal.GA_ReadOnly), gdal.Open(tif_to, gdal.GA_ReadOnly)
+    if ds_from is None or ds_to is None:
+        raise FileNotFoundError(f"Could not open {tif_from} or {tif_to}")
+    if (ds_from.RasterXSize, ds_from.RasterYSize) != (ds_to.RasterXSize, ds_to.RasterYSize):
+        raise ValueError(f"Dimensions of {tif_from} and {tif_to} do not match")
+    band_from, band_to = ds_from.GetRasterBand(1), ds_to.GetRasterBand(1)
+    nodata_from, nodata_to = band_from.GetNoDataValue(), band_to.GetNoDataValue()
+
+    keys, counts = [], []
+    for xoff, yoff, xsize, ysize in iter_windows(band_from):
+        ids_from = band_from.ReadAsArray(xoff, yoff, xsize, ysize).astype(np.int64)
+        ids_to = band_to.ReadAsArray(xoff, yoff, xsize, ysize).astype(np.int64)
+        valid = (ids_from > 0) & (ids_to > 0) # 0 and negative values are not patches
+        if nodata_from is not None:
+            valid &= ids_from != nodata_from
+        if nodata_to is not None:
+            valid &= ids_to != nodata_to
+        if not valid.any():
+            continue
+        # one key per pair of patches, counted in one pass
+        block_keys, block_counts = np.unique((ids_from[valid] << 32) | ids_to[valid], return_counts=True)
+        keys.append(block_keys)
+        counts.append(block_counts)
+    ds_from = ds_to = None
+
+    if not keys:
+        return pd.DataFrame(columns=['patch_from', 'patch_to', 'overlap'])
+    overlaps = pd.DataFrame({'key': np.concatenate(keys), 'overlap': np.concatenate(counts)}).groupby('key', as_index=False)['overlap'].sum()
+    return pd.DataFrame({
+        'patch_from': overlaps['key'].to_numpy() >> 32,
+        'patch_to': overlaps['key'].to_numpy() & 0xFFFFFFFF,
+        'overlap': overlaps['overlap'].to_numpy(),
+    })
+
+def assign_tracks(patch_ids: dict, matches: dict) -> pd.DataFrame:
+    """
+    Assigns track IDs to patches of all years. The track of a patch continues to the successor with the largest
+    overlap (one-to-one, greedy by overlap); other successors (splits) and patches without overlap start new tracks,
+    keeping the track of their largest predecessor as parent.
+
+    Parameters:
+    patch_ids (dict): year -> list of patch IDs.
+    matches (dict): (year_from, year_to) -> overlaps between patches (see match_patches).
+
+    Returns:
+    tracks (pd.DataFrame): year, patch_id, track_id, parent_track.
+    """
+    years = sorted(patch_ids)
+    rows = []
+    next_track = 0
+    previous = {}
+    for i, year in enumerate(years):
+        current = {}
+        parents = {}
+        if i > 0:
+            pair_matches = matches.get((years[i - 1], year))
+            if pair_matches is not None and not pair_matches.empty:
+                used_from = set()
+                for patch_from, patch_to, _ in pair_matches.sort_values('overlap', ascending=False).itertuples(index=False):
+                    if patch_to not in parents and patch_from in previous:
+                        parents[patch_to] = previous[patch_from] # largest predecessor
+                    if patch_from in used_from or patch_to in current or patch_from not in previous:
+                        continue
+                    current[patch_to] = previous[patch_from]
+                    used_from.add(patch_from)
+        for patch_id in patch_ids[year]:
+            if patch_id not in current:
+                current[patch_id] = next_track
+                next_track += 1
+            parent = parents.get(patch_id)
+            rows.append({
+                'year': year, 'patch_id': patch_id, 'track_id': current[patch_id],
+                'parent_track': parent if parent is not None and parent != current[patch_id] else None
+            })
+        previous = current
+    return pd.DataFrame(rows, columns=['year', 'patch_id', 'track_id', 'parent_track'])
+
+def build_history(habitat_dir: str, habitat: str) -> str:
+    """
+    Builds the patch history database of one habitat (rebuilt on every run).
+
+    Parameters:
+    habitat_dir (str): output folder of the habitat (data/{case_study}/output/{habitat}).
+    habitat (str): name of habitat.
+
+    Returns:
+    db_path (str): path to the SQLite database.
+    """
+    projects = find_projects(habitat_dir)
+    if not projects:
+        print(f"No patches.tif and patches.gpkg pairs found in {habitat_dir}")
+        return None
+
+    # one series of years per scenario ('' for the main projects)
+    series = defaultdict(dict)
+    for project, (year, scenario, tif_path, gpkg_path) in projects.items():
+        series[scenario][year] = (tif_path, gpkg_path)
+
+    patches, metrics, matches = [], [], []
+    next_track = 0
+    for scenario, years_paths in sorted(series.items()):
+        label = f"{habitat}{'_' + scenario if scenario else ''}"
+        years_paths = dict(sorted(years_paths.items()))
+        scenario_patches, patch_ids = [], {}
+        for year, (_, gpkg_path) in years_paths.items():
+            year_patches, year_metrics = load_patches(gpkg_path)
+            year_patches.insert(0, 'year', year)
+            year_metrics.insert(0, 'year', year)
+            year_metrics.insert(0, 'scenario', scenario)
+            scenario_patches.append(year_patches)
+            metrics.append(year_metrics)
+            patch_ids[year] = year_patches['patch_id'].tolist()
+            print(f"{label}, {year}: {len(year_patches)} patches, {year_metrics['metric'].nunique()} metrics")
+
+        years = list(years_paths)
+        scenario_matches = {}
+        for year_from, year_to in zip(years[:-1], years[1:]):
+            scenario_matches[(year_from, year_to)] = match_patches(years_paths[year_from][0], years_paths[year_to][0])
+            print(f"{label}, {year_from}-{year_to}: {len(scenario_matches[(year_from, year_to)])} overlapping pairs of patches")
+
+        # track IDs are unique across scenarios
+        tracks = assign_tracks(patch_ids, scenario_matches)
+        tracks['track_id'] += next_track
+        tracks['parent_track'] = pd.to_numeric(tracks['parent_track']) + next_track
+        next_track = int(tracks['track_id'].max()) + 1 if not tracks.empty else next_track
+        scenario_patches = pd.concat(scenario_patches, ignore_index=True).merge(tracks, on=['year', 'patch_id'])
+        scenario_patches.insert(0, 'scenario', scenario)
+        patches.append(scenario_patches)
+        matches.extend(
+            frame.assign(scenario=scenario, year_from=year_from, year_to=year_to) for (year_from, year_to), frame in scenario_matches.items()
+        )
+
+    patches = pd.concat(patches, ignore_index=True)
+    patches.insert(0, 'habitat', habitat)
+    metrics = pd.concat(metrics, ignore_index=True)
+    metrics.insert(0, 'habitat', habitat)
+    matches = pd.concat(matches or [pd.DataFrame()], ignore_index=True)
+    if not matches.empty:
+        matches.insert(0, 'habitat', habitat)
+
+    db_path = os.path.join(habitat_dir, 'patch_history.sqlite')
+    conn = sqlite3.connect(db_path)
+    try:
+        patches.to_sql('patches', conn, if_exists='replace', index=False)
+        metrics.to_sql('metrics', conn, if_exists='replace', index=False)
+        matches.to_sql('matches', conn, if_exists='replace', index=False)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_patches_track ON patches (track_id, year)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_patches_year ON patches (scenario, year, patch_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_metrics_patch ON metrics (scenario, year, patch_id, metric)")
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Patch history of {habitat} written to {db_path} ({patches['track_id'].nunique()} tracks)")
+    return db_path
+
+def trajectory(db_path: str, track_id: int) -> pd.DataFrame:
+    """Returns the trajectory of one patch (track): scenario, year, patch ID, centroid, area and local metrics, in one query."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return pd.read_sql_query(
+            "SELECT p.scenario, p.year, p.patch_id, p.centroid_x, p.centroid_y, p.area, m.metric, m.value "
+            "FROM patches p JOIN metrics m ON m.scenario = p.scenario AND m.year = p.year AND m.patch_id = p.patch_id "
+            "WHERE p.track_id = ? ORDER BY p.year, m.metric",
+            conn, params=(track_id,)
+        )
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-patch history of local metrics across years (SQLite database per habitat)")
+    parser.add_argument(
+        "case_studies",  # positional arg
+        type=lambda s: s.split(","),  # split input by commas
+        help="Comma-separated list of case studies (eg. 'case1,case2,case3')"
+    )
+    args = parser.parse_args()
+
+    for case_study in args.case_studies:
+        base_path = f"data/{case_study}/output"
+        for habitat in sorted(os.listdir(base_path)):
+            habitat_dir = os.path.join(base_path, habitat)
+            if os.path.isdir(habitat_dir):
+                build_history(habitat_dir, habitat)
+        print("Processing complete.")
+        print("*" * 40)
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
@@ -6,7 +6,6 @@ import numpy as np
 import pandas as pd
 import os
 import sys
-import random
 import subprocess
 import argparse
 from datetime import datetime
@@ -16,6 +15,14 @@ import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 from typing import List
 import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from raster_blocks import iter_windows, iter_row_windows, iter_block_windows, tiled_creation_options
+from raster_stats import StreamingStats, get_hist_range
+from stats_ledger import StatsLedger
+from cog_profile import write_cog
+from cache_manifest import ResultsManifest
 os.environ['GDAL_LOG'] = 'DEBUG'
 
 print("Logs are redirected to /logs")
@@ -40,63 +47,79 @@ def get_numpy_dtype(gdal_dtype):
     }
     return dtype_mapping.get(gdal_dtype, np.float32)
 
-def apply_nodata_mask(input_path, lulc_tif, nodata_value, cog):
-    '''Rewriting input tif with nodata values from the LULC GeoTIFF'''
+LULC_MASK_CACHE = {} # packed LULC validity masks, shared by all outputs of the same case study
+
+def get_lulc_valid_mask(lulc_tif: str) -> tuple[np.ndarray, int]:
+    """Returns the validity mask of the LULC GeoTIFF (bit set where LULC is not nodata), packed by rows.
+    The mask is built once (window by window) and cached for all outputs masked with the same LULC file.
+    Returns the packed mask and the width of the LULC raster (in pixels)."""
+    key = (os.path.abspath(lulc_tif), os.path.getmtime(lulc_tif))
+    if key in LULC_MASK_CACHE:
+        return LULC_MASK_CACHE[key]
+
+    lulc_ds = gdal.Open(lulc_tif)
+    if lulc_ds is None:
+        raise FileNotFoundError(f"Could not open LULC file: {lulc_tif}")
+    lulc_band = lulc_ds.GetRasterBand(1)
+    lulc_nodata_value = lulc_band.GetNoDataValue()
+    lulc_x_size = lulc_ds.RasterXSize
+
+    packed = np.empty((lulc_ds.RasterYSize, (lulc_x_size + 7) // 8), dtype=np.uint8)
+    for xoff, yoff, xsize, ysize in iter_row_windows(lulc_band):
+        lulc_data = lulc_band.ReadAsArray(xoff, yoff, xsize, ysize)
+        valid = lulc_data != lulc_nodata_value if lulc_nodata_value is not None else np.ones(lulc_data.shape, dtype=bool)
+        packed[yoff:yoff + ysize] = np.packbits(valid, axis=1)
+    lulc_ds = None
+
+    LULC_MASK_CACHE.clear() # keep only the mask of the current LULC file
+    LULC_MASK_CACHE[key] = (packed, lulc_x_size)
+    print(f"LULC validity mask cached for {lulc_tif}")
+    return LULC_MASK_CACHE[key]
+
+def unpack_mask_window(packed: np.ndarray, xoff: int, yoff: int, xsize: int, ysize: int) -> np.ndarray:
+    """Extracts a window of the packed validity mask as a boolean array."""
+    first_byte = xoff // 8
+    last_byte = (xoff + xsize + 7) // 8
+    bits = np.unpackbits(packed[yoff:yoff + ysize, first_byte:last_byte], axis=1)
+    start = xoff - first_byte * 8
+    return bits[:, start:start + xsize].astype(bool)
+
+def apply_nodata_mask(input_path, lulc_tif, nodata_value):
+    '''Rewriting input tif with nodata values from the LULC GeoTIFF (window by window)'''
     # TODO - do not apply if external dataset
 
-    if cog:
-        input_ds = gdal.OpenEx(input_path, gdal.OF_RASTER)
-    else:
-        input_ds = gdal.Open(input_path, gdal.GA_Update)
-    
+    input_ds = gdal.Open(input_path, gdal.GA_Update)
     if input_ds is None:
         raise FileNotFoundError(f"Could not open raster file: {input_path}")
-    
+
     input_band = input_ds.GetRasterBand(1)
-    input_data = input_band.ReadAsArray()
     input_nodata_value = input_band.GetNoDataValue()
-
     description = input_ds.GetMetadataItem("TIFFTAG_IMAGEDESCRIPTION")
-    #print(f"Metadata for final output: {description}") NOTE:DEBUG
 
-    # DEBUG
-    '''metadata = input_ds.GetMetadata()
-    for key, value in metadata.items():
-        print(f"{key}: {value}")'''
+    lulc_valid, lulc_x_size = get_lulc_valid_mask(lulc_tif)
+    if lulc_valid.shape[0] != input_ds.RasterYSize or lulc_x_size != input_ds.RasterXSize:
+        raise ValueError(f"Dimensions of {input_path} do not match LULC {lulc_tif}")
+
+    masked = 0
+    for xoff, yoff, xsize, ysize in iter_windows(input_band):
+        input_data = input_band.ReadAsArray(xoff, yoff, xsize, ysize)
+        combined_mask = ~unpack_mask_window(lulc_valid, xoff, yoff, xsize, ysize) # combine masks
+        if input_nodata_value is not None:
+            combined_mask |= np.isnan(input_data) if np.isnan(input_nodata_value) else input_data == input_nodata_value
+        if combined_mask.any():
+            input_data[combined_mask] = nodata_value
+            input_band.WriteArray(input_data, xoff, yoff)
+            masked += int(combined_mask.sum())
 
-    lulc_ds = gdal.Open(lulc_tif)
-    lulc_band = lulc_ds.GetRasterBand(1)
-    lulc_data = np.copy(lulc_band.ReadAsArray())
-    lulc_nodata_value = lulc_band.GetNoDataValue()
-    
-    lulc_mask = lulc_data == lulc_nodata_value
-    input_mask = input_data == input_nodata_value
-    
-    height, width = input_data.shape
-    random_pixels = random.sample(range(height * width), 10)
-    '''
-    print(f"input_data and lulc_data are the same object: {input_data is lulc_data}")
-    print(f"input_data and lulc_data identical: {np.array_equal(input_data, lulc_data)}")
-    '''
-    print("Before applying mask (LULC, index value):")
-    for i in random_pixels:
-        row, col = divmod(i, width)
-        print(f"Pixel ({row}, {col}): LULC={lulc_data[row, col]}, index value={input_data[row, col]}")
-    
-    combined_mask = np.logical_or(lulc_mask, input_mask) # combine masks
-    input_data[combined_mask] = nodata_value
-
-    input_band.WriteArray(input_data)
     input_band.SetNoDataValue(nodata_value)
     input_ds.FlushCache()
 
     # copy metadata
     input_ds.SetMetadataItem("TIFFTAG_IMAGEDESCRIPTION", description)
-    
+
     input_ds = None
-    lulc_ds = None
 
-    print(f"Applied NoData mask to {input_path} and saved changes.")
+    print(f"Applied NoData mask to {input_path} ({masked} pixels) and saved changes.")
 
 def translate_tif(input_tif, nodata_value, cog:bool=True):
     output_tif = f"compressed_{os.path.basename(input_tif)}"
@@ -128,19 +151,14 @@ def translate_tif(input_tif, nodata_value, cog:bool=True):
     if cog:
         output_tif_path = f"{os.path.splitext(input_tif)[0]}_cog.tif"
 
-        # Run the `gdal_translate` command with the specified options to create a COG
-        gdal_translate_command = [
-            "gdal_translate", 
-            "-of", "COG",  # Output format: COG
-            "-co", f"COMPRESS={compression}",  
-            "-ot", gdal.GetDataTypeName(dtype),
-            "-mo", f"TIFFTAG_IMAGEDESCRIPTION={description}",
-            input_tif,  # Input file path
-            output_tif_path  # Output COG file path
-        ]
-        
-        # Run the gdal_translate command
-        subprocess.run(gdal_translate_command, check=True)
+        # create a COG in-process with the shared profile (data type and metadata are set through a virtual copy)
+        vrt_ds = gdal.Translate(
+            "", tif_ds, format="VRT", outputType=dtype,
+            metadataOptions=[f"TIFFTAG_IMAGEDESCRIPTION={description}"]
+        )
+        write_cog(vrt_ds, output_tif_path, kind='continuous', COMPRESS=compression)
+        vrt_ds = None
+        tif_ds = None
 
         print(f"Cloud Optimized GeoTIFF created: {output_tif_path}")
         '''
@@ -446,17 +464,12 @@ def extract_metadata_filename(input_file) -> tuple[str, str, float, str]:
     print(f"Extracted metadata are: {case_study,habitat,year,metric}")
     return case_study,habitat,year,metric
 
-def create_stats(case_study:str, input_tif: str, nodata_value, csv_stats: str) -> tuple[dict, str]:
-    ds = gdal.Open(input_tif)
-    band = ds.GetRasterBand(1)
-
+def extract_stats_metadata(case_study: str, input_tif: str, description) -> tuple[str, str, int, str]:
+    """Extracts case study, habitat, metric and year of the output, from the TIFFTAG_IMAGEDESCRIPTION metadata
+    (INDEX:...; TIMESTAMP:...) and Graphab project XML, or from the filename if metadata are not available."""
     habitat=extract_habitat_xml(input_tif) # extract name of habitat from XML
 
-    if nodata_value is not None: # set nodata if provided
-        band.SetNoDataValue(nodata_value)
-    
-    # call metadata
-    description = str(ds.GetMetadataItem("TIFFTAG_IMAGEDESCRIPTION")).strip()
+    description = str(description).strip()
     # check if description is available
     if description is not None and description.strip().lower() != 'none':
         print(f"Metadata to read: {description}")
@@ -477,44 +490,164 @@ def create_stats(case_study:str, input_tif: str, nodata_value, csv_stats: str) -
         print("No description found in metadata. Trying to extract description from the filename...")
         case_study,habitat,year,metric=extract_metadata_filename(input_tif)
 
-    # force computation of statistics: min, max, mean, stddev
-    stats_tuple = band.ComputeStatistics(False)  # approx=False
-    min_val, max_val, mean_val, stddev_val = stats_tuple
+    return case_study, habitat, metric, year
+
+def compute_stats(band, nodata_value, hist_range: tuple) -> dict:
+    """Computes statistics of the band window by window (single pass, exact min/max/mean/stddev,
+    percentiles and histogram over hist_range, see get_hist_range), without writing them to .aux.xml sidecars."""
+    accumulator = StreamingStats(hist_range)
+    for xoff, yoff, xsize, ysize in iter_windows(band):
+        data = band.ReadAsArray(xoff, yoff, xsize, ysize)
+        valid = np.isfinite(data)
+        if nodata_value is not None and not np.isnan(nodata_value):
+            valid &= data != nodata_value
+        accumulator.update(data[valid])
+    return accumulator.result()
+
+def create_stats(case_study:str, input_tif: str, nodata_value) -> dict:
+    """Returns statistics of the output (written to the ledger by the caller)."""
+    ds = gdal.Open(input_tif)
+    band = ds.GetRasterBand(1)
 
-    if np.isnan(mean_val) or np.isinf(stddev_val): # invalid data
-        stats = {
-            'case_study': case_study,
-            'habitat': habitat,
-            'metric': metric,
-            'year': year,
-            'min': None,
-            'max': None,
-            'mean': None,
-            'stddev': None,
-            'path': input_tif
-        }
+    if nodata_value is None: # use nodata of the file if not provided
+        nodata_value = band.GetNoDataValue()
+    
+    # call metadata
+    case_study, habitat, metric, year = extract_stats_metadata(case_study, input_tif, ds.GetMetadataItem("TIFFTAG_IMAGEDESCRIPTION"))
+
+    # computation of statistics: min, max, mean, stddev, percentiles and histogram
+    stats = {
+        'case_study': case_study,
+        'habitat': habitat,
+        'metric': metric,
+        'year': year,
+        **compute_stats(band, nodata_value, get_hist_range(metric)),
+        'path': input_tif
+    }
+
+    ds=None
+    return stats
+
+def process_output(case_study: str, input_tif: str, lulc_tif: str, nodata_value, int_data: bool, size: int = 1) -> list:
+    """
+    Single-pass postprocessing of one output GeoTIFF: clipping, masking with LULC nodata, statistics and COG.
+    The source is read once (window by window, with the clip offset), masked values and statistics are computed
+    on the same windows and written to a tiled temporary GeoTIFF, which is copied to the final COG
+    (COG driver only supports copying a complete dataset) and replaces the input file.
+    Multi-band outputs (one local index per band) are supported: statistics are computed for each band,
+    with the index name from the band metadata (INDEX).
+
+    Parameters:
+    case_study (str): name of case study.
+    input_tif (str): path to the output GeoTIFF to postprocess (rewritten).
+    lulc_tif (str): path to the reference LULC GeoTIFF (dimensions and nodata mask).
+    nodata_value (float): nodata value of the final output.
+    int_data (bool): if True, LULC nodata mask is applied (internal outputs only).
+    size (int): number of pixels to clip from each side if the input is larger than LULC.
+
+    Returns:
+    rows (list): statistics of the output (one row per band), written to the ledger by the caller.
+    """
+    src_ds = gdal.Open(input_tif, gdal.GA_ReadOnly)
+    if src_ds is None:
+        raise ValueError(f"Could not open {input_tif}")
+    band_count = src_ds.RasterCount
+    src_bands = [src_ds.GetRasterBand(i + 1) for i in range(band_count)]
+    description = src_ds.GetMetadataItem("TIFFTAG_IMAGEDESCRIPTION")
+
+    lulc_ds = gdal.Open(lulc_tif, gdal.GA_ReadOnly)
+    if lulc_ds is None:
+        raise ValueError(f"Could not open reference file {lulc_tif}")
+    ref_x_size, ref_y_size = lulc_ds.RasterXSize, lulc_ds.RasterYSize
+    lulc_ds = None
+
+    # clip window (instead of rewriting the clipped file)
+    x_size, y_size = src_ds.RasterXSize, src_ds.RasterYSize
+    if x_size == ref_x_size + 2 * size and y_size == ref_y_size + 2 * size:
+        print(f"Input dimensions ({x_size}x{y_size}) are larger than reference dimensions "
+              f"({ref_x_size}x{ref_y_size}). Clipping {size} pixel(s) from each side.")
+        clip = size
     else:
+        print(f"Input dimensions ({x_size}x{y_size}) are not more than {2*size} pixels larger than "
+              f"reference dimensions ({ref_x_size}x{ref_y_size}). No clipping needed.")
+        clip = 0
+    new_x_size, new_y_size = x_size - 2 * clip, y_size - 2 * clip
+
+    lulc_valid = None
+    if int_data: # do not apply mask for external datasource (Miramon outputs are already clipped)
+        lulc_valid, lulc_x_size = get_lulc_valid_mask(lulc_tif)
+        if lulc_valid.shape[0] != new_y_size or lulc_x_size != new_x_size:
+            raise ValueError(f"Dimensions of {input_tif} do not match LULC {lulc_tif}")
+
+    geo_transform = list(src_ds.GetGeoTransform())
+    geo_transform[0] += clip * geo_transform[1] # x min
+    geo_transform[3] += clip * geo_transform[5] # y max
+
+    dtype = gdal.GDT_Float32 #NOTE: do not use Int64, it might be not supported (and silently fall to Float64 instead)
+    tmp_tif = f"{os.path.splitext(input_tif)[0]}_tmp.tif"
+    cog_tif = f"{os.path.splitext(input_tif)[0]}_cog.tif"
+    tmp_ds = gdal.GetDriverByName('GTiff').Create(tmp_tif, new_x_size, new_y_size, band_count, dtype, options=tiled_creation_options(dtype))
+    if tmp_ds is None:
+        raise RuntimeError(f"Could not create {tmp_tif}")
+    tmp_ds.SetGeoTransform(geo_transform)
+    tmp_ds.SetProjection(src_ds.GetProjection())
+    tmp_bands = [tmp_ds.GetRasterBand(i + 1) for i in range(band_count)]
+
+    case_study, habitat, metric, year = extract_stats_metadata(case_study, input_tif, description)
+    metrics = []
+    for src_band, tmp_band in zip(src_bands, tmp_bands):
+        tmp_band.SetNoDataValue(nodata_value)
+        tmp_band.SetDescription(src_band.GetDescription())
+        if src_band.GetMetadata():
+            tmp_band.SetMetadata(src_band.GetMetadata())
+        metrics.append(src_band.GetMetadataItem("INDEX") or metric) # index of the band (multi-band outputs)
+    # histogram range fixed by metric: the source is not scanned before the pass over windows
+    accumulators = [StreamingStats(get_hist_range(band_metric)) for band_metric in metrics]
+
+    block_x, block_y = src_bands[0].GetBlockSize()
+    for xoff, yoff, xsize, ysize in iter_block_windows(new_x_size, new_y_size, block_x, block_y):
+        lulc_invalid = ~unpack_mask_window(lulc_valid, xoff, yoff, xsize, ysize) if lulc_valid is not None else None
+        for src_band, tmp_band, accumulator in zip(src_bands, tmp_bands, accumulators):
+            src_nodata_value = src_band.GetNoDataValue()
+            data = src_band.ReadAsArray(xoff + clip, yoff + clip, xsize, ysize).astype(np.float32, copy=False)
+            invalid = np.isnan(data)
+            if src_nodata_value is not None and not np.isnan(src_nodata_value):
+                invalid |= data == src_nodata_value
+            if lulc_invalid is not None:
+                invalid |= lulc_invalid
+            data[invalid] = nodata_value
+            accumulator.update(data[~invalid])
+            tmp_band.WriteArray(data, xoff, yoff)
+
+    if description is not None:
+        tmp_ds.SetMetadataItem("TIFFTAG_IMAGEDESCRIPTION", description)
+    tmp_ds.FlushCache()
+    src_ds = None
+
+    # final COG (overviews and layout are built by the COG driver)
+    write_cog(tmp_ds, cog_tif, kind='continuous')
+    tmp_ds = None
+
+    bytes_read = os.path.getsize(input_tif) + os.path.getsize(tmp_tif) # source once, temporary GeoTIFF once (copied to COG)
+    bytes_written = os.path.getsize(tmp_tif) + os.path.getsize(cog_tif)
+    os.replace(cog_tif, input_tif)
+    os.remove(tmp_tif)
+    print(f"Cloud Optimized GeoTIFF created in a single pass: {input_tif} "
+          f"(read {bytes_read / 1e6:.1f} MB, written {bytes_written / 1e6:.1f} MB)")
+
+    rows = []
+    for band_metric, accumulator in zip(metrics, accumulators):
         stats = {
             'case_study': case_study,
             'habitat': habitat,
-            'metric': metric,
+            'metric': band_metric,
             'year': year,
-            'min': min_val,
-            'max': max_val,
-            'mean': mean_val,
-            'stddev': stddev_val,
+            **accumulator.result(),
             'path': input_tif
         }
-
-    ds=None
-
-    df = pd.DataFrame([stats])
-    if os.path.exists(csv_stats):
-        df.to_csv(csv_stats, mode='a', header=False, index=False)
-    else:
-        df.to_csv(csv_stats, mode='w', header=True, index=False)
-    print(f"Stats written to {csv_stats}")
-    return stats, csv_stats
+        rows.append(stats)
+    print("-" *40)
+    return rows
 
 def create_vis(csv: str, case_study: str, habitats: bool) -> str:
     '''Creates plots for the output CSV
@@ -629,11 +762,12 @@ def create_vis(csv: str, case_study: str, habitats: bool) -> str:
 
 # TODO - to create plt.subplot for multiple case studies (if True)
 
-def wrapper(case_study, base_path, lulc_dir, csv_stats, int_data, nodata_value):
+def find_outputs(base_path: str, manifest: ResultsManifest = None) -> list[str]:
+    """Walks through the output folder and returns paths to the GeoTIFFs to postprocess
+    (corridors, ICT and other outputs), skipping excluded folders, outputs already postprocessed and not changed since
+    (if the manifest is given) and internal outputs that are already COG."""
     excluded_dirs = ['ml', 'output']  # folders to skip
-    lulc_tif = next((os.path.join(lulc_dir, f) for f in os.listdir(lulc_dir) if f.endswith('.tif')), None)
-    os.remove(csv_stats) if os.path.exists(csv_stats) else None
-    
+    input_tifs = []
     for root, _, files in os.walk(base_path):  # recursively walk through nested directories
         if any(excluded in os.path.basename(root).lower() for excluded in excluded_dirs):
             print(f"Skipping excluded folder: {root}")
@@ -645,26 +779,195 @@ def wrapper(case_study, base_path, lulc_dir, csv_stats, int_data, nodata_value):
             file_lower = file.lower()
             if ('corridor' in file_lower or 'output' in file_lower or 'ict' in file_lower) and file.endswith('.tif') and not file.startswith('compressed_'):
                 input_tif = os.path.join(root, file)
+
+                # skip outputs postprocessed by previous runs (only size and mtime are checked)
+                if manifest is not None and manifest.is_processed(input_tif):
+                    print(f"Skipping output postprocessed before: {input_tif}")
+                    continue
                 
                 # skip processing if the file is already a COG (only for internal outputs)
                 if is_cog(input_tif) and 'ict' not in file_lower:
                     print(f"Skipping COG file: {input_tif}")
                     print("-" * 40)
                     continue
-                
-                print(f"Processing file: {input_tif}") # NOTE: DEBUG
-                
-                if lulc_tif:
-                    was_clipped = check_and_clip(input_tif, lulc_tif, size=1)
-                    print("File was clipped successfully by {size} pixels." if was_clipped else "No clipping needed.")
-                    if int_data: # if data is fetched from internal datasource. Do not apply mask for external datasource (Miramon outputs are already clipped)
-                        apply_nodata_mask(input_tif, lulc_tif, nodata_value,cog=True)
-                    stats, csv_stats=create_stats(case_study, input_tif, nodata_value, csv_stats)
-                    plot=create_vis(csv_stats, case_study, habitats=True)
-                    translate_tif(input_tif, nodata_value, cog=True)
-                else:
-                    print(f"No LULC TIFF file found in {lulc_dir}. Skipping {input_tif}.")
-                    print("-" * 40)
+
+                input_tifs.append(input_tif)
+    return sorted(input_tifs)
+
+def postprocess_output(case_study: str, input_tif: str, lulc_tif: str, nodata_value, int_data: bool, single_pass: bool) -> list:
+    """Postprocesses one output GeoTIFF (clipping, masking, statistics and COG) and returns its statistics
+    (one row per band), to be stored in the ledger by the caller."""
+    print(f"Processing file: {input_tif}") # NOTE: DEBUG
+
+    ds = gdal.Open(input_tif, gdal.GA_ReadOnly)
+    multi_band = ds is not None and ds.RasterCount > 1
+    ds = None
+
+    if single_pass or multi_band: # clip, mask, stats and COG in one read and one write (multi-band outputs are only supported here)
+        rows=process_output(case_study, input_tif, lulc_tif, nodata_value, int_data)
+    else:
+        was_clipped = check_and_clip(input_tif, lulc_tif, size=1)
+        print("File was clipped successfully by {size} pixels." if was_clipped else "No clipping needed.")
+        if int_data: # if data is fetched from internal datasource. Do not apply mask for external datasource (Miramon outputs are already clipped)
+            apply_nodata_mask(input_tif, lulc_tif, nodata_value)
+        stats=create_stats(case_study, input_tif, nodata_value)
+        translate_tif(input_tif, nodata_value, cog=True)
+        rows = [stats]
+    return rows
+
+def run_postproc_job(job: dict) -> dict:
+    """Postprocesses one output in a worker process, printing to logs/postproc/{output}.log.
+    Errors are caught and returned, so that one corrupted output does not stop the other workers.
+
+    Parameters:
+    job (dict): case study, paths to the output and LULC, nodata value, internal data and single-pass flags, log directory.
+
+    Returns:
+    result (dict): path to the output, statistics (rows by band, None if failed), elapsed time and error (if any).
+    """
+    log_name = os.path.relpath(job['input_tif']).replace(os.sep, '_')
+    log_path = os.path.join(job['log_dir'], f"{os.path.splitext(log_name)[0]}.log")
+    result = {'path': job['input_tif'], 'stats': None, 'seconds': 0.0, 'error': None, 'log': log_path}
+
+    main_stdout = sys.stdout
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        sys.stdout = sys.stderr = log
+        try:
+            result['stats'] = postprocess_output(
+                job['case_study'], job['input_tif'], job['lulc_tif'], job['nodata_value'], job['int_data'], job['single_pass']
+            )
+        except Exception as e:
+            traceback.print_exc()
+            result['error'] = str(e)
+        finally:
+            result['seconds'] = time.perf_counter() - start
+            sys.stdout = sys.stderr = main_stdout
+    return result
+
+def store_stats(rows: list, csv_stats: str) -> set:
+    """
+    Upserts statistics of postprocessed outputs into the ledger ({csv_stats}.sqlite), without exporting the CSV.
+
+    Returns:
+    changed (set): (case_study, metric) groups with new or modified rows.
+    """
+    ledger = StatsLedger(f"{os.path.splitext(csv_stats)[0]}.sqlite")
+    try:
+        return ledger.upsert(rows)
+    finally:
+        ledger.close()
+
+def update_stats(rows: list, csv_stats: str, case_study: str, changed: set = None) -> Optional[str]:
+    """
+    Upserts statistics of the run into the ledger ({csv_stats}.sqlite), exports the CSV once
+    and re-renders the plot only if rows of the case study have changed.
+
+    Parameters:
+    rows (list): statistics of postprocessed outputs.
+    csv_stats (str): path to the CSV with statistics (exported from the ledger).
+    case_study (str): name of case study (plotted).
+    changed (set): (case_study, metric) groups already changed by this run (rows stored with store_stats).
+
+    Returns:
+    plot (str): path to the plot, or None if the plot is up to date.
+    """
+    ledger = StatsLedger(f"{os.path.splitext(csv_stats)[0]}.sqlite")
+    try:
+        changed = set(changed or ()) | ledger.upsert(rows) | ledger.prune()
+        if not changed and os.path.exists(csv_stats):
+            print(f"Statistics in {csv_stats} are up to date")
+            return None
+        ledger.export_csv(csv_stats)
+        has_rows = bool(ledger.rows(case_study))
+    finally:
+        ledger.close()
+
+    changed_metrics = sorted(metric for changed_case_study, metric in changed if changed_case_study == case_study)
+    plot = os.path.splitext(csv_stats)[0] + '_plot.png'
+    if has_rows and (changed_metrics or not os.path.exists(plot)):
+        print(f"Changed metrics: {', '.join(changed_metrics) if changed_metrics else 'none'}. Plotting {csv_stats}")
+        return create_vis(csv_stats, case_study, habitats=True)
+    print(f"Plot {plot} is up to date")
+    return None
+
+def wrapper(case_study, base_path, lulc_dir, csv_stats, int_data, nodata_value, single_pass: bool = False, workers: int = 1, force: bool = False):
+    lulc_tif = next((os.path.join(lulc_dir, f) for f in os.listdir(lulc_dir) if f.endswith('.tif')), None)
+
+    # manifest of outputs already postprocessed ({csv_stats}.manifest.json): only new or changed outputs are processed
+    manifest = ResultsManifest(f"{os.path.splitext(csv_stats)[0]}.manifest.json")
+    if force:
+        manifest.reset()
+        manifest.save() # outputs failing in this run are postprocessed again next time
+    input_tifs = find_outputs(base_path, manifest)
+    if not lulc_tif:
+        for input_tif in input_tifs:
+            print(f"No LULC TIFF file found in {lulc_dir}. Skipping {input_tif}.")
+            print("-" * 40)
+        return
+    print(f"Outputs to postprocess: {len(input_tifs)}")
+
+    if workers <= 1: # sequential: statistics are stored output by output, so a failing output does not lose the others
+        changed, failed = set(), []
+        try:
+            for input_tif in input_tifs:
+                try:
+                    rows = postprocess_output(case_study, input_tif, lulc_tif, nodata_value, int_data, single_pass)
+                except Exception as e:
+                    traceback.print_exc()
+                    print(f"{input_tif}: failed ({e})")
+                    failed.append(input_tif)
+                    continue
+                changed |= store_stats(rows, csv_stats)
+                # marked only once its rows are in the ledger (signature after postprocessing, outputs are rewritten in place)
+                manifest.mark_processed(input_tif)
+                manifest.save()
+            print(f"Outputs completed: {len(input_tifs) - len(failed)}/{len(input_tifs)}")
+        finally:
+            update_stats([], csv_stats, case_study, changed)
+        return
+
+    # parallel: one job per output, statistics are collected from workers
+    log_dir = os.path.join('logs', 'postproc')
+    os.makedirs(log_dir, exist_ok=True)
+    jobs = [
+        {
+            'case_study': case_study,
+            'input_tif': input_tif,
+            'lulc_tif': lulc_tif,
+            'nodata_value': nodata_value,
+            'int_data': int_data,
+            'single_pass': single_pass,
+            'log_dir': log_dir,
+        }
+        for input_tif in input_tifs
+    ]
+    print(f"Scheduled {len(jobs)} outputs on {workers} worker(s)")
+    sys.stdout.flush() # do not duplicate buffered logs in forked workers
+
+    start = time.perf_counter()
+    results = []
+    changed = set()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_postproc_job, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                status = f"failed ({result['error']}, see {result['log']})" if result['error'] else "done"
+                print(f"{result['path']}: {status} in {result['seconds']:.2f} s")
+                if result['error']:
+                    continue
+                # rows are stored before the output is marked as postprocessed
+                changed |= store_stats(sorted(result['stats'], key=lambda stats: str(stats['metric'])), csv_stats)
+                manifest.mark_processed(result['path'])
+                manifest.save()
+    finally:
+        update_stats([], csv_stats, case_study, changed)
+
+    failed = [r for r in results if r['error']]
+    print(f"Outputs completed: {len(results) - len(failed)}/{len(results)} in {time.perf_counter() - start:.2f} s")
+    print("-" * 40)
 
 def main():
     parser = argparse.ArgumentParser(description="Postprocessing outputs (compression, clipping, masking, no data values)")
@@ -680,6 +983,25 @@ def main():
         help="No data value to be applied for output files (default -9999.0)"
     )
 
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="Clip, mask, compute statistics and write COG in a single pass over each output"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to postprocess outputs in parallel (default 1, sequential)"
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Postprocess all outputs again, ignoring the manifest of outputs already postprocessed"
+    )
+
     # parsing the arguments
     args = parser.parse_args()
 
@@ -689,13 +1011,13 @@ def main():
         csv_stats = os.path.join(base_path, 'stats_loc.csv')
 
         # 1. postprocessing of internal outputs
-        wrapper(case_study, base_path, lulc_dir, csv_stats, int_data=True, nodata_value=args.nodata)
+        wrapper(case_study, base_path, lulc_dir, csv_stats, int_data=True, nodata_value=args.nodata, single_pass=args.single_pass, workers=args.workers, force=args.force)
         print("-"*40)
 
         # 2. postprocessing of external outputs (MinIO)
         ext_path = "bucket_ext"
         ext_csv_stats = os.path.join(base_path, 'ext_stats_loc.csv')
-        wrapper(case_study, ext_path, lulc_dir, ext_csv_stats, int_data=False, nodata_value=args.nodata)
+        wrapper(case_study, ext_path, lulc_dir, ext_csv_stats, int_data=False, nodata_value=args.nodata, single_pass=args.single_pass, workers=args.workers, force=args.force)
 
         # NOTE - use code below if ML outputs are harmonised
         """
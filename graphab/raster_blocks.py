@@ -0,0 +1,106 @@
+#!/usr/bin/python
+
+# Helpers to process rasters window by window (aligned with native blocks),
+# so that peak memory is bounded by the block size instead of the raster size.
+
+from osgeo import gdal
+
+TILE_SIZE = 256 # tile size of output GeoTIFFs
+MAX_WINDOW_PIXELS = 4 * 1024 * 1024 # upper bound of pixels read at once (when input is organised by strips)
+
+def tiled_creation_options(gdal_dtype, compression: str = "ZSTD") -> list[str]:
+    """Returns creation options for a tiled and compressed GeoTIFF, written directly (without gdalwarp/gdal_translate).
+
+    Parameters:
+    gdal_dtype (int): GDAL data type of the output raster.
+    compression (str): compression algorithm (ZSTD by default).
+
+    Returns:
+    options (list): creation options for GTiff driver.
+    """
+    is_float = gdal_dtype in (gdal.GDT_Float32, gdal.GDT_Float64)
+    return [
+        "TILED=YES",
+        f"BLOCKXSIZE={TILE_SIZE}",
+        f"BLOCKYSIZE={TILE_SIZE}",
+        f"COMPRESS={compression}",
+        f"PREDICTOR={3 if is_float else 2}", # floating point predictor for Float, horizontal differencing for Int
+        "BIGTIFF=IF_SAFER",
+    ]
+
+def create_tiled_tif(output_path: str, ref_ds, gdal_dtype, nodata_value, band_count: int = 1, compression: str = "ZSTD"):
+    """Creates a tiled and compressed GeoTIFF with the same extent, geotransform and projection as the reference dataset.
+
+    Parameters:
+    output_path (str): path to the output GeoTIFF.
+    ref_ds (gdal.Dataset): reference dataset (for example, LULC).
+    gdal_dtype (int): GDAL data type of the output raster.
+    nodata_value (int|float): nodata value of the output raster.
+    band_count (int): number of bands.
+    compression (str): compression algorithm (ZSTD by default).
+
+    Returns:
+    output_ds (gdal.Dataset): output dataset opened for writing.
+    """
+    driver = gdal.GetDriverByName("GTiff")
+    output_ds = driver.Create(
+        output_path, ref_ds.RasterXSize, ref_ds.RasterYSize, band_count, gdal_dtype,
+        options=tiled_creation_options(gdal_dtype, compression)
+    )
+    if output_ds is None:
+        raise RuntimeError(f"Could not create output GeoTIFF {output_path}")
+
+    output_ds.SetGeoTransform(ref_ds.GetGeoTransform())
+    output_ds.SetProjection(ref_ds.GetProjection())
+    for band_index in range(1, band_count + 1):
+        output_ds.GetRasterBand(band_index).SetNoDataValue(nodata_value)
+    return output_ds
+
+def iter_windows(band, max_pixels: int = MAX_WINDOW_PIXELS):
+    """Yields windows (xoff, yoff, xsize, ysize) aligned with the native blocks of the band.
+
+    Tiled rasters are read tile by tile. Rasters organised by strips are read by groups of strips
+    (full width, up to max_pixels), aligned with output tiles whenever possible.
+
+    Parameters:
+    band (gdal.Band): raster band to iterate over.
+    max_pixels (int): upper bound of pixels in one window (for strips).
+
+    Yields:
+    window (tuple): xoff, yoff, xsize, ysize
+    """
+    block_x, block_y = band.GetBlockSize()
+    yield from iter_block_windows(band.XSize, band.YSize, block_x, block_y, max_pixels)
+
+def iter_block_windows(x_size: int, y_size: int, block_x: int, block_y: int, max_pixels: int = MAX_WINDOW_PIXELS):
+    """Yields windows (xoff, yoff, xsize, ysize) over a raster of x_size * y_size pixels with the given block size
+    (for example, a clipped part of a raster). See iter_windows."""
+    if block_x < x_size: # tiled raster
+        for yoff in range(0, y_size, block_y):
+            ysize = min(block_y, y_size - yoff)
+            for xoff in range(0, x_size, block_x):
+                yield xoff, yoff, min(block_x, x_size - xoff), ysize
+        return
+
+    # strips: group them to limit the number of reads
+    rows = max(block_y, (max_pixels // max(x_size, 1)) // block_y * block_y)
+    if rows >= TILE_SIZE and TILE_SIZE % block_y == 0:
+        rows = rows // TILE_SIZE * TILE_SIZE # align with output tiles
+    for yoff in range(0, y_size, rows):
+        yield 0, yoff, x_size, min(rows, y_size - yoff)
+
+def iter_row_windows(band, max_pixels: int = MAX_WINDOW_PIXELS):
+    """Yields full-width windows (xoff, yoff, xsize, ysize) aligned with the block height of the band.
+
+    Parameters:
+    band (gdal.Band): raster band to iterate over.
+    max_pixels (int): upper bound of pixels in one window (at least one block row is read).
+
+    Yields:
+    window (tuple): xoff, yoff, xsize, ysize
+    """
+    x_size, y_size = band.XSize, band.YSize
+    block_y = band.GetBlockSize()[1]
+    rows = max(block_y, (max_pixels // max(x_size, 1)) // block_y * block_y)
+    for yoff in range(0, y_size, rows):
+        yield 0, yoff, x_size, min(rows, y_size - yoff)
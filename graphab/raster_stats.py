@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+# Statistics of raster values accumulated block by block (single pass over the raster).
+# Percentiles are interpolated from a fine fixed-bin histogram, so accumulators of different blocks,
+# files or workers can be merged exactly (bin edges are the same), and nothing is written to .aux.xml sidecars.
+# Bin edges are fixed by metric, never taken from the data: linear over the expected range of metrics with a known
+# range (ICT, corridors; reported as a 100-bin histogram), otherwise a signed logarithmic scale from 1e-12 to 1e12
+# (local metrics with unbounded values; only percentiles are reported).
+
+import json
+import numpy as np
+
+HIST_BINS = 100 # bins of the histogram reported in the stats table
+HIST_SUBBINS = 1000 # sub-bins of each reported bin used to interpolate percentiles
+PERCENTILES = (5, 25, 50, 75, 95)
+HIST_RANGES = {'ict': (0.0, 2.5), 'corridor': (0.0, 1.0)} # expected range of values by metric (as in plots)
+LOG_RANGE = (1e-12, 1e12) # absolute values covered by the logarithmic scale (smaller values share one bin around 0)
+LOG_BINS = 50000 # fine bins of each sign of the logarithmic scale (relative width about 0.1%)
+
+_log_edges = None
+
+def get_hist_range(metric) -> tuple[float, float] | None:
+    """Returns the expected range of the metric (linear histogram), or None if it is unknown (logarithmic scale)."""
+    metric = str(metric).lower()
+    return next((hist_range for key, hist_range in HIST_RANGES.items() if key in metric), None)
+
+def get_log_edges() -> np.ndarray:
+    """Returns the fine bin edges of the signed logarithmic scale (computed once)."""
+    global _log_edges
+    if _log_edges is None:
+        positive = np.logspace(np.log10(LOG_RANGE[0]), np.log10(LOG_RANGE[1]), LOG_BINS + 1)
+        _log_edges = np.concatenate((-positive[::-1], positive))
+    return _log_edges
+
+class StreamingStats:
+    """Accumulates count, min, max, mean, standard deviation and a fixed-bin histogram of valid values, block by block.
+    Accumulators of different blocks (or files) can be merged if they share the histogram range."""
+
+    def __init__(self, hist_range: tuple = None, bins: int = HIST_BINS) -> None:
+        """
+        Parameters:
+        hist_range (tuple): lower and upper edges of the (linear) histogram, or None for the logarithmic scale.
+        bins (int): number of bins of the reported histogram.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.hist_range = (float(hist_range[0]), float(hist_range[1])) if hist_range is not None else None
+        self.bins = bins
+        if self.hist_range is not None:
+            self.edges = np.linspace(self.hist_range[0], self.hist_range[1], bins * HIST_SUBBINS + 1)
+        else:
+            self.edges = get_log_edges()
+        # fine histogram with underflow (first) and overflow (last) bins
+        self.counts = np.zeros(self.edges.size + 1, dtype=np.int64)
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds valid values of one block (nodata must be removed beforehand)."""
+        if values.size == 0:
+            return
+        values = values.astype(np.float64, copy=False)
+        self.count += values.size
+        self.total += float(values.sum())
+        self.total_sq += float(np.square(values).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        fine_bins = self.edges.size - 1
+        if self.hist_range is not None:
+            low, high = self.hist_range
+            index = np.floor((values - low) * (fine_bins / (high - low)))
+            index = np.clip(index, -1, fine_bins).astype(np.int64) + 1
+        else:
+            index = np.searchsorted(self.edges, values, side='right') # 0: underflow, fine_bins + 1: overflow
+        index[values == self.edges[-1]] = fine_bins # upper edge belongs to the last bin (as in np.histogram)
+        self.counts += np.bincount(index, minlength=self.counts.size)
+
+    def merge(self, other: "StreamingStats") -> None:
+        """Merges another accumulator into this one."""
+        if other.hist_range != self.hist_range or other.counts.size != self.counts.size:
+            raise ValueError("Cannot merge statistics with different histogram bins")
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.counts += other.counts
+
+    def percentile(self, q: float) -> float | None:
+        """Returns the q-th percentile, interpolated linearly within the fine histogram bin, or None if
+        the percentile falls in the underflow or overflow bin (values outside the histogram range)."""
+        if self.count == 0:
+            return None
+        rank = q / 100 * self.count
+        cumulative = np.cumsum(self.counts)
+        i = min(int(np.searchsorted(cumulative, rank, side='left')), self.counts.size - 1)
+        if i == 0 or i == self.counts.size - 1:
+            return None
+        before = cumulative[i] - self.counts[i]
+        fraction = (rank - before) / self.counts[i] if self.counts[i] else 0.0
+        value = self.edges[i - 1] + fraction * (self.edges[i] - self.edges[i - 1])
+        return float(min(max(value, self.min), self.max))
+
+    def histogram(self) -> list:
+        """Returns counts of the reported histogram (bins over hist_range), without under/overflow
+        (empty for the logarithmic scale)."""
+        if self.hist_range is None:
+            return []
+        return self.counts[1:-1].reshape(self.bins, -1).sum(axis=1).tolist()
+
+    def result(self) -> dict:
+        """Returns min, max, mean, (population) standard deviation, percentiles and histogram,
+        or None values if there are no valid values."""
+        stats = {'min': None, 'max': None, 'mean': None, 'stddev': None}
+        stats.update({f"p{q}": None for q in PERCENTILES})
+        stats.update({'count': self.count, 'hist_range': None, 'histogram': None})
+        if self.count == 0:
+            return stats
+
+        mean = self.total / self.count
+        variance = max(self.total_sq / self.count - mean * mean, 0.0)
+        stats.update({'min': self.min, 'max': self.max, 'mean': mean, 'stddev': float(np.sqrt(variance))})
+        stats.update({f"p{q}": self.percentile(q) for q in PERCENTILES})
+        if self.hist_range is None:
+            return stats
+        stats['hist_range'] = f"{self.hist_range[0]},{self.hist_range[1]}"
+        stats['histogram'] = json.dumps([int(self.counts[0])] + self.histogram() + [int(self.counts[-1])]) # under/overflow first and last
+        return stats
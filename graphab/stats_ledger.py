@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+# Ledger of raster statistics (SQLite), keyed by case study, habitat, metric, year and path of the output
+# (outputs of a scenario project con_{year}_{extra} do not replace those of the main project con_{year}).
+# Rows are upserted once per run, the CSV is exported from the ledger and plots are only
+# re-rendered for case studies whose rows have changed.
+
+import json
+import os
+import sqlite3
+import pandas as pd
+
+KEY_COLUMNS = ('case_study', 'habitat', 'metric', 'year', 'path')
+KEY_MATCH = " AND ".join(f"{column}=?" for column in KEY_COLUMNS)
+
+class StatsLedger:
+    """Statistics table stored in SQLite. Each row is identified by (case_study, habitat, metric, year, path);
+    the full row (including statistics and path) is stored as JSON, so new statistics can be added without migrations."""
+
+    def __init__(self, db_path: str, table: str = 'stats') -> None:
+        """
+        Parameters:
+        db_path (str): path to the SQLite database (created if it does not exist).
+        table (str): name of the table.
+        """
+        self.db_path = db_path
+        self.table = table
+        self.conn = sqlite3.connect(db_path)
+        columns = [record[1] for record in self.conn.execute(f"PRAGMA table_info({self.table})")]
+        with self.conn:
+            if columns and 'path' not in columns: # ledger written by older versions (keyed without path)
+                self.conn.execute(f"ALTER TABLE {self.table} RENAME TO {self.table}_old")
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "case_study TEXT NOT NULL, habitat TEXT NOT NULL, metric TEXT NOT NULL, year TEXT NOT NULL, path TEXT NOT NULL, "
+                "row TEXT NOT NULL, PRIMARY KEY (case_study, habitat, metric, year, path))"
+            )
+            if columns and 'path' not in columns:
+                for (payload,) in self.conn.execute(f"SELECT row FROM {self.table}_old").fetchall():
+                    self.conn.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)", (*self.key(json.loads(payload)), payload))
+                self.conn.execute(f"DROP TABLE {self.table}_old")
+
+    @staticmethod
+    def key(row: dict) -> tuple:
+        """Returns the key of a row (missing values are stored as empty strings, paths are normalised)."""
+        key = tuple('' if row.get(column) is None else str(row.get(column)) for column in KEY_COLUMNS)
+        return key[:-1] + (os.path.normpath(key[-1]) if key[-1] else '',)
+
+    def upsert(self, rows: list) -> set:
+        """Inserts or replaces rows in one transaction.
+
+        Parameters:
+        rows (list): rows of statistics (dict with case_study, habitat, metric, year and statistics).
+
+        Returns:
+        changed (set): (case_study, metric) groups with new or modified rows.
+        """
+        changed = set()
+        with self.conn:
+            for row in rows:
+                key = self.key(row)
+                payload = json.dumps(row, default=str)
+                previous = self.conn.execute(
+                    f"SELECT row FROM {self.table} WHERE {KEY_MATCH}", key
+                ).fetchone()
+                if previous is not None and json.loads(previous[0]) == json.loads(payload):
+                    continue
+                self.conn.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)", (*key, payload))
+                changed.add((key[0], key[2]))
+        return changed
+
+    def prune(self, case_study: str = None) -> set:
+        """Deletes rows whose raster no longer exists.
+
+        Returns:
+        changed (set): (case_study, metric) groups with deleted rows.
+        """
+        changed = set()
+        with self.conn:
+            for key, payload in self._select(case_study):
+                path = json.loads(payload).get('path')
+                if path and not os.path.exists(path):
+                    self.conn.execute(f"DELETE FROM {self.table} WHERE {KEY_MATCH}", key)
+                    changed.add((key[0], key[2]))
+        return changed
+
+    def rows(self, case_study: str = None) -> list:
+        """Returns rows of the ledger (optionally, of one case study), sorted by key."""
+        return [json.loads(payload) for _, payload in self._select(case_study)]
+
+    def export_csv(self, csv_path: str, case_study: str = None) -> str:
+        """Writes rows of the ledger to the CSV (overwritten), with the same columns as the stats rows."""
+        df = pd.DataFrame(self.rows(case_study))
+        df.to_csv(csv_path, mode='w', header=True, index=False)
+        print(f"Stats written to {csv_path} ({len(df)} rows)")
+        return csv_path
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _select(self, case_study: str = None) -> list:
+        query = f"SELECT case_study, habitat, metric, year, path, row FROM {self.table}"
+        params = ()
+        if case_study is not None:
+            query += " WHERE case_study=?"
+            params = (case_study,)
+        query += " ORDER BY case_study, habitat, metric, year, path"
+        return [(tuple(record[:5]), record[5]) for record in self.conn.execute(query, params)]
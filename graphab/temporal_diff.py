@@ -0,0 +1,236 @@
+#!/usr/bin/python
+
+# Per-pixel change maps between years (for example, ICT 2022 minus ICT 1987, or year-over-year impedance deltas).
+# Yearly rasters of the same series (same habitat and index, different years) are read window by window:
+# each window of each year is read once and all deltas of the series are written from it, so no more than
+# one window per year is held in memory. Deltas are written as tiled and compressed GeoTIFFs and change
+# magnitude summaries are written to data/{case_study}/change/change_summary.csv.
+#
+# To run on Ubuntu VM:
+# python3 ./temporal_diff.py {case_study}
+# python3 ./temporal_diff.py {case_study} --mode first-last --impedance
+
+import argparse
+import os
+import re
+import sys
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from osgeo import gdal
+from raster_blocks import iter_windows, create_tiled_tif
+from raster_stats import StreamingStats, get_hist_range
+
+NODATA_VALUE = -9999.0 # nodata of delta rasters
+CHANGE_TOLERANCE = 1e-6 # absolute deltas below tolerance are counted as unchanged
+
+def setup_logging():
+    print("Logs are redirected to /logs")
+    sys.stdout = open('logs/temporal_diff.log', 'w') #to log
+    sys.stderr = sys.stdout
+
+def get_years(lulc_dir: str) -> list[str]:
+    """Returns years of LULC files (last block of the filename, for example lulc_cat_aggr_1987.tif)."""
+    years = set()
+    for f in os.listdir(lulc_dir):
+        match = re.search(r'_(\d{4})\.tif$', f)
+        if match:
+            years.add(match.group(1))
+    return sorted(years)
+
+def is_series_file(file: str) -> bool:
+    """Checks if the file is a yearly output to compare (local indices, corridors and ICT, as in postproc)."""
+    file_lower = file.lower()
+    return ('corridor' in file_lower or 'output' in file_lower or 'ict' in file_lower) and file.endswith('.tif') and not file.startswith('compressed_')
+
+def find_series(base_path: str, years: list[str], match=is_series_file) -> dict:
+    """
+    Groups yearly rasters into series: the key of each file is its path with the year replaced by '{year}'.
+
+    Parameters:
+    base_path (str): directory to search recursively.
+    years (list): years of LULC data.
+    match (callable): filter of filenames.
+
+    Returns:
+    series (dict): key -> {year: path}, only for series with at least two years.
+    """
+    series = defaultdict(dict)
+    for root, _, files in os.walk(base_path):
+        for file in files:
+            if not match(file):
+                continue
+            path = os.path.join(root, file)
+            rel_path = os.path.relpath(path, base_path)
+            file_years = [year for year in years if year in rel_path]
+            if len(file_years) != 1:
+                continue # year is unknown or ambiguous
+            year = file_years[0]
+            series[rel_path.replace(year, '{year}')][year] = path
+    return {key: dict(sorted(paths.items())) for key, paths in series.items() if len(paths) > 1}
+
+def get_pairs(years: list[str], mode: str) -> list[tuple[str, str]]:
+    """Returns pairs of years (from, to) to compare: consecutive years or first and last year."""
+    if mode == 'first-last':
+        return [(years[0], years[-1])]
+    return list(zip(years[:-1], years[1:]))
+
+def diff_series(paths: dict, pairs: list, output_paths: dict, metric: str) -> dict:
+    """
+    Writes delta rasters (later year minus earlier year) of one series, window by window.
+
+    Parameters:
+    paths (dict): year -> path to the yearly raster (same dimensions).
+    pairs (list): pairs of years (from, to).
+    output_paths (dict): (from, to) -> path to the delta raster.
+    metric (str): name of the metric (the histogram of deltas is symmetric around 0, as wide as the range of the metric).
+
+    Returns:
+    summaries (dict): (from, to) -> statistics of deltas, number of gains, losses and unchanged pixels, mean absolute change.
+    """
+    datasets = {year: gdal.Open(path, gdal.GA_ReadOnly) for year, path in paths.items()}
+    for year, ds in datasets.items():
+        if ds is None:
+            raise FileNotFoundError(f"Could not open {paths[year]}")
+    years = sorted({year for pair in pairs for year in pair})
+    ref_ds = datasets[years[0]]
+    for year in years:
+        if (datasets[year].RasterXSize, datasets[year].RasterYSize) != (ref_ds.RasterXSize, ref_ds.RasterYSize):
+            raise ValueError(f"Dimensions of {paths[year]} do not match {paths[years[0]]}")
+        if datasets[year].RasterCount > 1:
+            raise ValueError(f"{paths[year]} has {datasets[year].RasterCount} bands (only single-band rasters are compared)")
+    bands = {year: datasets[year].GetRasterBand(1) for year in years}
+    nodata_values = {year: band.GetNoDataValue() for year, band in bands.items()}
+
+    # deltas are bounded by the range of the metric (fixed, so yearly rasters are not scanned beforehand)
+    hist_range = get_hist_range(metric)
+    width = hist_range[1] - hist_range[0] if hist_range is not None else None
+    outputs = {pair: create_tiled_tif(output_paths[pair], ref_ds, gdal.GDT_Float32, NODATA_VALUE) for pair in pairs}
+    accumulators = {pair: StreamingStats((-width, width) if width is not None else None) for pair in pairs}
+    counts = {pair: {'gain': 0, 'loss': 0, 'unchanged': 0, 'abs_total': 0.0} for pair in pairs}
+
+    for xoff, yoff, xsize, ysize in iter_windows(bands[years[0]]):
+        windows = {}
+        for year in years: # each window of each year is read once
+            data = bands[year].ReadAsArray(xoff, yoff, xsize, ysize).astype(np.float32)
+            valid = np.isfinite(data)
+            if nodata_values[year] is not None and not np.isnan(nodata_values[year]):
+                valid &= data != nodata_values[year]
+            windows[year] = (data, valid)
+
+        for pair in pairs:
+            (before, valid_before), (after, valid_after) = windows[pair[0]], windows[pair[1]]
+            valid = valid_before & valid_after
+            delta = np.full(before.shape, NODATA_VALUE, dtype=np.float32)
+            delta[valid] = after[valid] - before[valid]
+            outputs[pair].GetRasterBand(1).WriteArray(delta, xoff, yoff)
+
+            values = delta[valid]
+            accumulators[pair].update(values)
+            counts[pair]['gain'] += int(np.count_nonzero(values > CHANGE_TOLERANCE))
+            counts[pair]['loss'] += int(np.count_nonzero(values < -CHANGE_TOLERANCE))
+            counts[pair]['unchanged'] += int(np.count_nonzero(np.abs(values) <= CHANGE_TOLERANCE))
+            counts[pair]['abs_total'] += float(np.abs(values, dtype=np.float64).sum())
+
+    summaries = {}
+    for pair in pairs:
+        outputs[pair].SetMetadataItem("TIFFTAG_IMAGEDESCRIPTION", f"INDEX:delta; TIMESTAMP:{pair[0]}-{pair[1]}")
+        outputs[pair].FlushCache()
+        outputs[pair] = None
+        stats = accumulators[pair].result()
+        abs_total = counts[pair].pop('abs_total')
+        stats.update(counts[pair])
+        stats['mean_abs'] = abs_total / stats['count'] if stats['count'] else None
+        summaries[pair] = stats
+    datasets = None
+    return summaries
+
+def get_delta_path(change_dir: str, key: str, pair: tuple) -> str:
+    """Returns the path to the delta raster of a series: the path of the series with years replaced by 'from-to'
+    (for example, change/aquatic/con_1987-2022_lulc_..._1987-2022/aquatic/output_f_....tif)."""
+    path = os.path.join(change_dir, key.replace('{year}', f"{pair[0]}-{pair[1]}"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def temporal_diff(case_study: str, mode: str, impedance: bool) -> str:
+    """
+    Creates delta rasters for all series of outputs (and impedance, if required) of the case study.
+
+    Parameters:
+    case_study (str): name of case study.
+    mode (str): 'consecutive' (year-over-year deltas) or 'first-last' (last year minus first year).
+    impedance (bool): if True, impedance datasets are compared as well.
+
+    Returns:
+    csv_summary (str): path to the CSV with change summaries.
+    """
+    base_path = f"data/{case_study}"
+    years = get_years(os.path.join(base_path, 'input', 'lulc'))
+    change_dir = os.path.join(base_path, 'change')
+    print(f"Years of LULC data: {years}")
+
+    series = find_series(os.path.join(base_path, 'output'), years)
+    if impedance:
+        impedance_series = find_series(
+            os.path.join(base_path, 'input'), years,
+            match=lambda f: f.startswith('impedance_') and f.endswith('.tif')
+        )
+        series.update({os.path.join('input', key): paths for key, paths in impedance_series.items()})
+
+    rows = []
+    for key, paths in series.items():
+        series_years = list(paths.keys())
+        pairs = get_pairs(series_years, mode)
+        print(f"Series: {key} ({len(series_years)} years, {len(pairs)} deltas)")
+        habitat = key.split(os.sep)[0] if not key.startswith('input') else key.split(os.sep)[1].replace('_impedance', '')
+        metric = 'impedance' if key.startswith('input') else os.path.basename(key)
+        output_paths = {pair: get_delta_path(change_dir, key, pair) for pair in pairs}
+        try:
+            summaries = diff_series(paths, pairs, output_paths, metric)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Skipping series {key}: {e}")
+            continue
+
+        for pair, stats in summaries.items():
+            rows.append({
+                'case_study': case_study,
+                'habitat': habitat,
+                'series': key,
+                'year_from': pair[0],
+                'year_to': pair[1],
+                **stats,
+                'path': output_paths[pair]
+            })
+            print(f"Delta {pair[0]}-{pair[1]} written to {output_paths[pair]} "
+                  f"(gain: {stats['gain']}, loss: {stats['loss']}, unchanged: {stats['unchanged']})")
+
+    csv_summary = os.path.join(change_dir, 'change_summary.csv')
+    os.makedirs(change_dir, exist_ok=True)
+    pd.DataFrame(rows).to_csv(csv_summary, index=False)
+    print(f"Change summaries written to {csv_summary}")
+    return csv_summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-pixel change maps between years of outputs (and impedance)")
+    parser.add_argument(
+        "case_studies",  # positional arg
+        type=lambda s: s.split(","),  # split input by commas
+        help="Comma-separated list of case studies (eg. 'case1,case2,case3')"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["consecutive", "first-last"],
+        default="consecutive",
+        help="Compare consecutive years (default) or the last year with the first year"
+    )
+    parser.add_argument("--impedance", action="store_true", help="Compare yearly impedance datasets as well")
+    args = parser.parse_args()
+
+    for case_study in args.case_studies:
+        temporal_diff(case_study, args.mode, args.impedance)
+        print("Processing complete.")
+        print("*" * 40)
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+# Tests of MinioReader.download_objects with a fake client (no MinIO server needed):
+# reassembly of ranged parts, skipping identical local copies and handling of failed downloads.
+# The MinIO, urllib3 and dotenv modules are replaced by stand-ins when they are not installed.
+#
+# To run (from the graphab folder):
+# python3 -m pytest tests
+
+import importlib
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import ModuleType, SimpleNamespace
+import pytest
+
+def fake_module(name: str, **attributes) -> None:
+    """Registers a stand-in for an SDK module that is not installed (the tests never reach the real server)."""
+    try:
+        importlib.import_module(name)
+        return
+    except ImportError:
+        pass
+    module = ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+
+class FakeSdkError(Exception):
+    pass
+
+fake_module("minio", Minio=object)
+fake_module("minio.error", S3Error=FakeSdkError, InvalidResponseError=FakeSdkError, ServerError=FakeSdkError)
+fake_module("urllib3", PoolManager=object, Retry=object)
+fake_module("urllib3.exceptions", MaxRetryError=FakeSdkError, LocationParseError=FakeSdkError, NameResolutionError=FakeSdkError)
+fake_module("dotenv", load_dotenv=lambda *args, **kwargs: False)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import minio_reader
+from minio_reader import MinioReader
+
+BUCKET = "bucket"
+
+class FakeResponse:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def stream(self, amt: int):
+        for start in range(0, len(self.data), amt):
+            yield self.data[start:start + amt]
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+class FakeClient:
+    """Serves objects from memory; ranges listed in fail_ranges raise, objects in truncated are cut short."""
+
+    def __init__(self, objects: dict, fail_ranges: set = (), truncated: set = ()):
+        self.objects = objects
+        self.fail_ranges = set(fail_ranges)
+        self.truncated = set(truncated)
+        self.requests = []
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0):
+        self.requests.append((object_name, offset, length))
+        if (object_name, offset) in self.fail_ranges:
+            raise IOError(f"connection reset while reading {object_name} at {offset}")
+        data = self.objects[object_name]
+        data = data[offset:offset + length] if length else data[offset:]
+        if object_name in self.truncated:
+            data = data[:len(data) // 2]
+        return FakeResponse(data)
+
+def make_reader(client: FakeClient) -> MinioReader:
+    reader = MinioReader.__new__(MinioReader) # no connection to the server
+    reader.client = client
+    return reader
+
+def listed(name: str, data: bytes, last_modified: datetime = None):
+    return SimpleNamespace(object_name=name, size=len(data), is_dir=False, last_modified=last_modified)
+
+def part_files(root) -> list:
+    return [os.path.join(folder, f) for folder, _, files in os.walk(root) for f in files if f.endswith(".part")]
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    monkeypatch.setattr(minio_reader, "MULTIPART_THRESHOLD", 100)
+
+def test_ranged_parts_are_reassembled(tmp_path, small_parts):
+    data = os.urandom(1000)
+    client = FakeClient({"cs/output/big.tif": data, "cs/output/small.txt": b"small"})
+    objects = [listed("cs/output/big.tif", data), listed("cs/output/small.txt", b"small")]
+
+    failed = make_reader(client).download_objects(BUCKET, objects, str(tmp_path), verbose=False, workers=4, part_size=64)
+
+    assert failed == []
+    assert (tmp_path / "cs" / "output" / "big.tif").read_bytes() == data
+    assert (tmp_path / "cs" / "output" / "small.txt").read_bytes() == b"small"
+    big_ranges = sorted((offset, length) for name, offset, length in client.requests if name == "cs/output/big.tif")
+    assert big_ranges == [(offset, min(64, 1000 - offset)) for offset in range(0, 1000, 64)]
+    assert ("cs/output/small.txt", 0, 0) in client.requests # small objects in one request
+    assert part_files(tmp_path) == []
+
+def test_identical_local_copy_is_skipped(tmp_path):
+    data = b"0123456789"
+    local_path = tmp_path / "cs" / "input" / "lulc.tif"
+    local_path.parent.mkdir(parents=True)
+    local_path.write_bytes(data)
+    stale_part = tmp_path / "cs" / "input" / "lulc.tif.part" # left by an interrupted run
+    stale_part.write_bytes(b"partial")
+    client = FakeClient({"cs/input/lulc.tif": data})
+    last_modified = datetime.now(timezone.utc) - timedelta(days=1)
+
+    failed = make_reader(client).download_objects(
+        BUCKET, [listed("cs/input/lulc.tif", data, last_modified)], str(tmp_path), skip_existing=True, verbose=False
+    )
+
+    assert failed == []
+    assert client.requests == []
+    assert not stale_part.exists()
+
+def test_changed_local_copy_is_downloaded(tmp_path):
+    data = b"0123456789"
+    local_path = tmp_path / "cs" / "input" / "lulc.tif"
+    local_path.parent.mkdir(parents=True)
+    local_path.write_bytes(b"old")
+    client = FakeClient({"cs/input/lulc.tif": data})
+
+    failed = make_reader(client).download_objects(BUCKET, [listed("cs/input/lulc.tif", data)], str(tmp_path), skip_existing=True, verbose=False)
+
+    assert failed == []
+    assert local_path.read_bytes() == data
+
+def test_failed_objects_are_reported_and_cleaned_up(tmp_path, small_parts):
+    big, short, ok = os.urandom(500), os.urandom(50), b"fine"
+    client = FakeClient(
+        {"cs/big.tif": big, "cs/short.tif": short, "cs/ok.txt": ok},
+        fail_ranges={("cs/big.tif", 128)}, # one range of a large object fails
+        truncated={"cs/short.tif"}, # fewer bytes than the listed size
+    )
+    (tmp_path / "cs").mkdir()
+    (tmp_path / "cs" / "big.tif").write_bytes(b"previous copy")
+    objects = [listed("cs/big.tif", big), listed("cs/short.tif", short), listed("cs/ok.txt", ok)]
+
+    failed = make_reader(client).download_objects(BUCKET, objects, str(tmp_path), verbose=False, workers=3, part_size=64)
+
+    assert failed == ["cs/big.tif", "cs/short.tif"]
+    assert (tmp_path / "cs" / "big.tif").read_bytes() == b"previous copy" # not replaced by a partial download
+    assert not (tmp_path / "cs" / "short.tif").exists()
+    assert (tmp_path / "cs" / "ok.txt").read_bytes() == ok
+    assert part_files(tmp_path) == []
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+
+# Zonal statistics of connectivity outputs (local metrics, corridors) by zones: protected areas, patches,
+# administrative units etc. Zones are rasterised once to a label grid aligned with the outputs (or an existing
+# label raster is used, for example WDPA rasters from PARasterizer or patches.tif), then count/sum/mean/min/max
+# are computed for every zone and every value raster in one pass over the blocks, with np.bincount reductions.
+#
+# To run on Ubuntu VM:
+# python3 ./zonal_stats.py {zones.tif} {output_F.tif},{corridor.tif} --output zonal_stats.csv
+# python3 ./zonal_stats.py {zones.gpkg} {output_F.tif},{corridor.tif} --id-field Id --output zonal_stats.csv
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from osgeo import gdal, ogr
+from raster_blocks import iter_windows, create_tiled_tif
+
+LABEL_NODATA = -1 # nodata of rasterised label grids (pixels outside any zone)
+
+class ZonalAccumulator:
+    """Accumulates count, sum, min and max of values by integer zone label, block by block.
+    Zone labels are mapped to compact indices (sorted array of labels seen so far), so memory depends on the number
+    of zones and not on the largest label (for example, WDPA identifiers); accumulators can be merged."""
+
+    def __init__(self) -> None:
+        self.zones = np.zeros(0, dtype=np.int64) # label of each index (sorted)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.float64)
+        self.min = np.zeros(0, dtype=np.float64)
+        self.max = np.zeros(0, dtype=np.float64)
+
+    def _add(self, zones: np.ndarray, count: np.ndarray, total: np.ndarray, zone_min: np.ndarray, zone_max: np.ndarray) -> None:
+        """Adds statistics of zones (sorted unique labels) to the accumulator, inserting labels not seen before."""
+        new_zones = np.setdiff1d(zones, self.zones, assume_unique=True)
+        if new_zones.size:
+            merged = np.union1d(self.zones, new_zones)
+            index = np.searchsorted(merged, self.zones)
+            arrays = {'count': 0, 'total': 0.0, 'min': np.inf, 'max': -np.inf}
+            for name, fill in arrays.items():
+                grown = np.full(merged.size, fill, dtype=getattr(self, name).dtype)
+                grown[index] = getattr(self, name)
+                setattr(self, name, grown)
+            self.zones = merged
+        index = np.searchsorted(self.zones, zones)
+        self.count[index] += count
+        self.total[index] += total
+        self.min[index] = np.minimum(self.min[index], zone_min)
+        self.max[index] = np.maximum(self.max[index], zone_max)
+
+    def update(self, labels: np.ndarray, values: np.ndarray) -> None:
+        """Adds valid pixels of one block (labels must be integers; invalid pixels removed beforehand)."""
+        if labels.size == 0:
+            return
+        labels = labels.astype(np.int64, copy=False)
+        values = values.astype(np.float64, copy=False)
+
+        # compact indices of the labels of the block, then one reduction per statistic
+        zones, inverse = np.unique(labels, return_inverse=True)
+        inverse = inverse.ravel()
+        count = np.bincount(inverse, minlength=zones.size)
+        total = np.bincount(inverse, weights=values, minlength=zones.size)
+
+        # min/max: sort by index once, then reduce each run of equal indices
+        order = np.argsort(inverse, kind='stable')
+        sorted_values = values[order]
+        starts = np.r_[0, np.cumsum(count)[:-1]]
+        self._add(zones, count, total, np.minimum.reduceat(sorted_values, starts), np.maximum.reduceat(sorted_values, starts))
+
+    def merge(self, other: "ZonalAccumulator") -> None:
+        """Merges another accumulator into this one."""
+        if other.zones.size:
+            self._add(other.zones, other.count, other.total, other.min, other.max)
+
+    def result(self) -> pd.DataFrame:
+        """Returns statistics of zones with at least one valid pixel (zone, count, sum, mean, min, max)."""
+        index = np.flatnonzero(self.count)
+        return pd.DataFrame({
+            'zone': self.zones[index],
+            'count': self.count[index],
+            'sum': self.total[index],
+            'mean': self.total[index] / self.count[index],
+            'min': self.min[index],
+            'max': self.max[index],
+        })
+
+def rasterize_zones(zone_vector: str, ref_tif: str, label_tif: str, id_field: str) -> str:
+    """
+    Rasterises the zone layer once to a label grid with the same extent and resolution as the reference raster.
+
+    Parameters:
+    zone_vector (str): path to the vector file with zones (for example, GeoPackage of protected areas).
+    ref_tif (str): path to the reference raster (one of the value rasters).
+    label_tif (str): path to the output label raster (Int32).
+    id_field (str): integer attribute with zone identifiers (non-negative).
+
+    Returns:
+    label_tif (str): path to the label raster.
+    """
+    vector_ds = ogr.Open(zone_vector)
+    if vector_ds is None:
+        raise FileNotFoundError(f"Could not open zones {zone_vector}")
+    ref_ds = gdal.Open(ref_tif, gdal.GA_ReadOnly)
+    if ref_ds is None:
+        raise FileNotFoundError(f"Could not open reference raster {ref_tif}")
+
+    label_ds = create_tiled_tif(label_tif, ref_ds, gdal.GDT_Int32, LABEL_NODATA)
+    label_ds.GetRasterBand(1).Fill(LABEL_NODATA)
+    for layer_index in range(vector_ds.GetLayerCount()):
+        layer = vector_ds.GetLayerByIndex(layer_index)
+        gdal.RasterizeLayer(label_ds, [1], layer, options=[f"ATTRIBUTE={id_field}"])
+    label_ds.FlushCache()
+    label_ds = None
+    ref_ds = None
+    vector_ds = None
+    print(f"Zones {zone_vector} rasterised to {label_tif}")
+    return label_tif
+
+def zonal_stats(label_tif: str, value_tifs: dict) -> pd.DataFrame:
+    """
+    Computes count, sum, mean, min and max of every value raster for every zone, in one pass over the label grid.
+
+    Parameters:
+    label_tif (str): path to the label raster (integer zone identifiers; nodata and negative labels are ignored).
+    value_tifs (dict): names (reported in the 'raster' column) and paths of value rasters aligned with the label raster.
+    Every band of multi-band rasters (one local index per band) is summarised, as '{name}:{index}' (INDEX metadata of the band).
+
+    Returns:
+    stats (pd.DataFrame): one row per (raster or band, zone) with count, sum, mean, min and max.
+    """
+    label_ds = gdal.Open(label_tif, gdal.GA_ReadOnly)
+    if label_ds is None:
+        raise FileNotFoundError(f"Could not open label raster {label_tif}")
+    label_band = label_ds.GetRasterBand(1)
+    label_nodata = label_band.GetNoDataValue()
+
+    value_bands = {}
+    value_datasets = []
+    for name, path in value_tifs.items():
+        value_ds = gdal.Open(path, gdal.GA_ReadOnly)
+        if value_ds is None:
+            raise FileNotFoundError(f"Could not open value raster {path}")
+        if (value_ds.RasterXSize, value_ds.RasterYSize) != (label_ds.RasterXSize, label_ds.RasterYSize):
+            raise ValueError(f"Dimensions of {path} do not match label raster {label_tif}")
+        value_datasets.append(value_ds)
+        for band_index in range(1, value_ds.RasterCount + 1):
+            band = value_ds.GetRasterBand(band_index)
+            band_name = name
+            if value_ds.RasterCount > 1:
+                band_name = f"{name}:{band.GetMetadataItem('INDEX') or band.GetDescription() or band_index}"
+            value_bands[band_name] = (band, band.GetNoDataValue())
+
+    accumulators = {name: ZonalAccumulator() for name in value_bands}
+    for xoff, yoff, xsize, ysize in iter_windows(label_band):
+        labels = label_band.ReadAsArray(xoff, yoff, xsize, ysize)
+        in_zone = labels >= 0
+        if label_nodata is not None:
+            in_zone &= labels != label_nodata
+        if not in_zone.any():
+            continue
+        for name, (band, nodata_value) in value_bands.items():
+            values = band.ReadAsArray(xoff, yoff, xsize, ysize)
+            valid = in_zone & np.isfinite(values)
+            if nodata_value is not None and not np.isnan(nodata_value):
+                valid &= values != nodata_value
+            accumulators[name].update(labels[valid], values[valid])
+
+    label_ds = None
+    value_datasets = None
+
+    frames = []
+    for name, accumulator in accumulators.items():
+        frame = accumulator.result()
+        frame.insert(0, 'raster', name)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Zonal statistics (count, sum, mean, min, max) of connectivity outputs by zones")
+    parser.add_argument("zones", type=str, help="Label raster with zone identifiers, or vector file with zones (rasterised once)")
+    parser.add_argument(
+        "values",
+        type=lambda s: s.split(","),  # split input by commas
+        help="Comma-separated list of value rasters aligned with zones (eg. 'output_F.tif,corridor.tif')"
+    )
+    parser.add_argument("--id-field", type=str, default="Id", help="Attribute with zone identifiers if zones are vector (default 'Id')")
+    parser.add_argument("--output", type=str, default="zonal_stats.csv", help="Path to the output CSV (default 'zonal_stats.csv')")
+    args = parser.parse_args()
+
+    # keyed by path: outputs of different habitats or years often share the file name (for example, output_F.tif)
+    value_tifs = {os.path.normpath(path): path for path in args.values}
+
+    label_tif = args.zones
+    if not args.zones.lower().endswith('.tif'): # vector zones: rasterise once to the grid of the first value raster
+        label_tif = f"{os.path.splitext(args.zones)[0]}_zones.tif"
+        rasterize_zones(args.zones, args.values[0], label_tif, args.id_field)
+
+    stats = zonal_stats(label_tif, value_tifs)
+    stats.to_csv(args.output, index=False)
+    print(f"Zonal statistics of {len(value_tifs)} raster(s) and {stats['zone'].nunique()} zone(s) written to {args.output}")
+
+if __name__ == "__main__":
+    main()
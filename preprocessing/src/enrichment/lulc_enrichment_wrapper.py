@@ -12,6 +12,7 @@ from typer import prompt
 # local modules
 from utils import load_yaml,extract_attribute_values_from_gpkg,get_lulc_template,read_years_from_config
 from raster_metadata import RasterMetadata
+from cog_profile import write_cog
 from .lulc_data_processor import LULCDataPreprocessor
 from .vector_data_processor import VectorDataPreprocessor
 
@@ -191,11 +192,8 @@ class LULCEnrichmentWrapper():
             # open temp_raster as a GDAL dataset before passing it
             temp_ds = gdal.Open(temp_output_raster, gdal.GA_ReadOnly) 
 
-            cog_driver = gdal.GetDriverByName("COG")
-            cog_driver.CreateCopy(
-                output_raster, temp_ds,
-                options=['COMPRESS=LZW', 'BIGTIFF=IF_SAFER', 'OVERVIEWS=AUTO']
-            )
+            # shared COG profile (categorical: mode resampling of overviews)
+            write_cog(temp_ds, output_raster, kind='categorical')
             
             temp_ds = None
             os.remove(temp_output_raster)
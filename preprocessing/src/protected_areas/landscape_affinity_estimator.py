@@ -1,5 +1,4 @@
 import os
-import subprocess
 import numpy as np
 from osgeo import gdal
 from rich import print
@@ -41,37 +40,34 @@ class LandscapeAffinityEstimator:
                     print(f"Failed to open impedance file: {impedance_file}")
                     continue
 
-                # get raster band
-                band = ds.GetRasterBand(1)
-                # read raster band as a NumPy array
-                data = band.ReadAsArray()
-                # reverse values with condition (if it is 9999
-                # or 0 leave it, otherwise make it reversed)
-                reversed_data = np.where((data == 9999) | (data == 0), data, 1 / data)
-
-                # write reversed data to affinity file
+                # write affinity directly as compressed GeoTIFF (9999 as nodata), no gdal_translate recompression
                 driver = gdal.GetDriverByName("GTiff")
-                out_ds = driver.Create(affinity_path, ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Float32)
-                out_ds.GetRasterBand(1).WriteArray(reversed_data)
-
+                out_ds = driver.Create(affinity_path, ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Float32, options=['COMPRESS=LZW', 'BIGTIFF=IF_SAFER'])
                 # copy georeferencing info
                 out_ds.SetGeoTransform(ds.GetGeoTransform())
                 out_ds.SetProjection(ds.GetProjection())
 
+                band = ds.GetRasterBand(1)
+                out_band = out_ds.GetRasterBand(1)
+                out_band.SetNoDataValue(9999)
+
+                # read and write by groups of native blocks (strips) to keep memory bounded
+                block_rows = band.GetBlockSize()[1]
+                block_rows = max(block_rows, (4 * 1024 * 1024 // ds.RasterXSize) // block_rows * block_rows)
+                for yoff in range(0, ds.RasterYSize, block_rows):
+                    rows = min(block_rows, ds.RasterYSize - yoff)
+                    data = band.ReadAsArray(0, yoff, ds.RasterXSize, rows).astype(np.float32)
+                    # reverse values with condition (if it is 9999
+                    # or 0 leave it, otherwise make it reversed)
+                    keep = (data == 9999) | (data == 0)
+                    reversed_data = np.divide(1, data, out=data.copy(), where=~keep)
+                    out_band.WriteArray(reversed_data, 0, yoff)
+
                 # close files
+                out_band.FlushCache()
                 ds = None
                 out_ds = None
 
-                print(f"Affinity computed for: {impedance_file}")
-
-                # compression
-                compressed_raster_path = os.path.splitext(affinity_path)[0] + '_compr.tif'
-                subprocess.run(['gdal_translate', affinity_path, compressed_raster_path,'-a_nodata', '9999', '-ot', 'Float32', '-co', 'COMPRESS=LZW'])
-            
-                # as soon as gdal_translate doesn't support rewriting, we should delete non-compressed GeoTIFFs...
-                os.remove(affinity_path)
-                # ...and rename COG in the same way as the original GeoTIFF
-                os.rename(compressed_raster_path, affinity_path)
-                print(f"Affinity file is successfully compressed.", end="\n------------------------------------------\n")
+                print(f"Affinity computed for: {impedance_file}", end="\n------------------------------------------\n")
 
         print("[green] All LULC affinities have been successfully computed. [green]")
\ No newline at end of file
@@ -6,6 +6,9 @@ import os
 import subprocess
 import pandas as pd
 
+# local modules
+from lut_reclass import ReclassLUT
+
 class UpdateLandImpedance():
     """
     This class is responsible for updating the impedance dataset based on the reclassification table or the multiplier effect of protected areas.
@@ -288,8 +291,8 @@ class UpdateLandImpedance():
         elif reclass_dict is None:
             print("Reclassification dictionary is empty.")
             return
-        # apply reclassification using dictionary mapping
-        output_data = np.vectorize(reclass_dict.get)(input_data)
+        # apply reclassification using a dense lookup table compiled from the dictionary (9999 as nodata)
+        output_data = ReclassLUT.from_dict(reclass_dict, 9999, np.float32 if has_decimal else np.int32).apply(input_data)
         output_band.WriteArray(output_data)
         # flush the cache to save the output raster
         output_band.FlushCache()
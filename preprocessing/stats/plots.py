@@ -2,28 +2,31 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import glob
+from glob_store import GlobStore, parse_metric_name, read_metric_file
 
-# Collect all .txt files from the specified directory
-txt_files = glob.glob("*.txt")
+# Ingest all .txt files with d-sequences ({metric}_{year}[_enriched].txt) from the specified directory into the store
+txt_files = [file for file in glob.glob("*.txt") if parse_metric_name(file) is not None]
+store = GlobStore("stats_glob.sqlite")
+if txt_files:
+    store.replace(pd.concat([read_metric_file(file, case_study='', habitat='') for file in txt_files], ignore_index=True))
+
+# Read PC and EC from the store (sorted by distance)
+data = store.query(columns=['metric', 'year', 'scenario', 'd', 'metric_val'], metric=['PC', 'EC'])
+store.close()
+
+def get_label(metric, year, scenario):
+    # label as the name of the source file
+    return f"{metric}_{year}_{scenario}" if scenario else f"{metric}_{year}"
 
 # Initialize a figure with two subplots for PC and EC
 fig, (ax_pc, ax_ec) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
 
-# Loop over each file and plot the data on the appropriate subplot
-for file in txt_files:
-    # Read the data from each file into a pandas DataFrame
-    data = pd.read_csv(file, delimiter='\t')  # Adjust delimiter if necessary
-    
-    # Extract the filename without the path and extension
-    label = file.split('/')[-1].replace('.txt', '')
-    
-    # Check for 'PC' or 'EC' column and plot on the respective subplot
-    if 'PC' in data.columns:
-        ax_pc.plot(data['d'], data['PC'], label=label)
-        ax_pc.scatter(data['d'], data['PC'], s=30)
-    if 'EC' in data.columns:
-        ax_ec.plot(data['d'], data['EC'], label=label)
-        ax_ec.scatter(data['d'], data['EC'], s=30)
+# Plot each d-sequence on the subplot of its metric
+axes = {'PC': ax_pc, 'EC': ax_ec}
+for (metric, year, scenario), sequence in data.groupby(['metric', 'year', 'scenario']):
+    label = get_label(metric, year, scenario)
+    axes[metric].plot(sequence['d'], sequence['metric_val'], label=label)
+    axes[metric].scatter(sequence['d'], sequence['metric_val'], s=30)
 
 # Add labels and legend for PC and EC subplots
 ax_pc.set_xlabel('Maximum distance')
@@ -40,30 +43,16 @@ plt.show()
 # Now, calculate relative difference and plot it
 fig, (ax_rel_pc, ax_rel_ec) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
 
-# Loop again for relative difference calculations
-for file in txt_files:
-    # Process only enriched files and find the corresponding non-enriched file
-    if '_enriched' in file:
-        # Load enriched data
-        enriched_data = pd.read_csv(file, delimiter='\t')
-        
-        # Construct the non-enriched filename and check if it exists
-        non_enriched_file = file.replace('_enriched', '')
-        if non_enriched_file in txt_files:
-            # Load non-enriched data
-            non_enriched_data = pd.read_csv(non_enriched_file, delimiter='\t')
-            
-            # Calculate relative difference for PC if both files have 'PC' column
-            if 'PC' in enriched_data.columns and 'PC' in non_enriched_data.columns:
-                relative_diff_pc = ((enriched_data['PC'] - non_enriched_data['PC']) / non_enriched_data['PC']) * 100
-                ax_rel_pc.plot(enriched_data['d'], relative_diff_pc, label=file.replace('.txt', ' (PC)'))
-                ax_rel_pc.scatter(enriched_data['d'], relative_diff_pc, s=30)
-            
-            # Calculate relative difference for EC if both files have 'EC' column
-            if 'EC' in enriched_data.columns and 'EC' in non_enriched_data.columns:
-                relative_diff_ec = ((enriched_data['EC'] - non_enriched_data['EC']) / non_enriched_data['EC']) * 100
-                ax_rel_ec.plot(enriched_data['d'], relative_diff_ec, label=file.replace('.txt', ' (EC)'))
-                ax_rel_ec.scatter(enriched_data['d'], relative_diff_ec, s=30)
+# Relative difference of enriched sequences to the corresponding non-enriched ones (matched by metric, year and distance)
+original = data[data['scenario'] == ''].drop(columns='scenario')
+enriched = data[data['scenario'] == 'enriched'].drop(columns='scenario')
+pairs = enriched.merge(original, on=['metric', 'year', 'd'], suffixes=('_enriched', ''))
+pairs['relative_diff'] = (pairs['metric_val_enriched'] - pairs['metric_val']) / pairs['metric_val'] * 100
+rel_axes = {'PC': ax_rel_pc, 'EC': ax_rel_ec}
+for (metric, year), sequence in pairs.groupby(['metric', 'year']):
+    label = f"{get_label(metric, year, 'enriched')} ({metric})"
+    rel_axes[metric].plot(sequence['d'], sequence['relative_diff'], label=label)
+    rel_axes[metric].scatter(sequence['d'], sequence['relative_diff'], s=30)
 
 # Add labels and legends for relative difference plots
 ax_rel_pc.set_xlabel('Maximum distance')